@@ -0,0 +1,124 @@
+from pathlib import PurePosixPath
+from typing import Any, Dict, List
+from urllib.parse import quote
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from kedro.io import AbstractDataset
+from kedro.io.core import get_filepath_str, get_protocol_and_path
+
+
+class IndicesParquetDataset(AbstractDataset[pd.DataFrame, Dict[str, pd.DataFrame]]):
+    """``IndicesParquetDataset`` saves acoustic indices as a Parquet dataset partitioned
+    by deployment (and optionally by date), and loads them back as a single table.
+
+    Index columns are stored as float32 and the pamDP `timestamp` strings as a UTC
+    datetime column. Partitions are folders such as `deploymentID=S01/date=2023-05-01`,
+    so a load can read only some columns and some partitions. Saving a deployment
+    replaces its whole `deploymentID=` folder, so dates it no longer has are removed.
+
+    Example:
+    ::
+
+        >>> IndicesParquetDataset(
+        ...     path='data/output/acoustic_indices_parquet',
+        ...     load_args={'columns': ['ACI', 'timestamp'], 'filters': [('deploymentID', '=', 'S01')]},
+        ... ).load()
+    """
+
+    def __init__(
+        self,
+        path: str,
+        partition_cols: List[str] | None = None,
+        load_args: Dict[str, Any] | None = None,
+    ):
+        """Creates a new instance of IndicesParquetDataset.
+
+        Args:
+            path: Folder of the Parquet dataset.
+            partition_cols: Columns used to partition the files: `deploymentID`, then
+                optionally `date` (the local date of the timestamp). Defaults to
+                `deploymentID`.
+            load_args: Arguments passed to `pyarrow.parquet.read_table`, e.g. `columns`
+                and `filters` to read only some columns and partitions.
+        """
+        protocol, path = get_protocol_and_path(path)
+        self._protocol = protocol
+        self._path = PurePosixPath(os.path.normpath(path))
+        self._partition_cols = list(partition_cols or ["deploymentID"])
+        if self._partition_cols not in (["deploymentID"], ["deploymentID", "date"]):
+            raise ValueError(
+                "partition_cols must be [deploymentID] or [deploymentID, date], "
+                f"not {self._partition_cols}."
+            )
+        self._load_args = dict(load_args or {})
+
+    def _load(self) -> pd.DataFrame:
+        """Loads the selected columns and partitions as a single DataFrame."""
+        load_path = get_filepath_str(self._path, self._protocol)
+        table = pq.read_table(load_path, partitioning="hive", **self._load_args)
+        return table.to_pandas()
+
+    @staticmethod
+    def to_table(data: pd.DataFrame) -> pd.DataFrame:
+        """Converts acoustic indices to compact column types.
+
+        Index columns become float32, `timestamp` becomes a UTC datetime and the
+        `date` partition column is taken from the local date of the timestamp.
+        """
+        data = data.copy()
+        if "timestamp" in data.columns:
+            data["date"] = data["timestamp"].str[:10]
+            data["timestamp"] = pd.to_datetime(data["timestamp"], format="ISO8601", utc=True)
+        for column in data.columns:
+            if data[column].dtype == np.float64:
+                data[column] = data[column].astype(np.float32)
+        return data
+
+    def _save(self, data: Dict[str, pd.DataFrame] | pd.DataFrame) -> None:
+        """Writes acoustic indices, replacing the deployments they belong to.
+
+        Args:
+            data: A DataFrame, or a dictionary of DataFrames as yielded by the
+                acoustic indices node (one per deployment). Values may also be
+                callables returning a DataFrame.
+        """
+        save_path = get_filepath_str(self._path, self._protocol)
+        os.makedirs(save_path, exist_ok=True)
+
+        if isinstance(data, pd.DataFrame):
+            data = {None: data}
+        for partition in data.values():
+            if callable(partition):
+                partition = partition()
+            partition = self.to_table(partition)
+            missing = set(self._partition_cols) - set(partition.columns)
+            if missing:
+                raise ValueError(f"Missing partition columns {missing} in acoustic indices.")
+            if "date" not in self._partition_cols:
+                partition = partition.drop(columns="date", errors="ignore")
+            # Old dates of the deployment would be kept by a partition-wise overwrite
+            for deployment in pd.unique(partition["deploymentID"]):
+                shutil.rmtree(
+                    os.path.join(save_path, f"deploymentID={quote(str(deployment), safe='')}"),
+                    ignore_errors=True,
+                )
+            pq.write_to_dataset(
+                pa.Table.from_pandas(partition, preserve_index=False),
+                root_path=save_path,
+                partition_cols=self._partition_cols,
+                existing_data_behavior="overwrite_or_ignore",
+            )
+
+    def _describe(self) -> Dict[str, Any]:
+        """Returns a dict that describes the attributes of the dataset."""
+        return dict(
+            path=self._path,
+            protocol=self._protocol,
+            partition_cols=self._partition_cols,
+            load_args=self._load_args,
+        )
@@ -14,6 +14,7 @@ from pamflow.pipelines.acoustic_indices import pipeline as acoustic_indices
 from pamflow.pipelines.species_detection import pipeline as species_detection
 from pamflow.pipelines.data_science import pipeline as data_science
 from pamflow.pipelines.export import pipeline as export
+from pamflow.pipelines.analyze import pipeline as analyze
 
 
 def register_pipelines() -> Dict[str, Pipeline]:
@@ -29,6 +30,7 @@ def register_pipelines() -> Dict[str, Pipeline]:
     species_detection_pipeline = species_detection.create_pipeline()
     data_science_pipeline = data_science.create_pipeline()
     export_pipeline = export.create_pipeline()
+    analyze_pipeline = analyze.create_pipeline()
 
     pamflow_pipeline = (
         data_preparation_pipeline
@@ -38,6 +40,14 @@ def register_pipelines() -> Dict[str, Pipeline]:
         +quality_control_pipeline
     )  # no incluir data_science
 
+    # Indices, soundscapes and detections computed from a single read of each file
+    fused_pipeline = (
+        data_preparation_pipeline
+        + analyze_pipeline
+        + (species_detection_pipeline - species_detection_pipeline.only_nodes("species_detection_node"))
+        + quality_control_pipeline
+    )
+
     return {
         "__default__": pamflow_pipeline,
         "pamflow": pamflow_pipeline
@@ -49,4 +59,5 @@ def register_pipelines() -> Dict[str, Pipeline]:
         "species_detection": species_detection_pipeline,
         "data_science": data_science_pipeline,
         "export": export_pipeline,
+        "analyze": fused_pipeline,
     }
@@ -7,7 +7,14 @@ Utilitary functions to manage, check and preprocess large sampling data assiciat
 
 import time
 import logging
-from pamflow.pipelines.acoustic_indices.utils import compute_indices_parallel
+import pandas as pd
+from pamflow.pipelines.acoustic_indices.utils import (
+    IndicesCache,
+    add_timestamps,
+    compute_indices_parallel_by_group,
+    log_profile_summary,
+    profile_table,
+)
 logger = logging.getLogger(__name__)
 
 def compute_indices(media, acoustic_indices_parameters):
@@ -29,23 +36,68 @@ def compute_indices(media, acoustic_indices_parameters):
         `target_fs`, `filter_type`, `filter_cut`, `filter_order`, and `n_jobs`. Passed
         as `params:acoustic_indices_parameters`.
 
-    Returns
-    -------
-    pandas.DataFrame
-        A DataFrame containing the computed acoustic indices. Stored in the catalog
-        as `acoustic_indices@pandas`.
+    Yields
+    ------
+    tuple
+        - dict: A DataFrame containing the computed acoustic indices of a deployment,
+          with the `mediaID`, `deploymentID` and `timestamp` of each row. Stored in
+          the catalog as `acoustic_indices@PartitionedDataset`. Empty if no file
+          of the deployment could be processed.
+        - dict: If `execution.profile` is True, the seconds spent on each stage for
+          each computed file of the deployment (see `profile_table`), stored as
+          `acoustic_indices_profile@PartitionedDataset`. Empty otherwise.
     """
     params_preprocess = acoustic_indices_parameters["preprocess"]
     params_indices = acoustic_indices_parameters["indices_settings"]
     n_jobs = acoustic_indices_parameters["execution"]["n_jobs"]
+    max_in_flight = acoustic_indices_parameters["execution"].get("max_in_flight")
+    files_per_task = acoustic_indices_parameters["execution"].get("files_per_task")
+    cache_path = acoustic_indices_parameters["execution"].get("cache_path")
+    profile = [] if acoustic_indices_parameters["execution"].get("profile") else None
     media = media[media["fileLength"] > 0]
     
     groups = media["deploymentID"].nunique()
     logger.info(f"Computing acoustic indices for {groups} ({media.shape[0]} files)")
 
-    for deployment, media_gp in media.groupby('deploymentID'):
-        logger.info(f"Computing acoustic indices for {deployment} ({media_gp.shape[0]} files)")
-        acoustic_indices = compute_indices_parallel(
-            media_gp, params_preprocess, params_indices, n_jobs)
-    
-        yield {f'indices_{deployment}': acoustic_indices}
+    # Files already computed with the same parameters are read from the cache
+    cache = None
+    if cache_path is not None:
+        cache = IndicesCache(cache_path, params_preprocess, params_indices)
+
+    # A single process pool runs the files of every deployment
+    profiles = []
+    try:
+        for deployment, acoustic_indices in compute_indices_parallel_by_group(
+            media,
+            params_preprocess,
+            params_indices,
+            "deploymentID",
+            n_jobs,
+            max_in_flight,
+            files_per_task,
+            cache,
+            profile,
+        ):
+            if acoustic_indices.empty:
+                logger.error(f"No file of {deployment} could be processed.")
+                yield {}, {}
+                continue
+            acoustic_indices["deploymentID"] = deployment
+            acoustic_indices = add_timestamps(acoustic_indices, media)
+            logger.info(
+                f"Computed acoustic indices for {deployment} ({acoustic_indices.shape[0]} rows)"
+            )
+            deployment_profile = {}
+            if profile is not None:
+                df_profile = profile_table(
+                    [row for row in profile if row["group"] == deployment], media
+                )
+                profiles.append(df_profile)
+                deployment_profile = {f'profile_{deployment}': df_profile}
+            yield {f'indices_{deployment}': acoustic_indices}, deployment_profile
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if profiles:
+        log_profile_summary(pd.concat(profiles, ignore_index=True))
@@ -8,7 +8,10 @@ def create_pipeline(**kwargs):
             node(  # Log
                 func=compute_indices,
                 inputs=["media@pamDP", "params:acoustic_indices"],
-                outputs="acoustic_indices@PartitionedDataset",
+                outputs=[
+                    "acoustic_indices@PartitionedDataset",
+                    "acoustic_indices_profile@PartitionedDataset",
+                ],
                 name="compute_indices_node",
             )
         ]
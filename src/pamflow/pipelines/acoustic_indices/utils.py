@@ -7,10 +7,27 @@ acoustic indices, and parallel processing capabilities.
 """
 
 import os
+import sys
+import json
+import time
+import itertools
+import functools
 import concurrent.futures
+import numpy as np
 import pandas as pd
 import logging
+from scipy import signal
 from maad import sound, features, util
+from pamflow.utils import (
+    FileResultsStore,
+    as_completed_bounded,
+    load_audio,
+    open_signal_store,
+    open_wav,
+    precision_dtype,
+    read_wav_segment,
+    resample,
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -36,6 +53,14 @@ class AcousticIndices:
     params : dict
         Parameters for computing acoustic indices. The keys are the names of the
         indices to be computed, and the values are the corresponding parameters.
+        A list of parameter dictionaries computes one variant of the index per
+        dictionary, see `expand_variants`.
+    precomputed : dict, optional
+        Values of indices or intermediate results that are already known. They
+        are used instead of being computed.
+    timings : dict
+        Seconds spent on each index and intermediate result, filled by
+        `compute_selected_indices`.
     Methods
     -------
     compute_ACI(params)
@@ -60,26 +85,94 @@ class AcousticIndices:
         Compute Spectral Cover (SC).
     compute_selected_indices()
         Compute only selected indices based on parameters.
+    expand_variants(params)
+        Split indices with a list of parameter variants into one entry per variant.
     _convert_lists_to_tuples(data)
         Recursively convert all lists in a dictionary to tuples.
     """
-    def __init__(self, s, Sxx, tn, fn, params):
+    # Dependency graph of the indices and of the intermediate results they share.
+    # Each node is computed at most once per file and cached.
+    dependencies = {
+        "ACI": [],
+        "ADI": [],
+        "BI": [],
+        "Hf": ["mean_power_spectrum"],
+        "Ht": ["envelope"],
+        "H": ["Hf", "Ht"],
+        "NDSI": ["Sxx_power"],
+        "NP": ["Sxx_power"],
+        "RMS": [],
+        "SC": ["Sxx_dB"],
+        "Sxx_power": [],
+        "Sxx_dB": [],
+        "mean_power_spectrum": ["Sxx_power"],
+        "envelope": [],
+    }
+
+    def __init__(self, s, Sxx, tn, fn, params, precomputed=None):
         self.s = s
         self.Sxx = Sxx
         self.tn = tn
         self.fn = fn
         self.params = self._convert_lists_to_tuples(params)
+        # Variants of an index share its intermediate results (e.g. Sxx_power for NP)
+        self._variants = {}
+        if isinstance(self.params, dict):
+            self.params, self._variants = self.expand_variants(self.params)
+        # Nodes already known (e.g. computed in batch) are not computed again
+        self._cache = dict(precomputed or {})
+        # Seconds spent computing each node of the graph (excluding dependencies)
+        self.timings = {}
+
+    def _get(self, name):
+        """Return a node of the dependency graph, computing it and its dependencies once."""
+        if name not in self._cache:
+            index = self._variants.get(name, name)
+            for dependency in self.dependencies.get(index, []):
+                self._get(dependency)
+            start = time.perf_counter()
+            if hasattr(self, f"_compute_{name}"):
+                self._cache[name] = getattr(self, f"_compute_{name}")()
+            else:
+                params = self.params.get(name) if isinstance(self.params, dict) else None
+                self._cache[name] = getattr(self, f"compute_{index}")(params or {})
+            self.timings[name] = time.perf_counter() - start
+        return self._cache[name]
+
+    # Intermediate results
+    def _compute_Sxx_power(self):
+        """Power spectrogram."""
+        return self.Sxx**2
+
+    def _compute_Sxx_dB(self):
+        """Amplitude spectrogram in dB."""
+        return util.amplitude2dB(self.Sxx)
+
+    def _compute_mean_power_spectrum(self):
+        """Power spectrum averaged over time (accumulated in float64)."""
+        return np.mean(self._get("Sxx_power"), axis=1, dtype=np.float64)
 
-        # Convert spectrogram scales once to avoid redundancy
-        self.Sxx_power = Sxx**2
-        self.Sxx_dB = util.amplitude2dB(Sxx)
+    def _compute_envelope(self):
+        """Amplitude envelope of the signal, as in maad.features.temporal_entropy."""
+        # The envelope is short, float64 keeps its entropy accurate for float32 signals
+        return sound.envelope(self.s, mode="fast", Nt=512).astype(np.float64, copy=False)
 
+    @property
+    def Sxx_power(self):
+        return self._get("Sxx_power")
+
+    @property
+    def Sxx_dB(self):
+        return self._get("Sxx_dB")
+
+    # Indices
     def compute_ACI(self, params):
         """Compute Acoustic Complexity Index (ACI)."""
         return features.acoustic_complexity_index(self.Sxx)[2]
 
     def compute_ADI(self, params):
-        """Compute Acoustic Complexity Index (ACI)."""
+        """Compute Acoustic Diversity Index (ADI)."""
+        # maad normalizes the spectrogram by its maximum
         return features.acoustic_diversity_index(self.Sxx, self.fn, **params)
 
     def compute_BI(self, params):
@@ -88,25 +181,24 @@ class AcousticIndices:
     
     def compute_Hf(self, params):
         """Compute Frequency Entropy (Hf)."""
-        return features.frequency_entropy(self.Sxx_power)[0]
+        # A 1d spectrum skips the entropy per frequency bin, which is not used
+        return features.frequency_entropy(self._get("mean_power_spectrum"))[0]
     
     def compute_Ht(self, params):
         """Compute Temporal Entropy (Ht)."""
-        return features.temporal_entropy(self.s)
+        return util.entropy(self._get("envelope") ** 2)
     
     def compute_H(self, params):
         """Compute Acoustic Entropy (H)."""
-        Hf = features.frequency_entropy(self.Sxx_power)[0]
-        Ht = features.temporal_entropy(self.s)
-        return Hf * Ht
+        return self._get("Hf") * self._get("Ht")
 
     def compute_NDSI(self, params):
         """Compute Normalized Difference Soundscape Index (NDSI)."""
-        return features.soundscape_index(self.Sxx_power, self.fn, **params)[0]
+        return features.soundscape_index(self._get("Sxx_power"), self.fn, **params)[0]
     
     def compute_NP(self, params):
         """Compute Number of Peaks (NP)."""
-        return features.number_of_peaks(self.Sxx_power, self.fn, **params)
+        return features.number_of_peaks(self._get("Sxx_power"), self.fn, **params)
 
     def compute_RMS(self, params):
         """Compute Root Mean Square (RMS)."""
@@ -114,44 +206,124 @@ class AcousticIndices:
     
     def compute_SC(self, params):
         """Compute Spectral Cover (SC)."""
-        return features.spectral_cover(self.Sxx_dB, self.fn, **params)[0]
+        return features.spectral_cover(self._get("Sxx_dB"), self.fn, **params)[0]
 
-    def _convert_lists_to_tuples(self, data):
+    @staticmethod
+    def expand_variants(params):
+        """
+        Split the indices declared with a list of parameter variants.
+        Each variant of an index is computed as a separate index, named after the
+        index and the `suffix` of the variant (its position in the list, from 1,
+        if not given), e.g. `ADI_1` or `ADI_quiet`.
+        Parameters
+        ----------
+        params : dict
+            Parameters of the indices, with lists (or tuples) of dictionaries for
+            the indices with variants.
+        Returns
+        -------
+        params : dict
+            Parameters of each index and variant, in the order of `params`.
+        variants : dict
+            Index computed by each variant, keyed by the variant name.
+        """
+        expanded, variants = {}, {}
+        for index, index_params in params.items():
+            is_sweep = isinstance(index_params, (list, tuple)) and len(index_params) > 0
+            if not (is_sweep and all(isinstance(item, dict) for item in index_params)):
+                expanded[index] = index_params
+                continue
+            for position, variant_params in enumerate(index_params, start=1):
+                variant_params = dict(variant_params)
+                name = f"{index}_{variant_params.pop('suffix', position)}"
+                if name in params or name in expanded:
+                    raise ValueError(f"Duplicated acoustic index name '{name}'.")
+                expanded[name] = variant_params
+                variants[name] = index
+        return expanded, variants
+
+    @staticmethod
+    def _convert_lists_to_tuples(data):
         """Recursively convert all lists in a dictionary to tuples."""
+        convert = AcousticIndices._convert_lists_to_tuples
         if isinstance(data, dict):
-            return {key: self._convert_lists_to_tuples(value) for key, value in data.items()}
+            return {key: convert(value) for key, value in data.items()}
         elif isinstance(data, list):
-            return tuple(self._convert_lists_to_tuples(item) for item in data)
+            return tuple(convert(item) for item in data)
         else:
             return data
 
     def compute_selected_indices(self):
-        """Compute only selected indices based on parameters."""
+        """Compute only selected indices based on parameters.
+
+        Indices and the intermediate results they need are evaluated through the
+        dependency graph, and the time spent on each of them is stored in
+        `timings`.
+        """
         if not isinstance(self.params, dict):
             raise ValueError("Expected self.params to be a dictionary.")
 
         results = {}
         for index in self.params.keys():
-            method_name = f"compute_{index}"
+            method_name = f"compute_{self._variants.get(index, index)}"
             if hasattr(self, method_name):
-                method = getattr(self, method_name)
-                results[index] = method(self.params[index])
+                results[index] = self._get(index)
             else:
                 logger.info(f"Warning: Method {method_name} not found in class.")
 
         return pd.Series(results)
 
-#%% 
-def preprocess_audio_file(path_audio, params):
+#%% Preprocessing
+@functools.lru_cache(maxsize=None)
+def _filter_sos(fs, filter_type, filter_cut, filter_order, dtype=np.float64):
+    """Butterworth filter in second-order sections, as designed by maad.sound.select_bandwidth.
+
+    Filters are cached in each process, so they are designed once per sampling rate
+    and settings instead of once per file.
     """
-    Preprocess audio file by resampling and filtering.
+    sos = signal.iirfilter(
+        N=filter_order,
+        Wn=np.asarray(filter_cut) / (fs / 2),
+        btype=filter_type,
+        ftype="butter",
+        output="sos",
+    )
+    return sos.astype(dtype)
+
+
+def select_bandwidth(s, fs, filter_type, filter_cut, filter_order):
+    """Zero-phase filtering as maad.sound.select_bandwidth, with a cached filter design.
+
+    The filter is applied in the floating point type of `s`.
+    """
+    if isinstance(filter_cut, (list, tuple)):
+        filter_cut = tuple(filter_cut)
+    sos = _filter_sos(fs, filter_type, filter_cut, filter_order, s.dtype.type)
+    return signal.sosfiltfilt(sos, s)
+
+
+def preprocess_audio(s, fs, params, timings=None):
+    """
+    Preprocess an audio signal by resampling and filtering, and compute its
+    amplitude spectrogram.
     Parameters
     ----------
-    path_audio : str
-        Path to the audio file.
+    s : 1d numpy array
+        Audio signal, as loaded by maad.sound.load.
+    fs : int
+        Sampling rate of `s`.
     params : dict
         Parameters for preprocessing, including target sampling frequency,
         filter type, filter cut-off frequency, filter order, and spectrogram parameters.
+        The optional `engine` selects how the signal is resampled and filtered:
+        'cached' (default) reuses the resampling and band-pass filters designed in
+        the process, 'maad' calls maad, which designs them again for every file.
+        Both give the same signal. The optional `precision` ('float64' by default, or 'float32') sets the
+        floating point type of the signal and the spectrogram.
+    timings : dict, optional
+        If given, the seconds spent resampling, filtering and computing the
+        spectrogram are added to it under the keys 'resample', 'filter' and
+        'spectrogram'.
     Returns
     -------
     s : 1d numpy array
@@ -171,20 +343,81 @@ def preprocess_audio_file(path_audio, params):
     filter_order = params["filter_order"]
     nperseg = params["nperseg"]
     noverlap = params["noverlap"]
+    engine = params.get("engine", "cached")
+    if engine not in ("cached", "maad"):
+        raise ValueError(f"Unknown preprocessing engine '{engine}', use 'cached' or 'maad'.")
+    timings = {} if timings is None else timings
+    dtype = precision_dtype(params.get("precision", "float64"))
+    s = s.astype(dtype, copy=False)
 
-    # load audio
-    s, fs = sound.load(path_audio)
-    s = sound.resample(s, fs, target_fs, res_type="scipy_poly")
-    if filter_type is not None:
+    start = time.perf_counter()
+    if engine == "cached":
+        s = resample(s, fs, target_fs)
+    else:
+        s = sound.resample(s, fs, target_fs, res_type="scipy_poly")
+    timings["resample"] = timings.get("resample", 0.0) + time.perf_counter() - start
+
+    start = time.perf_counter()
+    if filter_type is not None and engine == "cached":
+        s = select_bandwidth(s, target_fs, filter_type, filter_cut, filter_order)
+    elif filter_type is not None:
         s = sound.select_bandwidth(
             s, target_fs, ftype=filter_type, fcut=filter_cut, forder=filter_order
-        )
+        ).astype(dtype, copy=False)
+    timings["filter"] = timings.get("filter", 0.0) + time.perf_counter() - start
 
     # Compute the amplitude spectrogram and acoustic indices
+    start = time.perf_counter()
     Sxx, tn, fn, _ = sound.spectrogram(
         s, target_fs, nperseg=nperseg, noverlap=noverlap, mode="amplitude")
+    timings["spectrogram"] = timings.get("spectrogram", 0.0) + time.perf_counter() - start
     
     return s, Sxx, tn, fn
+
+
+def preprocess_audio_file(path_audio, params, timings=None):
+    """
+    Preprocess audio file by resampling and filtering.
+    Parameters
+    ----------
+    path_audio : str
+        Path to the audio file.
+    params : dict
+        Parameters for preprocessing, see `preprocess_audio`. If the optional
+        `signal_store` sets a `path`, the signal resampled to `target_fs` is read
+        from that `SignalStore`, or added to it.
+    timings : dict, optional
+        If given, the seconds spent on each stage ('load', 'resample', 'filter' and
+        'spectrogram') are added to it. With a signal store, 'load' includes
+        reading the store, or resampling the files that are not stored yet.
+    Returns
+    -------
+    s : 1d numpy array
+        Resampled audio signal.
+    Sxx : 2d numpy array
+        Amplitude spectrogram.
+    tn : 1d ndarray of floats
+        Time vector with temporal indices of spectrogram.
+    fn : 1d ndarray of floats
+        Frequency vector with temporal indices of spectrogram.
+    """
+    timings = {} if timings is None else timings
+    dtype = precision_dtype(params.get("precision", "float64"))
+    store = open_signal_store(params.get("signal_store"))
+    # load audio
+    start = time.perf_counter()
+    if store is None:
+        s, fs = load_audio(path_audio, dtype)
+    else:
+        if params.get("engine", "cached") == "maad":
+            resample_signal = functools.partial(sound.resample, res_type="scipy_poly")
+            resampler = "maad.sound.resample:scipy_poly"
+        else:
+            resample_signal, resampler = resample, "pamflow.utils.resample"
+        fs = params["target_fs"]
+        s = store.load(path_audio, fs, resample_signal, resampler, dtype)
+    timings["load"] = timings.get("load", 0.0) + time.perf_counter() - start
+    return preprocess_audio(s, fs, params, timings)
     
 # %%
 def compute_acoustic_indices_single_file(
@@ -192,6 +425,7 @@ def compute_acoustic_indices_single_file(
     params_preprocess=None,
     params_indices=None,
     verbose=True,
+    return_timings=False,
 ):
     """
     Compute acoustic indices for a single audio file.
@@ -206,23 +440,334 @@ def compute_acoustic_indices_single_file(
         Parameters for computing acoustic indices.
     verbose : bool
         If True, print progress messages.
+    return_timings : bool
+        If True, also return the seconds spent on each preprocessing stage, index
+        and intermediate result.
     Returns
     -------
     df_indices_file : pd.DataFrame
         Acoustic indices for the audio file.
+    timings : dict
+        Only returned if `return_timings` is True. See `preprocess_audio_file` and
+        `AcousticIndices.timings`.
     """
     if verbose:
         print(f"Processing file {path_audio}", end="\r")
     
     # Preprocess audio file
-    s, Sxx, tn, fn = preprocess_audio_file(path_audio, params_preprocess)
+    timings = {}
+    s, Sxx, tn, fn = preprocess_audio_file(path_audio, params_preprocess, timings)
     
     # Compute acoustic indices
     indices_computer = AcousticIndices(s, Sxx, tn, fn, params_indices)
     df_indices_file = indices_computer.compute_selected_indices()
 
+    if return_timings:
+        return df_indices_file, {**timings, **indices_computer.timings}
     return df_indices_file
 
+def compute_acoustic_indices_windows(
+    path_audio,
+    params_preprocess=None,
+    params_indices=None,
+    verbose=True,
+    return_timings=False,
+):
+    """
+    Compute acoustic indices for consecutive windows of an audio file.
+    The file is memory mapped and read one window of `window_seconds` at a time, so
+    memory use depends on the window length and not on the file length (except for
+    24-bit files, which can not be memory mapped). Each window is loaded as
+    maad.sound.load would load it as a separate file, then preprocessed and analyzed
+    as in `compute_acoustic_indices_single_file`. The last window may be shorter; it
+    is skipped if it is shorter than one spectrogram segment.
+    Parameters
+    ----------
+    path_audio : str
+        Path to the audio file.
+    params_preprocess : dict
+        Parameters for preprocessing, see `preprocess_audio`, including
+        `window_seconds`, the length of the windows in seconds.
+    params_indices : dict
+        Parameters for computing acoustic indices.
+    verbose : bool
+        If True, print progress messages.
+    return_timings : bool
+        If True, also return the seconds spent on each index and intermediate result,
+        summed over the windows.
+    Returns
+    -------
+    df_indices_file : pd.DataFrame
+        One row of acoustic indices per window. The `windowStart` column holds the
+        start of the window in seconds from the beginning of the file.
+    timings : dict
+        Only returned if `return_timings` is True.
+    """
+    if verbose:
+        print(f"Processing file {path_audio}", end="\r")
+
+    window_seconds = params_preprocess["window_seconds"]
+    if window_seconds <= 0:
+        raise ValueError("window_seconds must be a positive number of seconds.")
+    # Shortest window that holds one spectrogram segment after resampling
+    min_seconds = params_preprocess["nperseg"] / params_preprocess["target_fs"]
+
+    dtype = precision_dtype(params_preprocess.get("precision", "float64"))
+
+    sr, data = open_wav(path_audio)
+    duration = data.shape[0] / sr
+    rows = []
+    timings = {}
+    for window_start in np.arange(0, duration, window_seconds):
+        window_end = min(window_start + window_seconds, duration)
+        if window_end - window_start < min_seconds:
+            break
+        start = time.perf_counter()
+        s = read_wav_segment(data, sr, window_start, window_end, dtype)
+        timings["load"] = timings.get("load", 0.0) + time.perf_counter() - start
+        s, Sxx, tn, fn = preprocess_audio(s, sr, params_preprocess, timings)
+
+        indices_computer = AcousticIndices(s, Sxx, tn, fn, params_indices)
+        indices = indices_computer.compute_selected_indices()
+        indices["windowStart"] = float(window_start)
+        rows.append(indices)
+        for name, seconds in indices_computer.timings.items():
+            timings[name] = timings.get(name, 0.0) + seconds
+    del data
+
+    df_indices_file = pd.DataFrame(rows)
+    if return_timings:
+        return df_indices_file, timings
+    return df_indices_file
+
+def add_timestamps(df_indices, media):
+    """
+    Add the timestamp of each row of acoustic indices.
+    Parameters
+    ----------
+    df_indices : pd.DataFrame
+        Acoustic indices with a `mediaID` column, and a `windowStart` column for
+        windows computed by `compute_acoustic_indices_windows`.
+    media : pd.DataFrame
+        Media files in the pamDP.media format, with `mediaID` and `timestamp` columns.
+    Returns
+    -------
+    pd.DataFrame
+        `df_indices` with a `timestamp` column: the timestamp of the file, plus the
+        start of the window if any, in the format of pamDP timestamps.
+    """
+    # Files keep their own UTC offset
+    file_start = df_indices["mediaID"].map(
+        media.drop_duplicates("mediaID").set_index("mediaID")["timestamp"].map(pd.Timestamp)
+    )
+    if "windowStart" in df_indices.columns:
+        file_start = file_start + pd.to_timedelta(df_indices["windowStart"], unit="s")
+    df_indices["timestamp"] = file_start.map(
+        lambda timestamp: timestamp.strftime("%Y-%m-%dT%H:%M:%S%z") if pd.notna(timestamp) else None
+    )
+    return df_indices
+
+#%% Vectorized indices
+# Smallest positive float, used by maad to avoid log(0)
+_MIN_ = sys.float_info.min
+
+
+def _entropy_rows(x):
+    """Entropy of each row of a 2d array, as maad.util.entropy computes it for a 1d array."""
+    n = x.shape[1]
+    if n == 1:
+        return np.zeros(x.shape[0])
+    if np.min(x) < 0:
+        raise ValueError("Batch entropy expects non-negative values.")
+    total = np.sum(x, axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pmf = x / total
+    pmf[pmf == 0] = _MIN_
+    H = -np.sum(pmf * np.log(pmf), axis=1) / np.log(n)
+    # Rows with only zeros have an entropy of 1
+    H[~np.any(x, axis=1)] = 1
+    return H
+
+
+def _amplitude2dB(x):
+    """Vectorized maad.util.amplitude2dB without range or gain."""
+    x = np.abs(x)
+    x[x == 0] = _MIN_
+    return 20 * np.log10(x)
+
+
+def batch_ACI(S, fn):
+    """Acoustic Complexity Index of a stack of amplitude spectrograms (files, freq, time)."""
+    return np.sum(np.abs(np.diff(S, axis=2)) / np.sum(S, axis=2, keepdims=True), axis=(1, 2))
+
+
+def batch_ADI(S, fn, fmin=0, fmax=20000, bin_step=1000, dB_threshold=-50, index="shannon"):
+    """Acoustic Diversity Index of a stack of amplitude spectrograms (files, freq, time)."""
+    S_dB = _amplitude2dB(S / np.max(S, axis=(1, 2), keepdims=True))
+    n_bands = int(np.floor((fmax - fmin) / bin_step))
+    scores = np.empty((S.shape[0], n_bands))
+    for band in range(n_bands):
+        f0 = int(fmin + bin_step * band)
+        f1 = int(f0 + bin_step)
+        band_dB = S_dB[:, util.index_bw(fn, (f0, f1)), :]
+        scores[:, band] = np.mean(np.mean(band_dB >= dB_threshold, axis=1), axis=1)
+
+    if index == "shannon":
+        return _entropy_rows(scores) * np.log(n_bands)
+    scores = (scores / np.sum(scores, axis=1, keepdims=True)) ** 2
+    if index == "simpson":
+        return 1 - np.sum(scores, axis=1)
+    elif index == "invsimpson":
+        return 1 / np.sum(scores, axis=1)
+    raise ValueError(f"Unknown ADI index '{index}'.")
+
+
+def batch_BI(S, fn, flim=(2000, 15000)):
+    """Bioacoustics Index (soundecology version) of a stack of amplitude spectrograms."""
+    mean_dB = _amplitude2dB(np.mean(S / np.max(S, axis=(1, 2), keepdims=True), axis=2))
+    band_dB = mean_dB[:, util.index_bw(fn, flim)]
+    band_dB = band_dB - np.min(band_dB, axis=1, keepdims=True)
+    return np.sum(band_dB, axis=1) / (fn[1] - fn[0])
+
+
+def batch_Hf(S, fn):
+    """Frequency entropy of a stack of amplitude spectrograms."""
+    return _entropy_rows(np.mean(S**2, axis=2, dtype=np.float64))
+
+
+def batch_NDSI(S, fn, flim_bioPh=(1000, 10000), flim_antroPh=(0, 1000)):
+    """Normalized Difference Soundscape Index (soundecology version) of a stack of
+    amplitude spectrograms."""
+    bin_step = flim_antroPh[1] - flim_antroPh[0]
+    bins = np.arange(fn[0], fn[-1] + bin_step, bin_step)
+    # Energy over time of each frequency, then averaged in each bin as maad.util.into_bins
+    energy = np.sum(S**2, axis=2)
+    bin_energy, counts = [], []
+    for b0, b1 in zip(bins[:-1], bins[1:]):
+        rows = (fn >= b0) * (fn < b1)
+        counts.append(np.sum(rows))
+        bin_energy.append(np.mean(energy[:, rows], axis=1))
+    bin_energy = np.stack(bin_energy, axis=1) * np.mean(counts)
+    bins = bins[:-1]
+
+    bioPh = np.sum(bin_energy[:, util.index_bw(bins, flim_bioPh)], axis=1)
+    antroPh = np.sum(bin_energy[:, util.index_bw(bins, flim_antroPh)], axis=1)
+    return (bioPh - antroPh) / (bioPh + antroPh)
+
+
+def batch_SC(S, fn, dB_threshold=3, flim_LF=(0, 1000), flim_MF=None, flim_HF=None):
+    """Low frequency spectral cover of a stack of amplitude spectrograms."""
+    band_dB = _amplitude2dB(S[:, util.index_bw(fn, flim_LF), :])
+    return np.mean(np.mean(band_dB >= dB_threshold, axis=2), axis=1)
+
+
+# Indices computed on stacked spectrograms, and the parameter values they support
+batch_indices = {
+    "ACI": batch_ACI,
+    "ADI": batch_ADI,
+    "BI": batch_BI,
+    "Hf": batch_Hf,
+    "NDSI": batch_NDSI,
+    "SC": batch_SC,
+}
+
+
+def _supports_batch(index, params):
+    """Check whether an index can be computed on stacked spectrograms."""
+    if index not in batch_indices:
+        return False
+    # Only the default (soundecology) versions of BI and NDSI are vectorized
+    return (params or {}).get("R_compatible", "soundecology") == "soundecology"
+
+
+def compute_acoustic_indices_batch(
+    paths_audio,
+    params_preprocess=None,
+    params_indices=None,
+    verbose=True,
+):
+    """
+    Compute acoustic indices for several audio files at once.
+    Files are preprocessed one by one and their spectrograms are stacked into a 3d
+    array (files, frequency, time) for every group of files with the same spectrogram
+    shape. ACI, ADI, BI, Hf, NDSI and SC are then computed with NumPy reductions
+    along the file axis instead of one maad call per file. The remaining indices are
+    computed per file with `AcousticIndices`, reusing the batch results (e.g. Hf for H).
+    Results match `compute_acoustic_indices_single_file` within floating point
+    tolerance.
+    Parameters
+    ----------
+    paths_audio : list of str
+        Paths to the audio files.
+    params_preprocess : dict
+        Parameters for preprocessing, see `preprocess_audio_file`.
+    params_indices : dict
+        Parameters for computing acoustic indices.
+    verbose : bool
+        If True, print progress messages.
+    Returns
+    -------
+    list of tuple
+        One `(indices, timings, error)` tuple per file, in the order of `paths_audio`.
+        `indices` is a pd.Series (None if the file could not be processed), `timings`
+        the seconds spent on each preprocessing stage and index (batch indices are
+        split evenly between the files of the stack) and `error` the error message
+        or None.
+    """
+    params_indices = AcousticIndices._convert_lists_to_tuples(params_indices)
+    expanded_params, variants = AcousticIndices.expand_variants(params_indices)
+    results = [None] * len(paths_audio)
+
+    # Preprocess every file and group the spectrograms by shape
+    stacks = {}
+    for position, path_audio in enumerate(paths_audio):
+        if verbose:
+            print(f"Processing file {path_audio}", end="\r")
+        file_timings = {}
+        try:
+            s, Sxx, tn, fn = preprocess_audio_file(path_audio, params_preprocess, file_timings)
+        except Exception as e:
+            results[position] = (None, {}, str(e))
+            continue
+        key = (Sxx.shape, fn[0], fn[-1])
+        stacks.setdefault(key, []).append((position, s, Sxx, tn, fn, file_timings))
+
+    # Variants are computed in batch under their own name
+    batch_params = {
+        name: (variants.get(name, name), params)
+        for name, params in expanded_params.items()
+        if _supports_batch(variants.get(name, name), params)
+    }
+    for files in stacks.values():
+        fn = files[0][4]
+        S = np.stack([Sxx for _, _, Sxx, _, _, _ in files])
+        batch_values, batch_timings = {}, {}
+        for name, (index, params) in batch_params.items():
+            start = time.perf_counter()
+            batch_values[name] = batch_indices[index](S, fn, **(params or {}))
+            batch_timings[name] = (time.perf_counter() - start) / len(files)
+        del S
+
+        for row, (position, s, Sxx, tn, fn, file_timings) in enumerate(files):
+            try:
+                indices_computer = AcousticIndices(
+                    s,
+                    Sxx,
+                    tn,
+                    fn,
+                    params_indices,
+                    precomputed={index: values[row] for index, values in batch_values.items()},
+                )
+                indices = indices_computer.compute_selected_indices()
+                results[position] = (
+                    indices,
+                    {**file_timings, **batch_timings, **indices_computer.timings},
+                    None,
+                )
+            except Exception as e:
+                results[position] = (None, {}, str(e))
+    return results
+
 #%%
 def validate_n_jobs(n_jobs):
     """
@@ -253,12 +798,121 @@ def validate_n_jobs(n_jobs):
 
 # %%
 
+# %% Result cache
+class IndicesCache(FileResultsStore):
+    """
+    Persistent cache of the acoustic indices computed for each media file.
+    Each file is stored with its computed rows of indices (one row, or one per
+    window), see `pamflow.utils.FileResultsStore`.
+    Parameters
+    ----------
+    path : str
+        Location of the SQLite database. Parent folders are created if needed.
+    params_preprocess : dict
+        Parameters for preprocessing.
+    params_indices : dict
+        Parameters for computing acoustic indices.
+    """
+
+    payload_columns = {"indices": "TEXT"}
+
+    def __init__(self, path, params_preprocess, params_indices):
+        # Where the resampled signals are stored does not change the indices
+        if isinstance(params_preprocess, dict):
+            params_preprocess = {
+                key: value for key, value in params_preprocess.items() if key != "signal_store"
+            }
+        super().__init__(
+            path, {"preprocess": params_preprocess, "indices_settings": params_indices}
+        )
+
+    def decode_payload(self, file, payload):
+        """Rows of indices of a cached file."""
+        return json.loads(payload[0])
+
+    def record(self, file, rows):
+        """
+        Store the rows of indices computed for a file.
+        Parameters
+        ----------
+        file : dict
+            Media row, as returned by `split_files`.
+        rows : list of dict
+            Rows of acoustic indices of the file.
+        """
+        # NumPy scalars are stored as Python numbers
+        self.write([(file, (json.dumps(rows, default=lambda value: value.item()),))])
+
+
+# %% Profiling
+def profile_table(profile, media):
+    """
+    Build the per-file timing table of acoustic indices.
+    Parameters
+    ----------
+    profile : list of dict
+        Per-file timings collected by `compute_indices_parallel_by_group`.
+    media : pd.DataFrame
+        Media files in the pamDP.media format.
+    Returns
+    -------
+    pd.DataFrame
+        One row per file with its `mediaID`, `deploymentID`, `sampleRate`,
+        `fileLength` and `numChannels`, the seconds spent on each stage and their
+        `total`.
+    """
+    df_profile = pd.DataFrame(profile).drop(columns="group", errors="ignore")
+    if df_profile.empty:
+        return df_profile
+    stages = [column for column in df_profile.columns if column != "mediaID"]
+    df_profile[stages] = df_profile[stages].fillna(0.0)
+    df_profile["total"] = df_profile[stages].sum(axis=1)
+    audio_columns = ["mediaID", "deploymentID", "sampleRate", "fileLength", "numChannels"]
+    audio = media[[column for column in audio_columns if column in media.columns]]
+    return audio.drop_duplicates("mediaID").merge(df_profile, on="mediaID", how="right")
+
+
+def log_profile_summary(df_profile):
+    """
+    Log the p50 and p95 seconds per file of each stage, and the audio seconds
+    processed per CPU second, of a table built by `profile_table`.
+    """
+    if df_profile.empty:
+        return
+    audio_columns = ["mediaID", "deploymentID", "sampleRate", "fileLength", "numChannels"]
+    stages = [column for column in df_profile.columns if column not in audio_columns]
+    percentiles = df_profile[stages].quantile([0.5, 0.95])
+    breakdown = ", ".join(
+        f"{stage} {percentiles.loc[0.5, stage]:.3f}/{percentiles.loc[0.95, stage]:.3f} s"
+        for stage in percentiles.sort_values(0.95, axis=1, ascending=False).columns
+    )
+    logger.info(f"Acoustic indices profile (p50/p95 per file): {breakdown}")
+    if "fileLength" in df_profile.columns:
+        audio_seconds = df_profile["fileLength"].sum()
+        cpu_seconds = df_profile["total"].sum()
+        logger.info(
+            f"Acoustic indices throughput: {audio_seconds / cpu_seconds:.1f} audio seconds "
+            f"per CPU second ({df_profile.shape[0]} files, {audio_seconds:.0f} s of audio)"
+        )
+
+
 # %% Parellel computing
-def compute_indices_parallel(
-    data, params_preprocess, params_indices, n_jobs=-1
+def compute_indices_parallel_by_group(
+    data,
+    params_preprocess,
+    params_indices,
+    group_column=None,
+    n_jobs=-1,
+    max_in_flight=None,
+    files_per_task=None,
+    cache=None,
+    profile=None,
 ):
     """
-    Compute acoustic indices in parallel for a list of audio files.
+    Compute acoustic indices in parallel, yielding the results of each group of files.
+    Every file of every group is scheduled on a single process pool, so workers are
+    started once and keep busy across groups. The indices of a group are yielded as
+    soon as its last file is processed, while files of the next groups keep running.
     Parameters
     ----------
     data : pd.DataFrame
@@ -268,40 +922,170 @@ def compute_indices_parallel(
         filter type, filter cut-off frequency, filter order, and spectrogram parameters.
     params_indices : dict
         Parameters for computing acoustic indices.
+    group_column : str, optional
+        Column of `data` defining the groups (e.g. deploymentID). If None, all files
+        form a single group.
     n_jobs : int
         Number of parallel jobs to run. If -1, use all available CPU cores.
-    Returns
-    -------
-    df_out : pd.DataFrame
-        DataFrame containing the computed acoustic indices for all audio files.
+    max_in_flight : int, optional
+        Maximum number of tasks submitted to the pool and not processed yet.
+        Defaults to twice the number of jobs.
+    files_per_task : int, optional
+        Number of files of the same group computed together with
+        `compute_acoustic_indices_batch`. If None, each file is computed on its own
+        with `compute_acoustic_indices_single_file`.
+    cache : IndicesCache, optional
+        Cache of computed indices. Cached files are not computed again and computed
+        files are added to it. The indices of a group merge both.
+    profile : list, optional
+        If given, one dictionary per computed file is appended to it, with the
+        `mediaID`, the group and the seconds spent on each stage (see
+        `compute_acoustic_indices_single_file`).
+    Yields
+    ------
+    tuple
+        The group value (None if `group_column` is None) and a pd.DataFrame with the
+        acoustic indices of its files. If `params_preprocess` sets `window_seconds`,
+        there is one row per window (see `compute_acoustic_indices_windows`).
     """
     n_jobs = validate_n_jobs(n_jobs)
+    if files_per_task is not None and files_per_task < 1:
+        raise ValueError("files_per_task must be a positive integer or None.")
+    windowed = (params_preprocess or {}).get("window_seconds") is not None
+    if windowed and files_per_task is not None:
+        raise ValueError("window_seconds can not be combined with files_per_task.")
+    if max_in_flight is None:
+        max_in_flight = 2 * n_jobs
+
+    # Files are submitted group after group, so groups complete in order
+    if group_column is None:
+        groups = pd.Series(None, index=data.index, dtype=object)
+    else:
+        groups = data[group_column]
+    order = groups.sort_values(kind="stable").index
+    files = data.loc[order, ["filePath", "mediaID"]].assign(group=groups.loc[order])
+    files = files.to_dict(orient="records")
+    results = {group: [] for group in pd.unique(groups.loc[order])}
+    if cache is not None:
+        files, cached = cache.split_files(files)
+        for media_id, group in zip(data.loc[order, "mediaID"], groups.loc[order]):
+            results[group].extend(cached.get(media_id, []))
+        logger.info(
+            f"Acoustic indices cache {cache.path}: {len(cached)} files cached, "
+            f"{len(files)} new or changed files to compute."
+        )
+    remaining = {}
+    for file in files:
+        remaining[file["group"]] = remaining.get(file["group"], 0) + 1
+    timings = {group: {} for group in remaining}
+
+    # Groups without files to compute are complete
+    for group in list(results):
+        if group not in remaining:
+            yield group, pd.DataFrame(results.pop(group))
 
     # Use concurrent.futures for parallel execution
-    files = data[["filePath", "mediaID"]].to_dict(orient="records")
     with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
-        # Use submit for each task
-        futures = {
-            executor.submit(
-                compute_acoustic_indices_single_file,
-                file["filePath"],
-                params_preprocess,
-                params_indices,
-                verbose=True,
-            ): file["mediaID"]
-            for file in files
-        }
+        # Submit files as workers become available
+        if files_per_task is None:
+            if windowed:
+                function = compute_acoustic_indices_windows
+            else:
+                function = compute_acoustic_indices_single_file
+            tasks = (
+                ([file], (file["filePath"], params_preprocess, params_indices, True, True))
+                for file in files
+            )
+        else:
+            # Files of a task belong to the same group
+            function = compute_acoustic_indices_batch
+            chunks = (
+                chunk[start : start + files_per_task]
+                for _, chunk in itertools.groupby(files, key=lambda file: file["group"])
+                for chunk in [list(chunk)]
+                for start in range(0, len(chunk), files_per_task)
+            )
+            tasks = (
+                (
+                    chunk,
+                    ([file["filePath"] for file in chunk], params_preprocess, params_indices, False),
+                )
+                for chunk in chunks
+            )
 
         # Get results when tasks are completed
-        results = []
-        for future in concurrent.futures.as_completed(futures):
-            media_id = futures[future]
+        for chunk, future in as_completed_bounded(executor, function, tasks, max_in_flight):
             try:
-                result = future.result()
-                result["mediaID"] = media_id
-                results.append(result)
-
+                outcomes = future.result()
+                if files_per_task is None:
+                    outcomes = [(*outcomes, None)]
             except Exception as e:
-                logger.error(f"Error processing file {media_id}: {e}")
+                outcomes = [(None, {}, str(e))] * len(chunk)
 
-    return pd.DataFrame(results)
+            for file, (result, file_timings, error) in zip(chunk, outcomes):
+                group = file["group"]
+                if error is None:
+                    for name, seconds in file_timings.items():
+                        timings[group][name] = timings[group].get(name, 0.0) + seconds
+                    result["mediaID"] = file["mediaID"]
+                    if windowed:
+                        # One row per window of the file
+                        rows = result.to_dict(orient="records")
+                    else:
+                        rows = [result.to_dict()]
+                    results[group].extend(rows)
+                    if cache is not None:
+                        cache.record(file, rows)
+                    if profile is not None:
+                        profile.append(
+                            {"mediaID": file["mediaID"], "group": group, **file_timings}
+                        )
+                else:
+                    logger.error(f"Error processing file {file['mediaID']}: {error}")
+
+                remaining[group] -= 1
+                if remaining[group] == 0:
+                    group_timings = timings.pop(group)
+                    if group_timings:
+                        breakdown = ", ".join(
+                            f"{name} {seconds:.2f} s"
+                            for name, seconds in sorted(
+                                group_timings.items(), key=lambda item: -item[1]
+                            )
+                        )
+                        logger.info(f"Acoustic indices timing (summed over files): {breakdown}")
+                    yield group, pd.DataFrame(results.pop(group))
+
+
+def compute_indices_parallel(
+    data, params_preprocess, params_indices, n_jobs=-1, max_in_flight=None, files_per_task=None
+):
+    """
+    Compute acoustic indices in parallel for a list of audio files.
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame containing metadata of media files, including file paths.
+    params_preprocess : dict
+        Parameters for preprocessing, including target sampling frequency,
+        filter type, filter cut-off frequency, filter order, and spectrogram parameters.
+    params_indices : dict
+        Parameters for computing acoustic indices.
+    n_jobs : int
+        Number of parallel jobs to run. If -1, use all available CPU cores.
+    max_in_flight : int, optional
+        Maximum number of tasks submitted to the pool and not processed yet.
+        Defaults to twice the number of jobs.
+    files_per_task : int, optional
+        Number of files computed together on stacked spectrograms (None for one
+        file per task).
+    Returns
+    -------
+    df_out : pd.DataFrame
+        DataFrame containing the computed acoustic indices for all audio files.
+    """
+    for _, df_out in compute_indices_parallel_by_group(
+        data, params_preprocess, params_indices, None, n_jobs, max_in_flight, files_per_task
+    ):
+        return df_out
+    return pd.DataFrame()
@@ -0,0 +1,466 @@
+"""
+Fused analysis of media files: acoustic indices, graphical soundscapes, species
+detection and audio quality metrics computed from a single read of each audio file.
+"""
+
+import os
+import logging
+import concurrent.futures
+import pandas as pd
+import matplotlib.pyplot as plt
+from maad.features import plot_graph
+from rich.console import Console
+from pamflow.pipelines.analyze.utils import analyze_files
+from pamflow.pipelines.acoustic_indices.utils import IndicesCache, add_timestamps
+from pamflow.pipelines.graphical_soundscape.utils import PeakDensityCache, mean_peak_density
+from pamflow.pipelines.species_detection.utils import (
+    init_species_detection_worker,
+    compute_species_lists,
+    get_week_48,
+    DetectionLedger,
+    MODEL_VERSION,
+    concat_observations,
+    detections_to_observations,
+    observations_categorical_columns,
+)
+from pamflow.utils import as_completed_bounded
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def analyze_media(
+    media,
+    deployments,
+    acoustic_indices_parameters,
+    graphical_soundscape_parameters,
+    detection_settings,
+    analyze_parameters,
+):
+    """Computes acoustic indices, graphical soundscapes, species detections and audio quality reading each file once.
+
+    This node replaces `compute_indices_node`, `graphical_soundscape_node` and
+    `species_detection_node` in the `analyze` pipeline. Each audio file is read from
+    disk once in a worker, and its samples are used by every analysis before the
+    next file is read. The inputs correspond to the catalog entries `media@pamDP`
+    and `deployments@pamDP`. The outputs are the catalog entries written by the
+    three nodes it replaces, plus the audio quality metrics of each file.
+
+    Files are submitted deployment after deployment, and the outputs of a
+    deployment are yielded as soon as its last file is analyzed, so the results of
+    finished deployments are not kept in memory. The observations of each
+    deployment are written to an intermediate partition, and `collect_observations`
+    gathers them into `unfiltered_observations@pamDP` once.
+
+    The acoustic indices cache (`execution.cache_path`), the peak density cache
+    (`cache_path` of the graphical soundscape) and the detection ledger
+    (`ledger_path`) are used as in the nodes they replace: a file is still read for
+    its quality metrics, but the analyses found in them are not computed again, and
+    the new results are added to them.
+
+    Parameters
+    ----------
+    media : pandas.DataFrame
+        A DataFrame containing metadata of media files, following the pamDP.media format.
+        Loaded from the catalog entry `media@pamDP`.
+
+    deployments : pandas.DataFrame
+        A DataFrame containing deployment metadata, including sensor locations
+        (latitude and longitude). Loaded from the catalog entry `deployments@pamDP`.
+
+    acoustic_indices_parameters : dict
+        Parameters of the acoustic indices, passed as `params:acoustic_indices`.
+        `preprocess`, `indices_settings` and `execution.cache_path` are used.
+        `window_seconds` is not supported, and the signal store is not used since
+        each file is read once.
+
+    graphical_soundscape_parameters : dict
+        Parameters of the graphical soundscapes, passed as
+        `params:graphical_soundscape_parameters`. The peak detection parameters and
+        `cache_path` are used; `n_jobs`, `engine`, `files_per_task` and
+        `signal_store` do not apply to this node.
+
+    detection_settings : dict
+        Options of the species detection, passed as
+        `params:species_detection_parameters.detection_settings`. Files are always
+        scored by the batched engine, with `batch_size`, `filter_by_week`,
+        `prescreen_threshold`, `prescreen_band`, `stream_chunk_size` (number of
+        detections read from the ledger at once) and `ledger_path`. `stream_path`
+        is not used: the observations are written after each deployment.
+
+    analyze_parameters : dict
+        Execution options passed as `params:analyze_parameters`: `n_jobs` (-1 for
+        all the cores), `files_per_task` (number of files sent to a worker at once)
+        and `max_in_flight` (maximum number of tasks queued in the pool, 2 * n_jobs
+        if None).
+
+    Yields
+    ------
+    tuple
+        For each deployment:
+
+        - dict: The acoustic indices of the deployment, stored as
+          `acoustic_indices@PartitionedDataset`. Empty if no file of the
+          deployment could be analyzed.
+        - dict: The graphical soundscape of the deployment, stored as
+          `graphical_soundscape@PartitionedDataset`.
+        - dict: The figure of the graphical soundscape, stored as
+          `graph_plot@PartitionedImage`.
+        - dict: The audio quality metrics of each file of the deployment (see
+          `audio_quality_metrics`), with the errors of the files that could not be
+          analyzed, stored as `audio_quality@PartitionedDataset`.
+        - dict: The species observations of the deployment, in the
+          pamDP.observations format, stored as `analyze_observations@PartitionedDataset`.
+    """
+    from rich.progress import (
+        Progress,
+        BarColumn,
+        TextColumn,
+        TimeElapsedColumn,
+        TimeRemainingColumn,
+    )
+
+    console = Console()
+
+    params_preprocess = acoustic_indices_parameters["preprocess"]
+    params_indices = acoustic_indices_parameters["indices_settings"]
+    params_soundscape = graphical_soundscape_parameters
+    indices_cache_path = acoustic_indices_parameters.get("execution", {}).get("cache_path")
+    peak_cache_path = params_soundscape.get("cache_path")
+    n_jobs = analyze_parameters.get("n_jobs", -1)
+    files_per_task = analyze_parameters.get("files_per_task", 8)
+    max_in_flight = analyze_parameters.get("max_in_flight")
+    detection_settings = detection_settings or {}
+    batch_size = detection_settings.get("batch_size", 64)
+    ledger_path = detection_settings.get("ledger_path")
+    stream_chunk_size = detection_settings.get("stream_chunk_size", 100000)
+    filter_by_week = detection_settings.get("filter_by_week", True)
+    prescreen_threshold = detection_settings.get("prescreen_threshold")
+    prescreen_band = detection_settings.get("prescreen_band", [150, 15000])
+    if params_preprocess.get("window_seconds") is not None:
+        raise ValueError("window_seconds is not supported by the analyze pipeline.")
+    if not isinstance(files_per_task, int) or files_per_task < 1:
+        raise ValueError("files_per_task must be a positive integer.")
+    unused = [
+        name
+        for name, value in [
+            (
+                "acoustic_indices.preprocess.signal_store",
+                (params_preprocess.get("signal_store") or {}).get("path"),
+            ),
+            (
+                "graphical_soundscape_parameters.signal_store",
+                (params_soundscape.get("signal_store") or {}).get("path"),
+            ),
+            ("detection_settings.stream_path", detection_settings.get("stream_path")),
+        ]
+        if value is not None
+    ]
+    if unused:
+        logger.warning(
+            f"{', '.join(unused)} not used by the analyze pipeline: each file is read once "
+            "and the observations are written after each deployment."
+        )
+    prescreen = None
+    if prescreen_threshold is not None:
+        prescreen = {"threshold": prescreen_threshold, "band": list(prescreen_band)}
+
+    media = media[media["fileLength"] > 0]
+    df = media.merge(
+        deployments[["deploymentID", "latitude", "longitude"]], on="deploymentID", how="left"
+    )
+    df["time"] = pd.to_datetime(df["timestamp"]).dt.hour
+    df["week_48"] = get_week_48(df["timestamp"]) if filter_by_week else -1
+    # Files of a deployment are sent together, deployment after deployment
+    df = df.sort_values("deploymentID", kind="stable")
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 2 * n_jobs
+
+    logger.info(
+        f"Analyzing {df.shape[0]} files of {df['deploymentID'].nunique()} deployments "
+        f"using {n_jobs} threads"
+    )
+
+    files = df[
+        ["filePath", "latitude", "longitude", "mediaID", "deploymentID", "week_48"]
+    ].to_dict(orient="records")
+    file_times = dict(zip(df["mediaID"], df["time"]))
+
+    indices_rows = {deployment: [] for deployment in pd.unique(df["deploymentID"])}
+    peak_densities = {deployment: [] for deployment in indices_rows}
+    quality_rows = {deployment: [] for deployment in indices_rows}
+    # Every file is read, at least for its quality metrics
+    remaining = df["deploymentID"].value_counts().to_dict()
+    detections_by_deployment = {deployment: [] for deployment in indices_rows}
+    detected_by_deployment = {deployment: [] for deployment in indices_rows}
+    classification_timestamp = pd.to_datetime("today").strftime('%Y-%m-%dT%H:%M:%S')
+    n_observations = 0
+
+    # Analyses already stored in the caches are not computed again
+    indices_cache, peak_cache, ledger = None, None, None
+    cached_indices, cached_peak_densities, detected_media_ids = {}, {}, set()
+    if indices_cache_path is not None:
+        indices_cache = IndicesCache(indices_cache_path, params_preprocess, params_indices)
+        _, cached_indices = indices_cache.split_files(files)
+        logger.info(f"Acoustic indices cache {indices_cache_path}: {len(cached_indices)} files cached.")
+    if peak_cache_path is not None:
+        peak_cache = PeakDensityCache(
+            peak_cache_path,
+            {
+                "target_fs": params_soundscape["target_fs"],
+                "nperseg": params_soundscape["nperseg"],
+                "noverlap": params_soundscape["noverlap"],
+                "db_range": params_soundscape["db_range"],
+                "min_distance": params_soundscape["min_distance"],
+                "threshold_abs": params_soundscape["threshold_abs"],
+                "precision": params_soundscape.get("precision", "float64"),
+            },
+        )
+        _, cached_peak_densities = peak_cache.split_files(files)
+        logger.info(f"Peak density cache {peak_cache_path}: {len(cached_peak_densities)} files cached.")
+    if ledger_path is not None:
+        ledger = DetectionLedger(
+            ledger_path,
+            {
+                "birdnetVersion": MODEL_VERSION,
+                "filterByWeek": bool(filter_by_week),
+                "prescreen": prescreen,
+            },
+        )
+        _, done_media_ids = ledger.split_files(files)
+        detected_media_ids = set(done_media_ids)
+        logger.info(f"Detection ledger {ledger_path}: {len(done_media_ids)} files already analyzed.")
+
+    for file in files:
+        media_id = file["mediaID"]
+        file["analyses"] = [
+            name
+            for name, known in [
+                ("indices", cached_indices),
+                ("peak_density", cached_peak_densities),
+                ("detections", detected_media_ids),
+            ]
+            if media_id not in known
+        ]
+        if media_id in cached_indices:
+            indices_rows[file["deploymentID"]].extend(cached_indices[media_id])
+        if media_id in cached_peak_densities:
+            peak_densities[file["deploymentID"]].append(
+                (file["filePath"], file_times[media_id], cached_peak_densities[media_id])
+            )
+        if media_id in detected_media_ids:
+            detected_by_deployment[file["deploymentID"]].append(media_id)
+
+    # The location model runs once per deployment and week, not once per file
+    species_lists = compute_species_lists(
+        pd.DataFrame(
+            [file for file in files if "detections" in file["analyses"]],
+            columns=["deploymentID", "latitude", "longitude", "week_48"],
+        )
+    )
+    logger.info(f"Computed {len(species_lists)} species lists (deployment and week).")
+
+    def deployment_outputs(deployment):
+        """Outputs of a deployment whose files are all analyzed, dropped from memory."""
+        nonlocal n_observations
+
+        indices = {}
+        deployment_indices_rows = indices_rows.pop(deployment)
+        if deployment_indices_rows:
+            df_indices = pd.DataFrame(deployment_indices_rows)
+            df_indices["deploymentID"] = deployment
+            indices[f"indices_{deployment}"] = add_timestamps(df_indices, media)
+            logger.info(f"Computed acoustic indices for {deployment} ({df_indices.shape[0]} rows)")
+        else:
+            logger.error(f"No acoustic indices of {deployment} could be computed.")
+
+        graphs, graph_plots = {}, {}
+        deployment_peak_densities = peak_densities.pop(deployment)
+        if deployment_peak_densities:
+            df_graph = mean_peak_density(deployment_peak_densities, df["time"].dtype)
+            fig, ax = plt.subplots()
+            plot_graph(df_graph, savefig=False, ax=ax)
+            graphs[f"graph_{deployment}"] = df_graph
+            graph_plots[f"graph_{deployment}"] = fig
+            # Figures are saved after the node yields, close them to free the pyplot state
+            plt.close(fig)
+        else:
+            logger.error(f"No peak density of {deployment} could be computed.")
+
+        df_quality = pd.DataFrame(quality_rows.pop(deployment))
+        # Files that could not be read have no metrics, keep the errors last
+        df_quality = df_quality[[column for column in df_quality.columns if column != "error"] + ["error"]]
+        df_quality["deploymentID"] = deployment
+        df_quality = add_timestamps(df_quality, media)
+
+        # Detections of the files already in the ledger are read now, not up front
+        detections = detections_by_deployment.pop(deployment)
+        if ledger is not None:
+            for chunk in ledger.iter_detections(detected_by_deployment[deployment], stream_chunk_size):
+                detections.extend(chunk)
+        observations = detections_to_observations(
+            detections, n_observations, classification_timestamp
+        )
+        n_observations += len(observations)
+        return (
+            indices,
+            graphs,
+            graph_plots,
+            {f"quality_{deployment}": df_quality},
+            {f"observations_{deployment}": observations},
+        )
+
+    errors = 0
+    seconds = {}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=init_species_detection_worker,
+            initargs=(species_lists, True),
+        ) as executor:
+            tasks = (
+                (
+                    files[i : i + files_per_task],
+                    (
+                        files[i : i + files_per_task],
+                        params_preprocess,
+                        params_indices,
+                        params_soundscape,
+                        batch_size,
+                        prescreen,
+                    ),
+                )
+                for i in range(0, len(files), files_per_task)
+            )
+
+            progress_columns = [
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(),
+                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+                TimeElapsedColumn(),
+                TimeRemainingColumn(),
+            ]
+            with Progress(*progress_columns, console=console) as progress:
+                task = progress.add_task("Analyzing files...", total=len(files))
+                for task_files, future in as_completed_bounded(
+                    executor, analyze_files, tasks, max_in_flight
+                ):
+                    progress.update(task, advance=len(task_files))
+                    try:
+                        task_results, detections, timing = future.result()
+                    except Exception as e:
+                        logger.exception("Error during analysis task")
+                        task_results, detections = {}, []
+                        timing = {"errors": [(file["mediaID"], str(e)) for file in task_files]}
+
+                    failed = dict(timing.get("errors", []))
+                    for detection in detections:
+                        detections_by_deployment[detection["deploymentID"]].append(detection)
+                    if ledger is not None:
+                        ledger.record(
+                            [
+                                file
+                                for file in task_files
+                                if "detections" in file["analyses"] and file["mediaID"] not in failed
+                            ],
+                            detections,
+                        )
+                    for name in ("read", "analyze", "inference", "model_load"):
+                        seconds[name] = seconds.get(name, 0.0) + timing.get(name, 0.0)
+
+                    for file in task_files:
+                        media_id, deployment = file["mediaID"], file["deploymentID"]
+                        result = task_results.get(media_id, {})
+                        messages = [failed[media_id]] if media_id in failed else []
+                        for name in ("quality", "indices", "peak_density"):
+                            if f"{name}_error" in result:
+                                messages.append(f"{name}: {result[f'{name}_error']}")
+                        if messages:
+                            errors += 1
+                            console.log(f"[red]Error processing file {media_id}:[/red] {'; '.join(messages)}")
+
+                        quality_rows[deployment].append(
+                            {
+                                "mediaID": media_id,
+                                **result.get("quality", {}),
+                                "error": "; ".join(messages) or None,
+                            }
+                        )
+                        if "indices" in result:
+                            rows = [{**result["indices"].to_dict(), "mediaID": media_id}]
+                            indices_rows[deployment].extend(rows)
+                            if indices_cache is not None:
+                                indices_cache.record(file, rows)
+                        if "peak_density" in result:
+                            peak_densities[deployment].append(
+                                (file["filePath"], file_times[media_id], result["peak_density"])
+                            )
+                            if peak_cache is not None:
+                                peak_cache.record(file, result["peak_density"], result["n_frames"])
+
+                        remaining[deployment] -= 1
+                        if remaining[deployment] == 0:
+                            yield deployment_outputs(deployment)
+    finally:
+        for store in (indices_cache, peak_cache, ledger):
+            if store is not None:
+                store.close()
+
+    if not files:
+        # Kedro needs one output of each kind
+        yield {}, {}, {}, {}, {}
+
+    if errors:
+        console.log(f"[yellow]Completed with {errors} failed files (see audio_quality).[/yellow]")
+    logger.info(
+        "Reading files took {read:.1f} s, indices and peak density {analyze:.1f} s and "
+        "species detection {inference:.1f} s (summed over workers).".format(
+            **{name: seconds.get(name, 0.0) for name in ("read", "analyze", "inference")}
+        )
+    )
+    logger.info(
+        f"Analysis completed! Detected {n_observations} observations."
+    )
+
+
+def collect_observations(analyze_observations, media):
+    """Gathers the observations of every deployment written by `analyze_media`.
+
+    The input corresponds to the catalog entry
+    `analyze_observations@PartitionedDataset`, and the output is stored in the
+    catalog as `unfiltered_observations@pamDP`. Only the deployments of `media@pamDP`
+    are read, so partitions left by earlier runs on other deployments are ignored.
+
+    Parameters
+    ----------
+    analyze_observations : dict
+        Functions loading the observations of each deployment, keyed by
+        `observations_<deploymentID>`.
+
+    media : pandas.DataFrame
+        A DataFrame containing metadata of media files, following the pamDP.media format.
+        Loaded from the catalog entry `media@pamDP`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The species observations of every deployment, following the
+        pamDP.observations format.
+    """
+    deployments = pd.unique(media.loc[media["fileLength"] > 0, "deploymentID"])
+    chunks = []
+    for deployment in sorted(deployments):
+        if f"observations_{deployment}" not in analyze_observations:
+            continue
+        chunk = analyze_observations[f"observations_{deployment}"]()
+        # Empty columns are read back as objects
+        for column in observations_categorical_columns:
+            if not isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                chunk[column] = chunk[column].astype("category")
+        chunks.append(chunk)
+    observations = concat_observations(chunks)
+    logger.info(f"Collected {observations.shape[0]} observations of {len(chunks)} deployments.")
+    return observations
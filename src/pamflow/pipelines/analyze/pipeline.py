@@ -0,0 +1,34 @@
+from kedro.pipeline import Pipeline, node, pipeline
+from .nodes import analyze_media, collect_observations
+
+
+def create_pipeline(**kwargs):
+    return Pipeline(
+        [
+            node(  # Log
+                func=analyze_media,
+                inputs=[
+                    "media@pamDP",
+                    "deployments@pamDP",
+                    "params:acoustic_indices",
+                    "params:graphical_soundscape_parameters",
+                    "params:species_detection_parameters.detection_settings",
+                    "params:analyze_parameters",
+                ],
+                outputs=[
+                    "acoustic_indices@PartitionedDataset",
+                    "graphical_soundscape@PartitionedDataset",
+                    "graph_plot@PartitionedImage",
+                    "audio_quality@PartitionedDataset",
+                    "analyze_observations@PartitionedDataset",
+                ],
+                name="analyze_node",
+            ),
+            node(
+                func=collect_observations,
+                inputs=["analyze_observations@PartitionedDataset", "media@pamDP"],
+                outputs="unfiltered_observations@pamDP",
+                name="collect_observations_node",
+            ),
+        ]
+    )
@@ -0,0 +1,202 @@
+"""
+Utilities for the fused analysis of audio files.
+
+Each audio file is read once and its samples are shared in memory by the acoustic
+indices, the graphical soundscape peak detection, the BirdNET windowing and the
+audio quality metrics, instead of every pipeline decoding the file again.
+"""
+
+import time
+import numpy as np
+from pamflow.utils import open_wav, precision_dtype, read_wav_segment, resample
+from pamflow.pipelines.acoustic_indices.utils import AcousticIndices, preprocess_audio
+from pamflow.pipelines.graphical_soundscape.utils import (
+    check_threshold,
+    local_max_peak_counts,
+    peak_density_frame,
+    signal_spectrogram_dB,
+)
+from pamflow.pipelines.quality_control.utils import audio_quality_metrics
+from pamflow.pipelines.species_detection.utils import (
+    decoded_birdnet_windows,
+    species_detection_batch,
+)
+
+
+def analyze_samples(
+    path_audio,
+    data,
+    sr,
+    params_preprocess,
+    params_indices,
+    params_soundscape,
+    analyses=("indices", "peak_density"),
+):
+    """
+    Compute the acoustic indices, the spectral peak density and the audio quality
+    metrics of a file already read.
+    The signal is loaded from `data` as maad.sound.load would load the file, and
+    resampled once for both analyses when they use the same sampling rate and
+    precision.
+    Parameters
+    ----------
+    path_audio : str
+        Path to the audio file, used to name the peak density.
+    data : numpy.ndarray
+        Samples of the file, as returned by `pamflow.utils.open_wav`.
+    sr : int
+        Sample rate of the file.
+    params_preprocess : dict
+        Parameters for preprocessing, see
+        `pamflow.pipelines.acoustic_indices.utils.preprocess_audio`.
+    params_indices : dict
+        Parameters for computing acoustic indices.
+    params_soundscape : dict
+        Graphical soundscape parameters: `target_fs`, `nperseg`, `noverlap`,
+        `db_range`, `min_distance`, `threshold_abs` and `precision`.
+    analyses : iterable of str
+        Analyses to run among 'indices' and 'peak_density', e.g. those missing
+        from the caches. The quality metrics are always computed.
+    Returns
+    -------
+    dict
+        The quality metrics (`quality`, see `audio_quality_metrics`), the acoustic
+        indices (`indices`, a pd.Series) and the peak density (`peak_density`, a
+        one row pd.DataFrame, and `n_frames`) of the file, or the error message of
+        each analysis that failed (`quality_error`, `indices_error` and
+        `peak_density_error`).
+    """
+    signals = {}
+
+    def resampled(target_fs, precision):
+        """Signal resampled to `target_fs`, computed once per rate and precision."""
+        dtype = precision_dtype(precision)
+        key = (target_fs, dtype)
+        if key not in signals:
+            s = read_wav_segment(data, sr, dtype=dtype)
+            signals[key] = resample(s, sr, target_fs)
+        return signals[key]
+
+    result = {}
+    try:
+        result["quality"] = audio_quality_metrics(data, sr)
+    except Exception as e:
+        result["quality_error"] = str(e)
+
+    if "indices" in analyses:
+        try:
+            target_fs = params_preprocess["target_fs"]
+            s = resampled(target_fs, params_preprocess.get("precision", "float64"))
+            # The signal is already at target_fs, so only the filter and spectrogram run
+            s, Sxx, tn, fn = preprocess_audio(s, target_fs, params_preprocess)
+            result["indices"] = AcousticIndices(s, Sxx, tn, fn, params_indices).compute_selected_indices()
+        except Exception as e:
+            result["indices_error"] = str(e)
+
+    if "peak_density" in analyses:
+        try:
+            target_fs = params_soundscape["target_fs"]
+            s = resampled(target_fs, params_soundscape.get("precision", "float64"))
+            Sxx_db, tn, fn, _ = signal_spectrogram_dB(
+                s,
+                target_fs,
+                params_soundscape["nperseg"],
+                params_soundscape["noverlap"],
+                params_soundscape["db_range"],
+            )
+            check_threshold(Sxx_db, params_soundscape["threshold_abs"])
+            count_peak = local_max_peak_counts(
+                Sxx_db[np.newaxis], params_soundscape["min_distance"], params_soundscape["threshold_abs"]
+            )[0]
+            result["peak_density"] = peak_density_frame(count_peak, tn, fn, path_audio)
+            result["n_frames"] = len(tn)
+        except Exception as e:
+            result["peak_density_error"] = str(e)
+    return result
+
+
+def analyze_files(
+    files,
+    params_preprocess,
+    params_indices,
+    params_soundscape,
+    batch_size,
+    prescreen=None,
+):
+    """
+    Analyze a group of media files, reading each file once.
+    Every file is read into memory with `pamflow.utils.open_wav`, then its samples
+    are used to compute the quality metrics, the acoustic indices and the spectral
+    peak density (see `analyze_samples`) and are cut into the BirdNET windows scored
+    in batches by `species_detection_batch`. It runs in a worker initialized by
+    `init_species_detection_worker`.
+    Parameters
+    ----------
+    files : list of dict
+        Media rows, with the keys needed by `species_detection_batch` and the
+        `analyses` to run on each file among 'indices', 'peak_density' and
+        'detections' (all of them if missing).
+    params_preprocess, params_indices, params_soundscape :
+        See `analyze_samples`.
+    batch_size : int
+        Number of 3 s windows scored by each BirdNET call.
+    prescreen : dict, optional
+        Energy pre-screen of the BirdNET windows, see `species_detection_batch`.
+    Returns
+    -------
+    tuple
+        - dict: The result of `analyze_samples` for each file read, keyed by mediaID.
+        - list: Detection dictionaries, as returned by `species_detection_batch`.
+        - dict: Timing information of `species_detection_batch`, with the seconds
+          spent reading the files (`read`) and computing the indices and the peak
+          density (`analyze`). Its `errors` list the files that could not be read.
+    """
+    results = {}
+    seconds = {"read": 0.0, "analyze": 0.0}
+    all_analyses = ("indices", "peak_density", "detections")
+
+    def read_file(file_info):
+        """Read and analyze the file, returning its samples and sample rate."""
+        start = time.perf_counter()
+        sr, data = open_wav(file_info["filePath"])
+        # Read the samples from disk once for every analysis
+        data = np.array(data)
+        seconds["read"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        results[file_info["mediaID"]] = analyze_samples(
+            file_info["filePath"],
+            data,
+            sr,
+            params_preprocess,
+            params_indices,
+            params_soundscape,
+            file_info.get("analyses", all_analyses),
+        )
+        seconds["analyze"] += time.perf_counter() - start
+        return data, sr
+
+    def read_windows(file_info):
+        """Read the file, analyze it and return its BirdNET windows."""
+        return decoded_birdnet_windows(*read_file(file_info))
+
+    # Files whose detections are known are only read for the other analyses
+    errors = []
+    detected_files = []
+    for file_info in files:
+        if "detections" in file_info.get("analyses", all_analyses):
+            detected_files.append(file_info)
+            continue
+        try:
+            read_file(file_info)
+        except Exception as e:
+            errors.append((file_info["mediaID"], str(e)))
+
+    seconds_before = seconds["read"] + seconds["analyze"]
+    detections, timing = species_detection_batch(
+        detected_files, batch_size, prescreen, read_windows
+    )
+    timing["errors"] = errors + timing["errors"]
+    # Inference time excludes the other analyses
+    timing["inference"] -= seconds["read"] + seconds["analyze"] - seconds_before
+    return results, detections, {**timing, **seconds}
@@ -11,10 +11,11 @@ import pandas as pd
 import logging
 import numpy as np
 from pamflow.datasets.pamDP.deployments import deployments_pamdp_columns
+from pamflow.pipelines.data_preparation.utils import scan_media_headers
 
 logger = logging.getLogger(__name__)
 
-def get_media_file(input_path, field_deployments_sheet, timezone):
+def get_media_file(input_path, field_deployments_sheet, timezone, scan_settings=None):
     """Retrieves and processes metadata from media files in the given directory.
 
     Parameters
@@ -26,6 +27,19 @@ def get_media_file(input_path, field_deployments_sheet, timezone):
     field_deployments_sheet : pandas.DataFrame
         A DataFrame containing user-provided deployments information. Loaded from the catalog
         entry `field_deployments_sheet@pandas`.
+    timezone : str
+        IANA time zone of the timestamps in the file names. Passed as `params:timezone`.
+    scan_settings : dict, optional
+        Options to read the files, passed as `params:media_scan`. Supported keys:
+
+        - `engine` (str, default 'maad'): 'maad' reads the files with
+          `maad.util.get_metadata_dir`, one after another. 'pamflow' lists each
+          deployment folder with os.scandir and reads only the WAV chunk headers
+          on a thread pool (see `scan_media_headers`). Both give the same media.
+        - `n_threads` (int, default 16): number of threads reading headers
+          (engine 'pamflow').
+        - `read_comments` (bool, default True): store the AudioMoth comment and
+          the GUANO metadata of each file in `mediaComments` (engine 'pamflow').
 
 
     Returns
@@ -60,8 +74,26 @@ def get_media_file(input_path, field_deployments_sheet, timezone):
                 "found on Field Deployments Sheet, won't be fully processed because they have no corresponding folder "
                 "on Audio Root Directory."
             )
-    metadata = util.get_metadata_dir(input_path, False)
-    metadata.dropna(inplace=True)  # remove problematic files
+    scan_settings = scan_settings or {}
+    engine = scan_settings.get("engine", "maad")
+    if engine == "pamflow":
+        metadata = scan_media_headers(
+            input_path,
+            scan_settings.get("n_threads", 16),
+            scan_settings.get("read_comments", True),
+        )
+    elif engine == "maad":
+        metadata = util.get_metadata_dir(input_path, False)
+    else:
+        raise ValueError(f"Unknown media scan engine '{engine}', use 'pamflow' or 'maad'.")
+    # remove problematic files
+    n_files = metadata.shape[0]
+    metadata = metadata.dropna(subset=metadata.columns.drop("comment", errors="ignore"))
+    if metadata.shape[0] < n_files:
+        logger.warning(
+            f"{n_files - metadata.shape[0]} files were skipped as they are not readable WAV files "
+            "or their name does not follow the format SITENAME_YYYYMMDD_HHMMSS.WAV."
+        )
     columns_names_dict = {
         "path_audio": "filePath",
         "fname": "mediaID",
@@ -75,7 +107,7 @@ def get_media_file(input_path, field_deployments_sheet, timezone):
     media = metadata.rename(columns=columns_names_dict)
     media["fileName"] = media["filePath"].str.split(os.sep).str[-1]
     media["fileMediatype"] = "audio/WAV"
-    media["mediaComments"] = None
+    media["mediaComments"] = media.pop("comment") if "comment" in media.columns else None
     media["favorite"] = None
     media["filePublic"] = False  
     media["captureMethod"] = "activityDetection"
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilitary functions to build the inventory of media files from the headers of WAV files
+
+"""
+
+import os
+import struct
+import itertools
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+# Format codes of the fmt chunk read by the scanner
+WAVE_FORMAT_PCM = 0x0001
+
+# Columns of maad.util.get_metadata_dir
+METADATA_COLUMNS = [
+    "path_audio",
+    "fname",
+    "sample_rate",
+    "channels",
+    "bits",
+    "samples",
+    "length",
+    "fsize",
+    "sensor_name",
+    "date",
+    "time",
+]
+
+
+def read_wav_header(path_audio, read_comments=True):
+    """Reads the format of a WAV file from its chunk headers, without reading the audio.
+
+    Only the RIFF header and the `fmt `, `data`, `LIST` and `guan` chunks are parsed;
+    other chunks and the audio samples are skipped with a seek. Values are the ones
+    returned by `maad.util.audio_header` (from the `wave` module).
+
+    Parameters
+    ----------
+    path_audio : str
+        Path to the WAV file.
+    read_comments : bool, optional
+        If True (default), the chunks after the audio samples are also parsed to
+        find the comment (`ICMT` of the `LIST` `INFO` chunk, written by AudioMoth)
+        and the GUANO metadata (`guan` chunk). If False, the scan stops at the
+        `data` chunk.
+
+    Returns
+    -------
+    dict
+        `sample_rate`, `channels`, `bits`, `samples`, `fsize` and `comment` (the
+        comment and the GUANO metadata joined by a line break, None if the file
+        has none).
+
+    Raises
+    ------
+    ValueError
+        If the file is not a PCM RIFF WAVE file. As with the `wave` module used by
+        `maad.util.audio_header`, floating point and extensible formats are rejected.
+    """
+    with open(path_audio, "rb") as f:
+        fsize = os.fstat(f.fileno()).st_size
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+            raise ValueError(f"{path_audio} is not a RIFF WAVE file.")
+
+        fmt = None
+        data_size = None
+        comments = []
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    raise ValueError(f"Truncated fmt chunk in {path_audio}.")
+                fmt = struct.unpack("<HHIIHH", body[:16])
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"data chunk before fmt chunk in {path_audio}.")
+                data_size = size
+                if not read_comments:
+                    break
+                f.seek(size, os.SEEK_CUR)
+            elif read_comments and chunk_id == b"LIST":
+                comments.extend(_info_comments(f.read(size)))
+            elif read_comments and chunk_id == b"guan":
+                comments.append(_decode_text(f.read(size)))
+            else:
+                f.seek(size, os.SEEK_CUR)
+            # Chunks are aligned on 2 bytes
+            if size % 2:
+                f.seek(1, os.SEEK_CUR)
+
+    if fmt is None or data_size is None:
+        raise ValueError(f"Missing fmt or data chunk in {path_audio}.")
+    format_tag, channels, sample_rate, _, _, bits = fmt
+    if format_tag != WAVE_FORMAT_PCM:
+        raise ValueError(f"Unsupported WAVE format {format_tag:#06x} in {path_audio}.")
+    sample_width = (bits + 7) // 8
+    if channels == 0 or sample_rate == 0 or sample_width == 0:
+        raise ValueError(f"Invalid fmt chunk in {path_audio}.")
+    comments = [comment for comment in comments if comment]
+    return {
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "bits": sample_width * 8,
+        "samples": data_size // (channels * sample_width),
+        "fsize": fsize,
+        "comment": "\n".join(comments) if comments else None,
+    }
+
+
+def _info_comments(body):
+    """Comments (ICMT) of the body of a LIST chunk, if it is an INFO list."""
+    if body[:4] != b"INFO":
+        return []
+    comments = []
+    position = 4
+    while position + 8 <= len(body):
+        chunk_id, size = struct.unpack("<4sI", body[position : position + 8])
+        if chunk_id == b"ICMT":
+            comments.append(_decode_text(body[position + 8 : position + 8 + size]))
+        position += 8 + size + size % 2
+    return comments
+
+
+def _decode_text(body):
+    """Text of a chunk, without the trailing null bytes."""
+    return body.decode("utf-8", errors="replace").rstrip("\x00").strip()
+
+
+def parse_file_name(fname):
+    """Reads the sensor name, date and time of a file named SITENAME_YYYYMMDD_HHMMSS.WAV.
+
+    The name is checked with the rules of `maad.util.check_file_format`.
+
+    Parameters
+    ----------
+    fname : str
+        Name of the file.
+
+    Returns
+    -------
+    tuple or None
+        The sensor name, the date and time as a pandas.Timestamp and the time as
+        'HHMMSS', or None if the name does not follow the format.
+    """
+    fields = fname.split("_")
+    if len(fields) != 3:
+        return None
+    sensor_name, date_str, time_str = fields
+    if (
+        len(date_str) != 8
+        or len(time_str) != 10
+        or not date_str.isnumeric()
+        or not time_str[:-4].isnumeric()
+    ):
+        return None
+    try:
+        date = pd.Timestamp(
+            f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]} "
+            f"{time_str[:2]}:{time_str[2:4]}:{time_str[4:6]}"
+        )
+    except ValueError:
+        return None
+    return sensor_name, date, time_str[:6]
+
+
+def list_wav_files(path_dir):
+    """Lists the WAV files of a folder and its subfolders with os.scandir.
+
+    Hidden files and folders are skipped, as `glob` does in
+    `maad.util.get_metadata_dir`.
+
+    Parameters
+    ----------
+    path_dir : str
+        Folder to scan.
+
+    Returns
+    -------
+    list of str
+        Paths of the files with a .wav extension, in any case.
+    """
+    files = []
+    folders = [path_dir]
+    while folders:
+        with os.scandir(folders.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    folders.append(entry.path)
+                elif entry.name.lower().endswith(".wav"):
+                    files.append(entry.path)
+    return files
+
+
+def get_file_metadata(path_audio, read_comments=True):
+    """Metadata of a WAV file, as `maad.util.get_metadata_file`, read from its header.
+
+    Parameters
+    ----------
+    path_audio : str
+        Path to the WAV file.
+    read_comments : bool, optional
+        Read the comment and GUANO chunks, see `read_wav_header`.
+
+    Returns
+    -------
+    dict
+        The columns of `maad.util.get_metadata_dir` and the `comment` of the file.
+        Unreadable files have null values except for their path and name, and files
+        whose name does not follow SITENAME_YYYYMMDD_HHMMSS.WAV have a null sensor
+        name, date and time.
+    """
+    path_audio = path_audio.replace("\\", "/")  # as maad, for compatibility with Windows
+    metadata = dict.fromkeys(METADATA_COLUMNS + ["comment"], np.nan)
+    metadata.update(path_audio=path_audio, fname=os.path.basename(path_audio), comment=None)
+    try:
+        header = read_wav_header(path_audio, read_comments)
+    except (OSError, ValueError, struct.error):
+        return metadata
+    metadata.update(header)
+    metadata["length"] = header["samples"] / header["sample_rate"]
+    name_info = parse_file_name(metadata["fname"])
+    if name_info is not None:
+        metadata["sensor_name"], metadata["date"], metadata["time"] = name_info
+    return metadata
+
+
+def scan_media_headers(path_dir, n_threads=16, read_comments=True):
+    """Builds the metadata of the WAV files of a folder from their headers, in parallel.
+
+    Replaces `maad.util.get_metadata_dir`: each deployment folder is listed with
+    os.scandir and only the chunk headers of each file are read (see
+    `read_wav_header`), on a thread pool. Reading headers is bound by the latency
+    of the disk or the network share, so many more threads than cores can be used.
+
+    Parameters
+    ----------
+    path_dir : str
+        Folder containing a folder for each deployment. WAV files of the folder and
+        of all its subfolders are read.
+    n_threads : int, optional
+        Number of threads listing folders and reading headers. The default is 16.
+    read_comments : bool, optional
+        Read the comment and GUANO chunks, see `read_wav_header`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per file, sorted by path, with the columns of
+        `maad.util.get_metadata_dir` and the `comment` of each file.
+    """
+    if not os.path.isdir(path_dir):
+        raise ValueError(f"'{path_dir}' does not exist as a directory.")
+    # Paths are built as maad builds them from the folder
+    path_dir = os.path.normpath(path_dir)
+    with os.scandir(path_dir) as entries:
+        entries = [entry for entry in entries if not entry.name.startswith(".")]
+    folders = [entry.path for entry in entries if entry.is_dir()]
+    files = [
+        entry.path for entry in entries if not entry.is_dir() and entry.name.lower().endswith(".wav")
+    ]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+        files.extend(itertools.chain.from_iterable(executor.map(list_wav_files, folders)))
+        files.sort()
+        rows = list(
+            executor.map(lambda path_audio: get_file_metadata(path_audio, read_comments), files)
+        )
+    return pd.DataFrame(rows, columns=METADATA_COLUMNS + ["comment"])
@@ -12,6 +12,7 @@ import statsmodels.api as sm
 from statsmodels.formula.api import glm
 import concurrent.futures
 from maad import sound, util
+from pamflow.utils import as_completed_bounded
 import matplotlib.pyplot as plt
 
 
@@ -63,17 +64,19 @@ def spectrograms_single_species(species, file_names_list, plot_params):
     spectrogram_list = []
 
     with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
-        # Use submit for each task
-        futures = [
-            executor.submit(single_spectrogram, species, segment_file_name, plot_params)
+        # Submit segments as workers become available
+        tasks = (
+            (segment_file_name, (species, segment_file_name, plot_params))
             for segment_file_name in file_names_list
-        ]
+        )
 
         # Get results when tasks are completed
 
         i = 0
 
-        for future in concurrent.futures.as_completed(futures):
+        for _, future in as_completed_bounded(
+            executor, single_spectrogram, tasks, 2 * n_jobs
+        ):
             try:
                 result = future.result()
 
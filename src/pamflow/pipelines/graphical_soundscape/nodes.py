@@ -13,6 +13,10 @@ from maad.features import graphical_soundscape as graphical_soundscape_maad
 from maad.features import plot_graph
 import matplotlib.pyplot as plt
 import logging
+from pamflow.pipelines.graphical_soundscape.utils import (
+    PeakDensityCache,
+    graphical_soundscape_by_group,
+)
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -34,7 +38,15 @@ def graphical_soundscape_pamflow(media, graphical_soundscape_parameters):
     graphical_soundscape_parameters : dict
         A dictionary containing parameters for generating graphical soundscapes, such as
         `threshold_abs`, `target_fs`, `nperseg`, `noverlap`, `db_range`, `min_distance`,
-        and `n_jobs`. Passed as `params:graphical_soundscape_parameters`.
+        `n_jobs`, `precision`, `engine`, `files_per_task`, `cache_path` and
+        `signal_store`. Passed as
+        `params:graphical_soundscape_parameters`. With `engine: pamflow` (default), the
+        files of all deployments are processed on a single process pool, in tasks of
+        `files_per_task` files, and the peak density of each file is kept in the
+        cache at `cache_path` (if not null). With `engine: maad`, the reference
+        implementation `maad.features.graphical_soundscape` computes each deployment
+        one after another; it only supports `precision: float64` and does not use
+        `files_per_task`, `cache_path` nor `signal_store`.
 
     Returns
     -------
@@ -50,10 +62,106 @@ def graphical_soundscape_pamflow(media, graphical_soundscape_parameters):
     db_range = graphical_soundscape_parameters["db_range"]
     min_distance = graphical_soundscape_parameters["min_distance"]
     n_jobs = graphical_soundscape_parameters["n_jobs"]
+    precision = graphical_soundscape_parameters.get("precision", "float64")
+    engine = graphical_soundscape_parameters.get("engine", "pamflow")
+    files_per_task = graphical_soundscape_parameters.get("files_per_task", 8)
+    cache_path = graphical_soundscape_parameters.get("cache_path")
+    signal_store = graphical_soundscape_parameters.get("signal_store")
+    if engine not in ("pamflow", "maad"):
+        raise ValueError(f"Unknown graphical soundscape engine '{engine}', use 'pamflow' or 'maad'.")
+    if engine == "maad":
+        if precision != "float64":
+            raise ValueError("engine: maad only supports precision: float64.")
+        unused = [
+            name
+            for name, value in [
+                ("cache_path", cache_path),
+                ("signal_store", (signal_store or {}).get("path")),
+            ]
+            if value is not None
+        ]
+        if unused:
+            logger.warning(f"{', '.join(unused)} not used by the graphical soundscape engine maad.")
     media["date"] = pd.to_datetime(media.timestamp)
     media["time"] = media.date.dt.hour
     media = media[media["fileLength"] > 0]
 
+    cache = None
+    if engine == "pamflow":
+        logger.info(
+            f"Computing graphical soundscapes for {media['deploymentID'].nunique()} deployments "
+            f"({media.shape[0]} files)"
+        )
+        # Files already computed with the same peak detection parameters are not read again
+        if cache_path is not None:
+            cache = PeakDensityCache(
+                cache_path,
+                {
+                    "target_fs": target_fs,
+                    "nperseg": nperseg,
+                    "noverlap": noverlap,
+                    "db_range": db_range,
+                    "min_distance": min_distance,
+                    "threshold_abs": threshold_abs,
+                    "precision": precision,
+                },
+            )
+        graphs = graphical_soundscape_by_group(
+            media,
+            threshold_abs,
+            "deploymentID",
+            "filePath",
+            "time",
+            target_fs,
+            nperseg,
+            noverlap,
+            db_range,
+            min_distance,
+            n_jobs,
+            precision,
+            files_per_task,
+            cache=cache,
+            signal_store=signal_store,
+        )
+    else:
+        graphs = _graphical_soundscape_by_deployment(
+            media,
+            threshold_abs,
+            target_fs,
+            nperseg,
+            noverlap,
+            db_range,
+            min_distance,
+            n_jobs,
+        )
+
+    try:
+        for deployment, df_out in graphs:
+            # Plot graphical soundscape
+            fig, ax = plt.subplots()
+            plot_graph(df_out, savefig=False, ax=ax)
+
+            # Save graph and figure as Partitioned Dataset
+            yield {f'graph_{deployment}': df_out},  {f'graph_{deployment}': fig}
+
+            # Close the plot to free up memory
+            plt.close(fig)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def _graphical_soundscape_by_deployment(
+    media,
+    threshold_abs,
+    target_fs,
+    nperseg,
+    noverlap,
+    db_range,
+    min_distance,
+    n_jobs,
+):
+    """Yields the graphical soundscape of each deployment, computed one after another by maad."""
     # Compute graphical soundscapes by deploymentID
     for deployment, media_gp in media.groupby('deploymentID'):
         logger.info(f"Computing graphical soundscapes for {deployment} ({media_gp.shape[0]} files)")
@@ -72,13 +180,4 @@ def graphical_soundscape_pamflow(media, graphical_soundscape_parameters):
             n_jobs,
             verbose=False,
         )
-        
-        # Plot graphical soundscape
-        fig, ax = plt.subplots()
-        plot_graph(df_out, savefig=False, ax=ax)
-
-        # Save graph and figure as Partitioned Dataset
-        yield {f'graph_{deployment}': df_out},  {f'graph_{deployment}': fig}
-
-        # Close the plot to free up memory
-        plt.close(fig)
+        yield deployment, df_out
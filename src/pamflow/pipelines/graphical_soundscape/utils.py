@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Graphical soundscape computation. The functions follow
+maad.features.graphical_soundscape, with a configurable floating point precision.
+`graphical_soundscape_by_group` computes the graphical soundscapes of many groups
+of files (e.g. deployments) on a single process pool, detecting the spectrogram
+peaks of several files at once. The peak density of each file can be kept in a
+`PeakDensityCache`, so that new recordings update the graphs without reading the
+old ones again.
+
+"""
+
+import os
+import json
+import logging
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from scipy.spatial import cKDTree
+from maad import sound, util, rois
+from pamflow.utils import (
+    FileResultsStore,
+    as_completed_bounded,
+    load_audio,
+    open_signal_store,
+    precision_dtype,
+    resample,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def spectrogram_dB(
+    path_audio, target_fs, nperseg, noverlap, db_range, precision="float64", signal_store=None
+):
+    """
+    Load, resample and transform an audio file into a power spectrogram in decibels,
+    as maad.features.graphical_soundscape does.
+    Parameters
+    ----------
+    path_audio : str
+        Path to the audio file.
+    target_fs, nperseg, noverlap, db_range, precision, signal_store :
+        See `spectral_peak_density`.
+    Returns
+    -------
+    Sxx_db : 2d numpy array
+        Spectrogram in decibels (frequency, time).
+    tn : 1d numpy array
+        Time vector of the spectrogram.
+    fn : 1d numpy array
+        Frequency vector of the spectrogram.
+    ext : list
+        Extent of the spectrogram, for plotting.
+    """
+    dtype = precision_dtype(precision)
+    store = open_signal_store(signal_store)
+    if store is None:
+        s, fs = load_audio(path_audio, dtype)
+        s = resample(s, fs, target_fs)
+    else:
+        # Same resampler as the acoustic indices, so both read the same stored signals
+        s = store.load(path_audio, target_fs, resample, "pamflow.utils.resample", dtype)
+    return signal_spectrogram_dB(s, target_fs, nperseg, noverlap, db_range)
+
+
+def signal_spectrogram_dB(s, fs, nperseg, noverlap, db_range):
+    """Power spectrogram in decibels of a signal, see `spectrogram_dB`."""
+    Sxx, tn, fn, ext = sound.spectrogram(s, fs, nperseg=nperseg, noverlap=noverlap)
+    # Zeros are below the smallest float32 and give -inf before clipping to db_range
+    with np.errstate(divide="ignore"):
+        Sxx_db = util.power2dB(Sxx, db_range=db_range)
+    return Sxx_db, tn, fn, ext
+
+
+def check_threshold(Sxx_db, threshold_abs):
+    """Raise the error of maad.rois.spectrogram_local_max for a threshold below the spectrogram."""
+    if threshold_abs is not None and threshold_abs < Sxx_db.min():
+        raise ValueError("Value for minimum peak amplitude is below minimum value on spectrogram")
+
+
+def peak_density_frame(count_peak, tn, fn, path_audio):
+    """One row pd.DataFrame with the peak density of each frequency bin of a file."""
+    peak_density = pd.Series(index=fn, data=count_peak / len(tn), name=os.path.basename(path_audio))
+    return peak_density.to_frame().T
+
+
+def mean_peak_density(results, time_dtype=None):
+    """
+    Mean peak density of each frequency bin by time of a group of files.
+    Parameters
+    ----------
+    results : list of tuple
+        `(path_audio, time, peak_density)` of each file of the group, in any order.
+    time_dtype : numpy.dtype, optional
+        Type of the time column of the media, kept by the index of the result as
+        in `graphical_soundscape`.
+    Returns
+    -------
+    pd.DataFrame
+        The graphical soundscape of the group, as `graphical_soundscape`.
+    """
+    # Files in path order, as graphical_soundscape, whatever the completion order
+    results = sorted(results, key=lambda result: result[0])
+    res = pd.concat([peak_density for _, _, peak_density in results])
+    res["time"] = np.asarray([file_time for _, file_time, _ in results], dtype=time_dtype)
+    return res.groupby("time").mean()
+
+
+def spectral_peak_density(
+    path_audio,
+    target_fs,
+    nperseg,
+    noverlap,
+    db_range,
+    min_distance,
+    threshold_abs,
+    precision="float64",
+    signal_store=None,
+):
+    """
+    Computes the spectral peak density of an audio file, the number of peaks per time
+    step within each frequency bin, as maad.features.graphical_soundscape does.
+    Parameters
+    ----------
+    path_audio : str
+        Path to the audio file.
+    target_fs : int
+        The target sample rate to resample the audio signal if needed.
+    nperseg : int
+        Window length of each segment to compute the spectrogram.
+    noverlap : int
+        Number of samples to overlap between segments to compute the spectrogram.
+    db_range : float
+        Dynamic range of the computed spectrogram.
+    min_distance : int
+        Minimum number of indices separating peaks.
+    threshold_abs : float
+        Minimum amplitude threshold for peak detection in decibels.
+    precision : str
+        Floating point type of the signal and the spectrogram, 'float64' (as maad)
+        or 'float32'.
+    signal_store : dict, optional
+        Parameters of the `SignalStore` (`path` and `max_size_gb`) the resampled
+        signal is read from, or added to. None reads the audio file.
+    Returns
+    -------
+    peak_density : pd.DataFrame
+        One row with the peak density of each frequency bin.
+    """
+    Sxx_db, tn, fn, ext = spectrogram_dB(
+        path_audio, target_fs, nperseg, noverlap, db_range, precision, signal_store
+    )
+
+    # Compute local max
+    _, peak_freq = rois.spectrogram_local_max(Sxx_db, tn, fn, ext, min_distance, threshold_abs)
+
+    # Compute peak density (number of peaks / time steps)
+    freq_idx, count_freq = np.unique(peak_freq, return_counts=True)
+    count_peak = np.zeros(fn.shape)
+    count_peak[np.isin(fn, freq_idx)] = count_freq
+    return peak_density_frame(count_peak, tn, fn, path_audio)
+
+
+def graphical_soundscape(
+    data,
+    threshold_abs,
+    path_audio="filePath",
+    time="time",
+    target_fs=48000,
+    nperseg=256,
+    noverlap=128,
+    db_range=80,
+    min_distance=1,
+    n_jobs=1,
+    precision="float64",
+    signal_store=None,
+):
+    """
+    Computes a graphical soundscape from a DataFrame of audio files.
+    Equivalent to maad.features.graphical_soundscape, with the number of processes
+    limited to `n_jobs` and a configurable floating point precision.
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Audio files, with the columns `path_audio` and `time`.
+    threshold_abs : float
+        Minimum amplitude threshold for peak detection in decibels.
+    path_audio : str
+        Column name where the full path of audio is provided.
+    time : str
+        Column name where the time (e.g. the hour) of each file is provided.
+    target_fs, nperseg, noverlap, db_range, min_distance :
+        See `spectral_peak_density`.
+    n_jobs : int
+        Number of processes. -1 uses all the cores available.
+    precision : str
+        Floating point type, 'float64' or 'float32'.
+    signal_store : dict, optional
+        See `spectral_peak_density`.
+    Returns
+    -------
+    pd.DataFrame
+        The mean peak density of each frequency bin (columns) for each time (rows).
+    """
+    precision_dtype(precision)
+    df = data.sort_values(by=path_audio)
+    args = (
+        target_fs, nperseg, noverlap, db_range, min_distance, threshold_abs, precision, signal_store
+    )
+    if n_jobs == 1:
+        results = [spectral_peak_density(path, *args) for path in df[path_audio]]
+    else:
+        max_workers = os.cpu_count() if n_jobs == -1 else n_jobs
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    spectral_peak_density, df[path_audio], *[[arg] * len(df) for arg in args]
+                )
+            )
+
+    res = pd.concat(results)
+    res["time"] = df[time].values
+    return res.groupby("time").mean()
+
+
+def _ensure_spacing(peaks, Sxx_db, min_distance):
+    """
+    Remove the peaks closer than `min_distance` to a higher peak, keeping the
+    first one in raster order among equal peaks, as skimage.feature.peak_local_max.
+    Only peaks of equal value (plateaus) can be that close, since every peak is the
+    maximum of its neighbourhood.
+    """
+    coord = np.transpose(np.nonzero(peaks))
+    if len(coord) < 2:
+        return peaks
+    # Chebyshev distances between integer coordinates below min_distance
+    pairs = cKDTree(coord).query_pairs(r=min_distance - 1, p=np.inf, output_type="ndarray")
+    if len(pairs) == 0:
+        return peaks
+
+    neighbours = {}
+    for i, j in pairs:
+        neighbours.setdefault(i, []).append(j)
+        neighbours.setdefault(j, []).append(i)
+    rejected = set()
+    # Highest peaks first, in raster order among equal values
+    for idx in np.argsort(-Sxx_db[peaks], kind="stable"):
+        if idx not in rejected:
+            rejected.update(neighbours.get(idx, []))
+    peaks = peaks.copy()
+    peaks[tuple(coord[list(rejected)].T)] = False
+    return peaks
+
+
+def local_max_peak_counts(Sxx_db, min_distance, threshold_abs):
+    """
+    Count the spectrogram peaks in each frequency bin of a stack of spectrograms.
+    Peaks are the points that are the maximum of their neighbourhood of
+    `2 * min_distance + 1` bins, above `threshold_abs` and at least `min_distance`
+    bins away from the borders, as detected by maad.rois.spectrogram_local_max. The
+    maximum filter is applied to all the spectrograms at once.
+    Parameters
+    ----------
+    Sxx_db : 3d numpy array
+        Spectrograms in decibels (files, frequency, time).
+    min_distance : int
+        Minimum number of indices separating peaks.
+    threshold_abs : float
+        Minimum amplitude of the peaks in decibels.
+    Returns
+    -------
+    2d numpy array
+        Number of peaks of each file (rows) in each frequency bin (columns).
+    """
+    if threshold_abs is None:
+        threshold = np.min(Sxx_db, axis=(1, 2), keepdims=True)
+    else:
+        threshold = threshold_abs
+    if min_distance < 1:
+        peaks = Sxx_db > threshold
+    else:
+        size = 2 * min_distance + 1
+        Sxx_max = ndimage.maximum_filter(Sxx_db, size=(1, size, size), mode="nearest")
+        peaks = Sxx_db == Sxx_max
+        # Constant spectrograms have no peaks
+        peaks[np.all(peaks, axis=(1, 2))] = False
+        peaks &= Sxx_db > threshold
+        peaks[:, :min_distance, :] = False
+        peaks[:, -min_distance:, :] = False
+        peaks[:, :, :min_distance] = False
+        peaks[:, :, -min_distance:] = False
+        if min_distance > 1:
+            for i in range(peaks.shape[0]):
+                peaks[i] = _ensure_spacing(peaks[i], Sxx_db[i], min_distance)
+    return np.sum(peaks, axis=2)
+
+
+def spectral_peak_density_batch(
+    paths_audio,
+    target_fs,
+    nperseg,
+    noverlap,
+    db_range,
+    min_distance,
+    threshold_abs,
+    precision="float64",
+    signal_store=None,
+):
+    """
+    Compute the spectral peak density of several audio files at once.
+    Files are transformed one by one and their spectrograms are stacked for every
+    group of files of the same duration, so the peaks of the stack are detected
+    with a single maximum filter. Results are equal to `spectral_peak_density`.
+    Parameters
+    ----------
+    paths_audio : list of str
+        Paths to the audio files.
+    target_fs, nperseg, noverlap, db_range, min_distance, threshold_abs, precision,
+    signal_store :
+        See `spectral_peak_density`.
+    Returns
+    -------
+    list of tuple
+        One `(peak_density, n_frames, error)` tuple per file, in the order of
+        `paths_audio`. `peak_density` is a one row pd.DataFrame (None if the file
+        could not be processed), `n_frames` the number of spectrogram frames and
+        `error` the error message or None.
+    """
+    results = [None] * len(paths_audio)
+    stacks = {}
+    for position, path_audio in enumerate(paths_audio):
+        try:
+            Sxx_db, tn, fn, _ = spectrogram_dB(
+                path_audio, target_fs, nperseg, noverlap, db_range, precision, signal_store
+            )
+            check_threshold(Sxx_db, threshold_abs)
+        except Exception as e:
+            results[position] = (None, 0, str(e))
+            continue
+        stacks.setdefault(Sxx_db.shape, []).append((position, path_audio, Sxx_db, tn, fn))
+
+    for files in stacks.values():
+        counts = local_max_peak_counts(
+            np.stack([Sxx_db for _, _, Sxx_db, _, _ in files]), min_distance, threshold_abs
+        )
+        for (position, path_audio, _, tn, fn), count_peak in zip(files, counts):
+            results[position] = (peak_density_frame(count_peak, tn, fn, path_audio), len(tn), None)
+    return results
+
+
+class PeakDensityCache(FileResultsStore):
+    """
+    Persistent cache of the spectral peak density of each media file.
+    Each file is stored with its frequency bins, its number of spectrogram frames
+    and the peak density of each bin (the number of peaks divided by the number of
+    frames), see `pamflow.utils.FileResultsStore`. The time of the files is not
+    stored, so graphs can be binned differently (e.g. by hour or by period of the
+    day) without reading the audio again.
+    Parameters
+    ----------
+    path : str
+        Location of the SQLite database. Parent folders are created if needed.
+    params : dict
+        Parameters of the peak detection: `target_fs`, `nperseg`, `noverlap`,
+        `db_range`, `min_distance`, `threshold_abs` and `precision`.
+    """
+
+    payload_columns = {"frequencies": "TEXT", "nFrames": "INTEGER", "peakDensity": "TEXT"}
+
+    def decode_payload(self, file, payload):
+        """Peak density of a cached file, a one row pd.DataFrame as returned by
+        `spectral_peak_density`."""
+        frequencies, _, density = payload
+        peak_density = pd.Series(
+            index=json.loads(frequencies),
+            data=json.loads(density),
+            name=os.path.basename(file["filePath"]),
+        )
+        return peak_density.to_frame().T
+
+    def record(self, file, peak_density, n_frames):
+        """
+        Store the peak density computed for a file.
+        Parameters
+        ----------
+        file : dict
+            Media row, as returned by `split_files`.
+        peak_density : pd.DataFrame
+            Peak density of the file, as returned by `spectral_peak_density`.
+        n_frames : int
+            Number of spectrogram frames of the file.
+        """
+        payload = (
+            json.dumps(peak_density.columns.tolist()),
+            int(n_frames),
+            json.dumps(peak_density.iloc[0].tolist()),
+        )
+        self.write([(file, payload)])
+
+    def to_frame(self):
+        """
+        Returns the peak density of every file cached with the current parameters.
+        Returns
+        -------
+        pd.DataFrame
+            One row per file, indexed by mediaID, with the number of spectrogram
+            frames (`nFrames`) and the peak density of each frequency bin. The number
+            of peaks is the density multiplied by `nFrames`.
+        """
+        rows = {}
+        for media_id, (frequencies, n_frames, density) in self.payloads():
+            rows[media_id] = pd.Series(
+                [n_frames, *json.loads(density)], index=["nFrames", *json.loads(frequencies)]
+            )
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def graphical_soundscape_by_group(
+    data,
+    threshold_abs,
+    group_column="deploymentID",
+    path_audio="filePath",
+    time="time",
+    target_fs=48000,
+    nperseg=256,
+    noverlap=128,
+    db_range=80,
+    min_distance=1,
+    n_jobs=-1,
+    precision="float64",
+    files_per_task=8,
+    max_in_flight=None,
+    cache=None,
+    signal_store=None,
+):
+    """
+    Compute the graphical soundscape of each group of audio files (e.g. each
+    deployment) on a single process pool.
+    Files of every group are scheduled on the same pool, in tasks of
+    `files_per_task` files computed with `spectral_peak_density_batch`, so workers
+    keep busy across groups instead of waiting for the smallest groups to finish.
+    The graphical soundscape of a group is yielded as soon as its last file is
+    processed. As maad.features.graphical_soundscape, the computation stops with
+    an error when a file can not be processed; the files already computed are kept
+    in the cache.
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Audio files, with the columns `group_column`, `path_audio` and `time`, and
+        `mediaID` if a cache is used.
+    threshold_abs, path_audio, time, target_fs, nperseg, noverlap, db_range,
+    min_distance, precision, signal_store :
+        See `graphical_soundscape`.
+    group_column : str
+        Column of `data` defining the groups.
+    n_jobs : int
+        Number of processes. -1 uses all the cores available.
+    files_per_task : int
+        Number of files sent to a worker at once.
+    max_in_flight : int, optional
+        Maximum number of tasks submitted to the pool and not processed yet.
+        Defaults to twice the number of processes.
+    cache : PeakDensityCache, optional
+        Cache of peak densities. Cached files are not read again and computed files
+        are added to it. The graph of a group combines both.
+    Yields
+    ------
+    tuple
+        The group value and a pd.DataFrame with the mean peak density of each
+        frequency bin (columns) for each time (rows), as `graphical_soundscape`.
+    """
+    precision_dtype(precision)
+    if files_per_task < 1:
+        raise ValueError("files_per_task must be a positive integer.")
+    max_workers = os.cpu_count() if n_jobs == -1 else n_jobs
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+
+    # Files are submitted group after group, so groups complete in order
+    df = data.sort_values(by=[group_column, path_audio], kind="stable")
+    columns = [group_column, path_audio, time] + (["mediaID"] if cache is not None else [])
+    files = df[columns].to_dict(orient="records")
+    results = {group: [] for group in pd.unique(df[group_column])}
+    if cache is not None:
+        files, cached = cache.split_files(
+            [{**file, "filePath": file[path_audio]} for file in files]
+        )
+        for file in df[columns].to_dict(orient="records"):
+            if file["mediaID"] in cached:
+                results[file[group_column]].append(
+                    (file[path_audio], file[time], cached[file["mediaID"]])
+                )
+        logger.info(
+            f"Peak density cache {cache.path}: {len(cached)} files cached, "
+            f"{len(files)} new or changed files to compute."
+        )
+    remaining = {}
+    for file in files:
+        remaining[file[group_column]] = remaining.get(file[group_column], 0) + 1
+    args = (
+        target_fs, nperseg, noverlap, db_range, min_distance, threshold_abs, precision, signal_store
+    )
+
+    def reduce_group(group):
+        """Mean peak density by time of the files of a group."""
+        return mean_peak_density(results.pop(group), df[time].dtype)
+
+    # Groups without files to compute are complete
+    for group in list(results):
+        if group not in remaining:
+            yield group, reduce_group(group)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        chunks = (
+            files[start : start + files_per_task] for start in range(0, len(files), files_per_task)
+        )
+        tasks = ((chunk, ([file[path_audio] for file in chunk], *args)) for chunk in chunks)
+        for chunk, future in as_completed_bounded(
+            executor, spectral_peak_density_batch, tasks, max_in_flight
+        ):
+            try:
+                outcomes = future.result()
+            except Exception as e:
+                outcomes = [(None, 0, str(e))] * len(chunk)
+
+            for file, (peak_density, n_frames, error) in zip(chunk, outcomes):
+                group = file[group_column]
+                if error is None:
+                    results[group].append((file[path_audio], file[time], peak_density))
+                    if cache is not None:
+                        cache.record(file, peak_density, n_frames)
+                else:
+                    raise ValueError(
+                        f"Error computing the peak density of {file[path_audio]}: {error}"
+                    )
+
+                remaining[group] -= 1
+                if remaining[group] == 0:
+                    yield group, reduce_group(group)
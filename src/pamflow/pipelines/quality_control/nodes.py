@@ -436,7 +436,7 @@ def get_timelapse(
 
     plot_params : dict
         A dictionary containing parameters for the spectrogram plot, such as
-        `nperseg`, `noverlap`, `db_range`, `fig_width`, and `fig_height`. Loaded
+        `nperseg`, `noverlap`, `db_range`, `fig_width`, `fig_height` and `precision`. Loaded
         from the catalog entry `plot_params@dict`.
 
     Yields
@@ -484,6 +484,7 @@ def get_timelapse(
     height = plot_params["fig_height"]
     colormap = plot_params["colormap"]
     flims = plot_params["flims"]
+    precision = plot_params.get("precision", "float64")
     
     # Mix timelapse
     logger.info(f"Processing audio timelapse for {ngroups} devices:")
@@ -499,6 +500,7 @@ def get_timelapse(
         long_wav, fs = concat_audio(
             df_site["filePath"],
             sample_len=sample_len,
+            precision=precision,
         )
 
         # Plot spectrogram
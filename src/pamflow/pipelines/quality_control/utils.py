@@ -7,13 +7,13 @@ Utilitary functions to manage, check and preprocess large sampling data assiciat
 
 import os
 import numpy as np
-from maad import sound
+from pamflow.utils import normalize_audio, open_wav, precision_dtype, read_wav_segment
 
 # ----------------------------------
 # Main Utilities For Nodes
 # ----------------------------------
 
-def concat_audio(flist, sample_len=1, verbose=False):
+def concat_audio(flist, sample_len=1, verbose=False, precision="float64"):
     """Concatenates audio samples using a list of audio files for mixing timelapses
 
     Parameters
@@ -22,6 +22,10 @@ def concat_audio(flist, sample_len=1, verbose=False):
         List of files to concatenate
     sample_len : float, optional
         Length in seconds of each sample, default is 1 second
+    precision : str, optional
+        Floating point type of the samples, 'float64' (default, as maad.sound.load)
+        or 'float32'. As with maad.sound.load, the DC offset removed from each
+        sample is the mean of its whole file.
 
 
     Return
@@ -33,14 +37,73 @@ def concat_audio(flist, sample_len=1, verbose=False):
        Sample frequency of long_wav
     """
 
+    dtype = precision_dtype(precision)
     long_wav = list()
     for idx, fname in enumerate(flist, start=1):
         if verbose:
             print(f"{idx} / {len(flist)} : {os.path.basename(fname)}", end="\r")
-        s, fs = sound.load(fname)
-        s = sound.trim(s, fs, 0, sample_len)
-        long_wav.append(s)
+        # Only the first sample_len seconds are converted, not the whole recording
+        fs, data = open_wav(fname)
+        if sample_len * fs > data.shape[0]:
+            raise ValueError("Target duration is longer than original duration.")
+        long_wav.append(
+            read_wav_segment(data, fs, 0, sample_len, dtype, dc_offset="file")
+        )
+        del data
 
     long_wav = np.concatenate(long_wav)
 
     return long_wav, fs
+
+
+def audio_quality_metrics(data, sr):
+    """Computes quality metrics of the samples of an audio file.
+
+    The metrics summarize the recording level and its defects, to spot faulty
+    sensors or microphones before reading the analyses. As in
+    `pamflow.utils.read_wav_segment`, only the left channel is measured.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Samples of the file, as returned by `pamflow.utils.open_wav`.
+    sr : int
+        Sample rate of the file.
+
+    Return
+    ------
+    dict
+        `sampleRate`, `channels`, `duration` (seconds), `dcOffset` (mean of the
+        samples scaled to [-1, 1]), `rmsLevel` and `peakLevel` (dBFS, after
+        removing the DC offset) and `clippingRatio` (fraction of samples at the
+        limits of the integer range, or beyond [-1, 1] for float files).
+    """
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    audio = data if data.ndim == 1 else data[:, 0]
+    metrics = {
+        "sampleRate": int(sr),
+        "channels": channels,
+        "duration": audio.shape[0] / sr,
+        "dcOffset": np.nan,
+        "rmsLevel": np.nan,
+        "peakLevel": np.nan,
+        "clippingRatio": np.nan,
+    }
+    if audio.size == 0:
+        return metrics
+
+    if np.issubdtype(audio.dtype, np.integer):
+        limits = np.iinfo(audio.dtype)
+        clipped = np.count_nonzero((audio <= limits.min) | (audio >= limits.max))
+    else:
+        clipped = np.count_nonzero(np.abs(audio) >= 1)
+    s = normalize_audio(audio)
+    dc_offset = np.mean(s)
+    s = s - dc_offset
+    # Silent files have levels of -inf dBFS
+    with np.errstate(divide="ignore"):
+        metrics["rmsLevel"] = 20 * np.log10(np.sqrt(np.mean(s**2)))
+        metrics["peakLevel"] = 20 * np.log10(np.max(np.abs(s)))
+    metrics["dcOffset"] = dc_offset
+    metrics["clippingRatio"] = clipped / audio.size
+    return metrics
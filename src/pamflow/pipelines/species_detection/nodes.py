@@ -1,22 +1,29 @@
 import os
 import concurrent.futures
 import pandas as pd
-import itertools as it
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import FancyBboxPatch
 import logging
 from pamflow.pipelines.species_detection.utils import (
-    species_detection_single_file,
-    trim_audio,
+    init_species_detection_worker,
+    compute_species_lists,
+    get_week_48,
+    species_detection_batch,
+    species_detection_worker,
+    write_audio_segments,
+    DetectionLedger,
+    MODEL_VERSION,
+    ObservationsStreamWriter,
+    ObservationsTableBuilder,
 )
-from pamflow.datasets.pamDP.observations import observations_pamdp_columns
+from pamflow.utils import as_completed_bounded
 from rich.console import Console
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def species_detection_parallel(media, deployments, n_jobs):
+def species_detection_parallel(media, deployments, n_jobs, detection_settings=None):
     """Detects species in media files using parallel processing.
 
     This node processes media files and deployment metadata to perform species
@@ -39,6 +46,46 @@ def species_detection_parallel(media, deployments, n_jobs):
         `params:species_detection_parameters.n_jobs`. If set to -1, the number of jobs will
         be equal to the number of CPU cores.
 
+    detection_settings : dict, optional
+        A dictionary with execution options for the detection. Passed as
+        `params:species_detection_parameters.detection_settings`. Supported keys:
+
+        - `reuse_analyzer` (bool, default True): load the BirdNET model once per
+          worker process and reuse it for every file handled by that worker.
+        - `engine` (str, default 'file'): 'file' analyzes each file on its own with
+          `birdnetlib.Recording`. 'batched' cuts 3 s windows from several files and
+          scores them in fixed-size batches with a single interpreter call.
+        - `batch_size` (int, default 64): number of windows per interpreter call
+          when `engine` is 'batched'.
+        - `files_per_task` (int, default 32): number of files sent to a worker at
+          once when `engine` is 'batched'.
+        - `ledger_path` (str, default None): path of a SQLite detection ledger. When
+          set, files already analyzed with the same size, modification time,
+          coordinates and BirdNET version are read from the ledger instead of being
+          analyzed again, and new results are added to the ledger as they arrive.
+        - `stream_path` (str, default None): path of a Parquet file. When set,
+          results are converted to observations in chunks and appended to this
+          file as they arrive instead of being kept in memory, and the output is
+          assembled from the file at the end.
+        - `stream_chunk_size` (int, default 100000): number of detections
+          converted to observations at once, and written to `stream_path` when
+          it is set.
+        - `filter_by_week` (bool, default True): if True, the species allowed at
+          each deployment are predicted for the week of each recording, taken
+          from the media timestamp. If False, they are predicted for the whole
+          year.
+        - `prescreen_threshold` (float, optional): energy pre-screen threshold
+          in dBFS. Windows whose RMS level in `prescreen_band` is below it are
+          not sent to the model. Requires the `batched` engine. If None, every
+          window is scored.
+        - `prescreen_band` (list, default [150, 15000]): frequency band (Hz)
+          used by the pre-screen.
+        - `prescreen_report_path` (str, optional): CSV file listing the windows
+          skipped by the pre-screen in this run, with their level.
+        - `max_in_flight` (int, default 2 * n_jobs): maximum number of tasks
+          submitted to the process pool and not completed yet. New tasks are
+          submitted as running ones complete.
+
     Returns
     -------
     pandas.DataFrame
@@ -57,36 +104,121 @@ def species_detection_parallel(media, deployments, n_jobs):
 
     console = Console()
 
+    detection_settings = detection_settings or {}
+    reuse_analyzer = detection_settings.get("reuse_analyzer", True)
+    engine = detection_settings.get("engine", "file")
+    batch_size = detection_settings.get("batch_size", 64)
+    files_per_task = detection_settings.get("files_per_task", 32)
+    ledger_path = detection_settings.get("ledger_path")
+    stream_path = detection_settings.get("stream_path")
+    stream_chunk_size = detection_settings.get("stream_chunk_size", 100000)
+    max_in_flight = detection_settings.get("max_in_flight")
+    filter_by_week = detection_settings.get("filter_by_week", True)
+    prescreen_threshold = detection_settings.get("prescreen_threshold")
+    prescreen_band = detection_settings.get("prescreen_band", [150, 15000])
+    prescreen_report_path = detection_settings.get("prescreen_report_path")
+    if engine not in ("file", "batched"):
+        raise ValueError(f"Unknown species detection engine '{engine}'. Use 'file' or 'batched'.")
+    prescreen = None
+    if prescreen_threshold is not None:
+        if engine != "batched":
+            raise ValueError("The energy pre-screen requires the 'batched' engine.")
+        prescreen = {"threshold": prescreen_threshold, "band": list(prescreen_band)}
+    if engine == "batched":
+        # The batched engine always keeps the model loaded in the worker
+        reuse_analyzer = True
+
     deployments = deployments[["deploymentID", "latitude", "longitude"]]
 
     df = media.merge(deployments, on="deploymentID", how="left")
+    df["week_48"] = get_week_48(df["timestamp"]) if filter_by_week else -1
 
     if n_jobs == -1:
         n_jobs = os.cpu_count()
+    if max_in_flight is None:
+        max_in_flight = 2 * n_jobs
 
     logger.info(
         f"Computing species detection for {df.shape[0]} files using {n_jobs} threads"
     )
 
+    # Detections are converted in chunks, kept in memory or streamed to disk
+    if stream_path is not None:
+        observations_table = ObservationsStreamWriter(stream_path, stream_chunk_size)
+    else:
+        observations_table = ObservationsTableBuilder(stream_chunk_size)
+    collect = observations_table.add
+
     # Use concurrent.futures for parallel execution and show progress with rich
-    results = []
     errors = 0
+    model_load_times = {}
+    inference_time = 0.0
+    n_windows = 0
+    skipped_windows = []
+
+    files = df[
+        ["filePath", "latitude", "longitude", "mediaID", "deploymentID", "week_48"]
+    ].to_dict(orient="records")
+
+    ledger = None
+    if ledger_path is not None:
+        ledger = DetectionLedger(
+            ledger_path,
+            {
+                "birdnetVersion": MODEL_VERSION,
+                "filterByWeek": bool(filter_by_week),
+                "prescreen": prescreen,
+            },
+        )
+        files, done_media_ids = ledger.split_files(files)
+        for detections in ledger.iter_detections(done_media_ids, stream_chunk_size):
+            collect(detections)
+        logger.info(
+            f"Detection ledger {ledger_path}: {len(done_media_ids)} files already "
+            f"analyzed, {len(files)} new or changed files to analyze."
+        )
 
-    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
-        futures = [
-            executor.submit(
-                species_detection_single_file,
-                row["filePath"],
-                row["latitude"],
-                row["longitude"],
-                row["mediaID"],
-                row["deploymentID"],
+    # The location model runs once per deployment and week, not once per file
+    species_lists = compute_species_lists(
+        pd.DataFrame(files, columns=["deploymentID", "latitude", "longitude", "week_48"])
+    )
+    logger.info(f"Computed {len(species_lists)} species lists (deployment and week).")
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=n_jobs,
+        initializer=init_species_detection_worker,
+        initargs=(species_lists, reuse_analyzer),
+    ) as executor:
+        # Each task is keyed by the list of files it processes
+        if engine == "batched":
+            task_function = species_detection_batch
+            tasks = (
+                (
+                    files[i : i + files_per_task],
+                    (files[i : i + files_per_task], batch_size, prescreen),
+                )
+                for i in range(0, len(files), files_per_task)
+            )
+        else:
+            task_function = species_detection_worker
+            tasks = (
+                (
+                    [file],
+                    (
+                        file["filePath"],
+                        file["latitude"],
+                        file["longitude"],
+                        file["mediaID"],
+                        file["deploymentID"],
+                        reuse_analyzer,
+                        file["week_48"],
+                    ),
+                )
+                for file in files
             )
-            for idx, row in df.iterrows()
-        ]
 
         # Track completion using rich Progress
-        total = len(futures)
+        total = len(files)
         progress_columns = [
             TextColumn("[progress.description]{task.description}"),
             BarColumn(),
@@ -96,54 +228,69 @@ def species_detection_parallel(media, deployments, n_jobs):
         ]
         with Progress(*progress_columns, console=console) as progress:
             task = progress.add_task("Detecting species...", total=total)
-            for future in concurrent.futures.as_completed(futures):
+            for task_files, future in as_completed_bounded(
+                executor, task_function, tasks, max_in_flight
+            ):
+                progress.update(task, advance=len(task_files))
                 try:
-                    result = future.result()
-                    results.append(result)
+                    result, timing = future.result()
                 except Exception as e:
-                    errors += 1
+                    errors += len(task_files)
                     console.log(f"[red]Error processing file #{errors}:[/red] {e}")
                     logger.exception("Error during species detection task")
-                finally:
-                    progress.update(task, advance=1)
+                    continue
+
+                collect(result)
+                inference_time += timing["inference"]
+                n_windows += timing.get("windows", 0)
+                skipped_windows.extend(timing.get("skipped", []))
+                if reuse_analyzer:
+                    model_load_times[timing["pid"]] = timing["model_load"]
+                else:
+                    model_load_times[len(model_load_times)] = timing["model_load"]
+                failed = set()
+                for media_id, message in timing.get("errors", []):
+                    errors += 1
+                    failed.add(media_id)
+                    console.log(f"[red]Error processing file {media_id}:[/red] {message}")
+                if ledger is not None:
+                    ledger.record(
+                        [f for f in task_files if f["mediaID"] not in failed],
+                        result,
+                    )
+
+    if ledger is not None:
+        ledger.close()
 
     if errors:
         console.log(f"[yellow]Completed with {errors} failed tasks.[/yellow]")
 
-    # Build dataframe with results
-    resultados_por_carpeta_unchained = list(it.chain.from_iterable(results))
-    df_out = pd.DataFrame(resultados_por_carpeta_unchained)
-    column_names_dict = {
-        "scientific_name": "scientificName",
-        "start_time": "eventStart",
-        "end_time": "eventEnd",
-        "confidence": "classificationProbability",
-    }
-    #'common_name', 'scientific_name', 'start_time', 'end_time', 'confidence', 'label'
-    observations = df_out.rename(columns=column_names_dict)
-    observations["observationID"] = observations.index
-    observations["eventID"] = None
-    observations["observationLevel"] = "interval"
-    observations["observationType"] = "animal"
-    observations["count"] = None
-    observations["lifeStage"] = None
-    observations["sex"] = None
-    observations["behavior"] = None
-    observations["individualID"] = None
-    observations["individualPositionRadius"] = None
-    observations["frequencyLow"] = None
-    observations["frequencyHigh"] = None
-    observations["classificationMethod"] = "machine"
-    observations["classificationTimestamp"] = pd.to_datetime("today").strftime('%Y-%m-%dT%H:%M:%S')
-    observations["observationTags"] = None    
-    observations["observationComments"] = None
-    observations["classificationProbability"] = observations["classificationProbability"].astype(float).round(3)
-    
-    # observations['mediaID']=observations['filePath'].str.split(os.sep).str[-1]
-    observations = observations.drop(columns=["common_name", "label"])
+    logger.info(
+        f"Model setup took {sum(model_load_times.values()):.1f} s over "
+        f"{len(model_load_times)} model loads. Inference took {inference_time:.1f} s "
+        "(summed over workers)."
+    )
+    if n_windows:
+        logger.info(
+            f"Scored {n_windows} windows ({n_windows / max(inference_time, 1e-9):.1f} "
+            "windows per worker-second)."
+        )
+    if prescreen is not None:
+        n_skipped = len(skipped_windows)
+        logger.info(
+            f"Energy pre-screen skipped {n_skipped} of {n_skipped + n_windows} windows "
+            f"below {prescreen_threshold} dBFS in {prescreen['band']} Hz."
+        )
+        if prescreen_report_path is not None:
+            os.makedirs(os.path.dirname(prescreen_report_path) or ".", exist_ok=True)
+            pd.DataFrame(
+                skipped_windows,
+                columns=["mediaID", "deploymentID", "eventStart", "bandLevel"],
+            ).to_csv(prescreen_report_path, index=False)
+            logger.info(f"Skipped windows written to {prescreen_report_path}.")
 
-    # sort columns accortding to observations_pamdp_columns
-    observations = observations[observations_pamdp_columns]
+    # Build dataframe with results
+    observations = observations_table.read()
 
     logger.info(
         f"Species detection completed! Detected {observations.shape[0]} observations."
@@ -271,13 +418,15 @@ def create_segments(observations, media, segment_size):
     return segments
 
 
-def create_segments_folder(segments, n_jobs, segment_size):
+def create_segments_folder(segments, n_jobs, segment_size, segments_path):
     """Creates audio segment files for species observations.
 
     This node processes the generated audio segments and creates individual audio (.WAV) files
     for each segment. The input corresponds to the catalog entry `segments@pandas`.
-    The output is stored in the catalog as `segments_audio_folder@AudioFolderDataset`
-    in separated folder for each species. The file naming format is the following:
+    The segments are extracted and written in parallel: each worker reads the segments of
+    one recording and writes them directly into `segments_path`, in separated folder for
+    each species. The folder can be loaded from the catalog as
+    `segments_audio_folder@AudioFolderDataset`. The file naming format is the following:
     "classificationProbability_mediaID_eventStart_eventEnd.WAV"
 
     Parameters
@@ -294,22 +443,80 @@ def create_segments_folder(segments, n_jobs, segment_size):
         The number of segments to sample per species. Passed as
         `params:species_detection_parameters.segment_size`.
 
-    Yields
-    ------
-    dict
-        A dictionary where the keys are the file paths of the generated audio segment files
-        (organized by species) and the values are the corresponding audio data. Stored in
-        the catalog as `segments_audio_folder@AudioFolderDataset`.
+    segments_path : str
+        The folder where the species folders and segment files are written. Passed as
+        `params:species_detection_parameters.segments_path`, which is set from
+        `segments_path` in globals.yml as the path of
+        `segments_audio_folder@AudioFolderDataset`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        An index of the written segments with the columns `scientificName`,
+        `segmentsFilePath`, `filePath` (source recording) and `segmentPath` (written
+        file). Segments that could not be written are left out. Stored in the catalog
+        as `segments_index@pandas`.
     """
-    logger.info(f'Writing {segments.shape[0]} audio segments to disk...')
-    for index, row in segments.iterrows():
-        result = trim_audio(
-            row["eventStart"],
-            row["eventEnd"],
-            row["filePath"],
-            row["segmentsFilePath"],
+    from rich.progress import (
+        Progress,
+        BarColumn,
+        TextColumn,
+        TimeElapsedColumn,
+        TimeRemainingColumn,
+    )
+
+    console = Console()
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    logger.info(
+        f"Writing {segments.shape[0]} audio segments to {segments_path} using {n_jobs} threads"
+    )
+
+    # One task per recording, so each source file is opened once
+    columns = ["eventStart", "eventEnd", "scientificName", "segmentsFilePath"]
+    tasks = (
+        (
+            file_segments,
+            (file_path, file_segments[columns].to_dict(orient="records"), segments_path),
         )
-        yield {f"{'_'.join(row['scientificName'].split())}/{result[0]}": result[1]}
+        for file_path, file_segments in segments.groupby("filePath", sort=False)
+    )
+
+    errors = 0
+    written = []
+    progress_columns = [
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+    ]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        with Progress(*progress_columns, console=console) as progress:
+            task = progress.add_task("Writing segments...", total=segments.shape[0])
+            for file_segments, future in as_completed_bounded(
+                executor, write_audio_segments, tasks, 2 * n_jobs
+            ):
+                progress.update(task, advance=file_segments.shape[0])
+                try:
+                    segment_paths = future.result()
+                except Exception as e:
+                    errors += file_segments.shape[0]
+                    console.log(
+                        f"[red]Error writing segments of {file_segments['filePath'].iloc[0]}:[/red] {e}"
+                    )
+                    continue
+                written.append(file_segments.assign(segmentPath=segment_paths))
+
+    if errors:
+        console.log(f"[yellow]Completed with {errors} segments not written.[/yellow]")
+
+    index_columns = ["scientificName", "segmentsFilePath", "filePath", "segmentPath"]
+    if not written:
+        return pd.DataFrame(columns=index_columns)
+    return pd.concat(written)[index_columns].reset_index(drop=True)
 
 
 def create_manual_annotation_formats(segments, manual_annotations_file_name):
@@ -20,6 +20,7 @@ def create_pipeline(**kwargs):
                     "media@pamDP",
                     "deployments@pamDP",
                     "params:species_detection_parameters.n_jobs",
+                    "params:species_detection_parameters.detection_settings",
                 ],
                 outputs="unfiltered_observations@pamDP",
                 name="species_detection_node",
@@ -51,8 +52,9 @@ def create_pipeline(**kwargs):
                     "segments@pandas",
                     "params:species_detection_parameters.n_jobs",
                     "params:species_detection_parameters.segment_size",
+                    "params:species_detection_parameters.segments_path",
                 ],
-                outputs="segments_audio_folder@AudioFolderDataset",
+                outputs="segments_index@pandas",
                 name="create_segments_folder_node",
             ),
             node(  # Log
@@ -1,12 +1,203 @@
 import os
+import time
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import librosa
 from maad import sound
 from birdnetlib import Recording
-from birdnetlib.analyzer import Analyzer
+from birdnetlib.analyzer import Analyzer, MODEL_VERSION, LOCATION_FILTER_THRESHOLD
+from birdnetlib.species import SpeciesList
 from contextlib import redirect_stdout
 import concurrent.futures
+from pamflow.datasets.pamDP.observations import observations_pamdp_columns
+from pamflow.utils import FileResultsStore, normalize_audio, open_wav, read_wav_segment
 
+# Audio framing used by BirdNET-Analyzer (see birdnetlib.main.RecordingBase)
+BIRDNET_SAMPLE_RATE = 48000
+BIRDNET_WINDOW_SECONDS = 3.0
+BIRDNET_MIN_WINDOW_SECONDS = 1.5
+BIRDNET_MIN_CONFIDENCE = 0.1
 
-def species_detection_single_file(wav_file_path, lat, lon, mediaID, deploymentID):
+# BirdNET-Analyzer instance owned by the current worker process. It is created by
+# `init_species_detection_worker` and reused for every file the worker handles.
+_worker_analyzer = None
+_worker_load_time = 0.0
+# Location species lists computed by the parent process, keyed by
+# (deploymentID, week_48) and shared with the workers by the initializer.
+_worker_species_lists = {}
+_worker_allowed_labels = {}
+
+
+def load_analyzer():
+    """Loads the BirdNET-Analyzer model and labels silently.
+
+    Returns
+    -------
+    tuple
+        A tuple containing:
+        - birdnetlib.analyzer.Analyzer: The initialized analyzer.
+        - float: The time (in seconds) spent loading the model.
+    """
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as fnull, redirect_stdout(fnull):  # Suppress print messages
+        analyzer = Analyzer()
+    return analyzer, time.perf_counter() - start
+
+
+def init_species_detection_worker(species_lists=None, load_model=True):
+    """Initializes a species detection worker process.
+
+    This function is meant to be used as the `initializer` of a
+    `concurrent.futures.ProcessPoolExecutor`. It loads the BirdNET-Analyzer model
+    once and keeps it in the worker process, so every file handled by that process
+    reuses the same model instead of reloading the TFLite interpreter and labels.
+
+    Parameters
+    ----------
+    species_lists : dict, optional
+        Location species lists returned by `compute_species_lists`. They are kept
+        in the worker and used for every file of the same deployment and week.
+
+    load_model : bool
+        If False, only the species lists are stored and the model is loaded by
+        each task.
+    """
+    global _worker_analyzer, _worker_load_time, _worker_species_lists
+    if species_lists is not None:
+        _worker_species_lists = species_lists
+        _worker_allowed_labels.clear()
+    if load_model:
+        _worker_analyzer, _worker_load_time = load_analyzer()
+
+
+def get_week_48(timestamps):
+    """Converts media timestamps to the 48-week format used by BirdNET.
+
+    The week is computed from the local date of each timestamp, as in
+    `birdnetlib.utils.return_week_48_from_datetime`.
+
+    Parameters
+    ----------
+    timestamps : pandas.Series
+        Media timestamps, as datetimes or ISO 8601 strings.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer weeks between 1 and 48, or -1 when the timestamp is missing.
+    """
+    dates = pd.to_datetime(
+        pd.Series(timestamps).astype(str).str[:10], format="%Y-%m-%d", errors="coerce"
+    )
+    weeks = np.ceil(dates.dt.dayofyear / (365 + dates.dt.is_leap_year) * 48)
+    return weeks.fillna(-1).astype(int).to_numpy()
+
+
+def compute_species_lists(sites):
+    """Predicts the BirdNET location species list of each deployment and week.
+
+    Only the BirdNET location model is loaded, and it runs once per deployment
+    and week instead of once per file.
+
+    Parameters
+    ----------
+    sites : pandas.DataFrame
+        A DataFrame with the columns `deploymentID`, `latitude`, `longitude` and
+        `week_48`. Duplicated deployment and week pairs are ignored.
+
+    Returns
+    -------
+    dict
+        Lists of allowed labels keyed by `(deploymentID, week_48)`. The list is
+        empty when the location is unknown, meaning detections are not filtered.
+    """
+    species_lists = {}
+    species_model = None
+    sites = sites.drop_duplicates(["deploymentID", "week_48"])
+    for deployment_id, lat, lon, week_48 in sites[
+        ["deploymentID", "latitude", "longitude", "week_48"]
+    ].itertuples(index=False):
+        key = (deployment_id, int(week_48))
+        if pd.isna(lat) or pd.isna(lon) or not lat or not lon:
+            species_lists[key] = []
+            continue
+        with open(os.devnull, 'w') as fnull, redirect_stdout(fnull):
+            if species_model is None:
+                species_model = SpeciesList()
+            species_lists[key] = species_model.return_list_for_analyzer(
+                lon=lon, lat=lat, week_48=int(week_48), threshold=LOCATION_FILTER_THRESHOLD
+            )
+    return species_lists
+
+
+def species_detection_worker(
+    wav_file_path, lat, lon, mediaID, deploymentID, reuse_analyzer=True, week_48=-1
+):
+    """Performs species detection on a single media file inside a worker process.
+
+    Wraps `species_detection_single_file` and measures how much time is spent
+    loading the model and how much is spent running inference.
+
+    Parameters
+    ----------
+    wav_file_path, lat, lon, mediaID, deploymentID
+        See `species_detection_single_file`.
+
+    reuse_analyzer : bool
+        If True, the analyzer loaded by `init_species_detection_worker` is reused.
+        If False, a new analyzer is loaded for the file.
+
+    week_48 : int
+        Week of the recording in the 48-week format used by BirdNET, or -1 to
+        ignore the date. Used to look up the species list shared by
+        `init_species_detection_worker`.
+
+    Returns
+    -------
+    tuple
+        A tuple containing:
+        - list: The detections returned by `species_detection_single_file`.
+        - dict: Timing information with the keys `pid`, `model_load` (seconds
+          spent loading the model by this worker) and `inference` (seconds spent
+          analyzing the file).
+    """
+    if reuse_analyzer:
+        if _worker_analyzer is None:
+            init_species_detection_worker()
+        analyzer, model_load = _worker_analyzer, _worker_load_time
+    else:
+        analyzer, model_load = load_analyzer()
+
+    start = time.perf_counter()
+    detections = species_detection_single_file(
+        wav_file_path,
+        lat,
+        lon,
+        mediaID,
+        deploymentID,
+        analyzer=analyzer,
+        week_48=week_48,
+        species_list=_worker_species_lists.get((deploymentID, week_48)),
+    )
+    timing = {
+        "pid": os.getpid(),
+        "model_load": model_load,
+        "inference": time.perf_counter() - start,
+    }
+    return detections, timing
+
+
+def species_detection_single_file(
+    wav_file_path,
+    lat,
+    lon,
+    mediaID,
+    deploymentID,
+    analyzer=None,
+    week_48=-1,
+    species_list=None,
+):
     """Performs species detection on a single media file.
 
     This utility function processes a single media file to detect species based on
@@ -32,6 +223,18 @@ def species_detection_single_file(wav_file_path, lat, lon, mediaID, deploymentID
     deployment_id : str
         A unique identifier for the deployment associated with the media file.
 
+    analyzer : birdnetlib.analyzer.Analyzer, optional
+        A previously loaded analyzer. If None, a new analyzer is loaded for this file.
+
+    week_48 : int
+        Week of the recording in the 48-week format used by BirdNET, or -1 to
+        predict the species list for the whole year.
+
+    species_list : list, optional
+        Labels allowed at the deployment location, as returned by
+        `compute_species_lists`. An empty list disables the filter. If None, the
+        list is predicted by BirdNET from `lat`, `lon` and `week_48`.
+
     Returns
     -------
     list
@@ -39,15 +242,21 @@ def species_detection_single_file(wav_file_path, lat, lon, mediaID, deploymentID
         observation. Each observation includes details such as scientific name,
         start time, end time, confidence score, and other relevant metadata.
     """
-    with open(os.devnull, 'w') as fnull, redirect_stdout(fnull):  # Suppress print messages
+    if analyzer is None:
         # Load and initialize the BirdNET-Analyzer models.
-        analyzer = Analyzer()
-        recording = Recording(
-            analyzer,
-            wav_file_path,
-            lat=lat,
-            lon=lon,
-        )
+        analyzer, _ = load_analyzer()
+
+    if species_list is not None:
+        # The list is already known: filter with it and skip the location model
+        analyzer.custom_species_list = frozenset(species_list)
+        location = {}
+    else:
+        # A reused analyzer keeps the species list of the previous recording
+        analyzer.custom_species_list = []
+        location = {"lat": lat, "lon": lon, "week_48": week_48}
+
+    with open(os.devnull, 'w') as fnull, redirect_stdout(fnull):  # Suppress print messages
+        recording = Recording(analyzer, wav_file_path, **location)
     
         recording.analyze()
     
@@ -72,12 +281,788 @@ def species_detection_single_file(wav_file_path, lat, lon, mediaID, deploymentID
     return species_detections_extra_keys
 
 
+def read_birdnet_windows(wav_file_path):
+    """Loads an audio file and splits it into the 3 s windows analyzed by BirdNET.
+
+    The audio is loaded and split exactly as `birdnetlib.Recording` does: the
+    signal is resampled to 48 kHz mono, cut into consecutive non-overlapping
+    3 s windows, a trailing window shorter than 1.5 s is dropped and a trailing
+    window between 1.5 s and 3 s is zero padded.
+
+    Parameters
+    ----------
+    wav_file_path : str
+        The path to the media file to be processed.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 array of shape (n_windows, 144000) with one window per row.
+    """
+    audio, _ = librosa.load(
+        wav_file_path, sr=BIRDNET_SAMPLE_RATE, mono=True, res_type="kaiser_fast"
+    )
+    return birdnet_windows(audio)
+
+
+def decoded_birdnet_windows(data, sr):
+    """Splits WAV samples that are already read into the 3 s windows analyzed by BirdNET.
+
+    The samples are converted as `librosa.load` converts them in
+    `read_birdnet_windows` (scaled to [-1, 1] as float32, channels averaged and
+    resampled to 48 kHz with 'kaiser_fast'), so a file read once with
+    `pamflow.utils.open_wav` can be shared with other analyses.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Samples of the file, as returned by `pamflow.utils.open_wav`.
+
+    sr : int
+        Sample rate of the file.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 array of shape (n_windows, 144000) with one window per row.
+    """
+    audio = normalize_audio(np.asarray(data), np.float32)
+    if audio.ndim == 2:
+        audio = np.mean(audio, axis=1)
+    audio = librosa.resample(
+        audio, orig_sr=sr, target_sr=BIRDNET_SAMPLE_RATE, res_type="kaiser_fast"
+    )
+    return birdnet_windows(audio)
+
+
+def birdnet_windows(audio):
+    """Splits 48 kHz mono audio into 3 s windows, as `birdnetlib.Recording` does.
+
+    Parameters
+    ----------
+    audio : numpy.ndarray
+        Mono audio sampled at 48 kHz.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 array of shape (n_windows, 144000) with one window per row.
+    """
+    window_size = int(BIRDNET_WINDOW_SECONDS * BIRDNET_SAMPLE_RATE)
+    min_size = int(BIRDNET_MIN_WINDOW_SECONDS * BIRDNET_SAMPLE_RATE)
+
+    n_windows = len(audio) // window_size
+    if len(audio) - n_windows * window_size >= min_size:
+        n_windows += 1
+
+    windows = np.zeros((n_windows, window_size), dtype=np.float32)
+    n_samples = min(len(audio), n_windows * window_size)
+    windows.reshape(-1)[:n_samples] = audio[:n_samples]
+    return windows
+
+
+def window_band_level(windows, band, block_size=64):
+    """Computes the band-limited RMS level of each audio window.
+
+    The power spectrum of each window is summed over the frequency band and
+    converted to a mean square value (Parseval's theorem), so the result is the
+    RMS level, in dB relative to full scale, of the window filtered to the band.
+    Windows are processed in blocks to bound memory use.
+
+    Parameters
+    ----------
+    windows : numpy.ndarray
+        A float32 array of shape (n_windows, n_samples) sampled at 48 kHz, as
+        returned by `read_birdnet_windows`.
+
+    band : list of float
+        Lower and upper frequency (Hz) of the band.
+
+    block_size : int
+        Number of windows transformed at once.
+
+    Returns
+    -------
+    numpy.ndarray
+        The level of each window in dBFS.
+    """
+    n_samples = windows.shape[1]
+    frequencies = np.fft.rfftfreq(n_samples, d=1 / BIRDNET_SAMPLE_RATE)
+    in_band = (frequencies >= band[0]) & (frequencies <= band[1])
+
+    levels = np.empty(len(windows))
+    for start in range(0, len(windows), block_size):
+        spectrum = np.fft.rfft(windows[start : start + block_size], axis=1)[:, in_band]
+        mean_square = 2 * np.sum(np.abs(spectrum) ** 2, axis=1) / n_samples**2
+        levels[start : start + block_size] = 10 * np.log10(mean_square + 1e-20)
+    return levels
+
+
+def get_allowed_labels(deploymentID, week_48):
+    """Returns the labels allowed for a deployment and week.
+
+    The species lists shared by `init_species_detection_worker` are converted
+    to sets once per worker, deployment and week.
+
+    Returns
+    -------
+    frozenset or None
+        The set of labels allowed at the location, or None when the location is
+        unknown and detections should not be filtered.
+    """
+    key = (deploymentID, week_48)
+    if key not in _worker_allowed_labels:
+        species_list = _worker_species_lists.get(key)
+        if species_list is None:
+            raise KeyError(
+                f"No species list for deployment {deploymentID} and week {week_48}."
+            )
+        _worker_allowed_labels[key] = frozenset(species_list) if species_list else None
+    return _worker_allowed_labels[key]
+
+
+def predict_batch(analyzer, batch):
+    """Runs the BirdNET model on a fixed-size batch of 3 s windows.
+
+    The interpreter input is only resized when the batch size changes, so
+    consecutive batches of the same size reuse the allocated tensors.
+
+    Parameters
+    ----------
+    analyzer : birdnetlib.analyzer.Analyzer
+        A loaded analyzer.
+
+    batch : numpy.ndarray
+        A float32 array of shape (batch_size, 144000).
+
+    Returns
+    -------
+    numpy.ndarray
+        Sigmoid scores of shape (batch_size, n_labels).
+    """
+    interpreter = analyzer.interpreter
+    input_index = analyzer.input_layer_index
+    if tuple(interpreter.get_input_details()[0]["shape"]) != batch.shape:
+        interpreter.resize_tensor_input(input_index, list(batch.shape))
+        interpreter.allocate_tensors()
+
+    interpreter.set_tensor(input_index, batch)
+    interpreter.invoke()
+    prediction = interpreter.get_tensor(analyzer.output_layer_index)
+    return analyzer.flat_sigmoid(np.array(prediction), sensitivity=-1.0)
+
+
+def scores_to_detections(scores, start_time, allowed_labels, labels, file_info, classified_by):
+    """Converts the scores of one window into birdnetlib-like detection dictionaries.
+
+    Only labels scoring above the BirdNET minimum confidence and allowed at the
+    deployment location are kept, sorted by descending confidence.
+    """
+    candidates = np.flatnonzero(scores > BIRDNET_MIN_CONFIDENCE)
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    detections = []
+    for label_index in candidates:
+        label = labels[label_index]
+        if allowed_labels is not None and label not in allowed_labels:
+            continue
+        scientific_name, common_name = label.split("_")[:2]
+        detections.append(
+            {
+                "common_name": common_name,
+                "scientific_name": scientific_name,
+                "start_time": start_time,
+                "end_time": start_time + BIRDNET_WINDOW_SECONDS,
+                "confidence": float(scores[label_index]),
+                "label": label,
+                "mediaID": file_info["mediaID"],
+                "deploymentID": file_info["deploymentID"],
+                "classifiedBy": classified_by,
+            }
+        )
+    return detections
+
+
+def species_detection_batch(files, batch_size, prescreen=None, read_windows=None):
+    """Performs species detection on a group of media files with batched inference.
+
+    Windows of 3 s are cut from every file in `files` and packed into fixed-size
+    batches, so a single interpreter call scores windows coming from several
+    files. The scores are mapped back to the `mediaID`, `deploymentID` and start
+    time of each window. Results match `species_detection_single_file`.
+
+    Parameters
+    ----------
+    files : list of dict
+        Media rows to be processed. Each dictionary holds the keys `filePath`,
+        `latitude`, `longitude`, `mediaID`, `deploymentID` and `week_48`. The
+        species list of every deployment and week must have been shared with
+        `init_species_detection_worker`.
+
+    batch_size : int
+        Number of 3 s windows scored by each interpreter call.
+
+    prescreen : dict, optional
+        Energy pre-screen with the keys `threshold` (dBFS) and `band` (Hz).
+        Windows whose level in the band, see `window_band_level`, is below the
+        threshold are not scored. If None, every window is scored.
+
+    read_windows : callable, optional
+        Function returning the windows of a media row, see
+        `read_birdnet_windows`. Defaults to reading the file at `filePath`.
+
+    Returns
+    -------
+    tuple
+        A tuple containing:
+        - list: Detection dictionaries for all files, in the format returned by
+          `species_detection_single_file`.
+        - dict: Timing information with the keys `pid`, `model_load`,
+          `inference`, `windows` (number of windows scored), `errors` (list of
+          `(mediaID, message)` tuples for files that could not be read) and
+          `skipped` (list of `(mediaID, deploymentID, start_time, level)` tuples
+          for the windows discarded by the pre-screen).
+    """
+    if _worker_analyzer is None:
+        init_species_detection_worker()
+    analyzer = _worker_analyzer
+    classified_by = f"Birdnet {analyzer.version}"
+
+    start = time.perf_counter()
+    detections = []
+    errors = []
+    skipped = []
+    n_windows = 0
+
+    batch = np.zeros(
+        (batch_size, int(BIRDNET_WINDOW_SECONDS * BIRDNET_SAMPLE_RATE)), dtype=np.float32
+    )
+    # (file_info, allowed_labels, start_time) for every row filled in the batch
+    batch_owners = []
+
+    def flush():
+        scores = predict_batch(analyzer, batch)
+        for row, (file_info, allowed_labels, start_time) in enumerate(batch_owners):
+            detections.extend(
+                scores_to_detections(
+                    scores[row],
+                    start_time,
+                    allowed_labels,
+                    analyzer.labels,
+                    file_info,
+                    classified_by,
+                )
+            )
+        batch_owners.clear()
+
+    for file_info in files:
+        try:
+            if read_windows is None:
+                windows = read_birdnet_windows(file_info["filePath"])
+            else:
+                windows = read_windows(file_info)
+            allowed_labels = get_allowed_labels(
+                file_info["deploymentID"], file_info["week_48"]
+            )
+        except Exception as e:
+            errors.append((file_info["mediaID"], str(e)))
+            continue
+
+        window_indices = np.arange(len(windows))
+        if prescreen is not None:
+            levels = window_band_level(windows, prescreen["band"])
+            is_quiet = levels < prescreen["threshold"]
+            skipped.extend(
+                (
+                    file_info["mediaID"],
+                    file_info["deploymentID"],
+                    window_index * BIRDNET_WINDOW_SECONDS,
+                    float(levels[window_index]),
+                )
+                for window_index in window_indices[is_quiet]
+            )
+            window_indices = window_indices[~is_quiet]
+
+        for window_index in window_indices:
+            batch[len(batch_owners)] = windows[window_index]
+            batch_owners.append(
+                (file_info, allowed_labels, window_index * BIRDNET_WINDOW_SECONDS)
+            )
+            if len(batch_owners) == batch_size:
+                flush()
+        n_windows += len(window_indices)
+
+    if batch_owners:
+        # Keep the batch size fixed: stale rows past the last window are ignored
+        flush()
+
+    timing = {
+        "pid": os.getpid(),
+        "model_load": _worker_load_time,
+        "inference": time.perf_counter() - start,
+        "windows": n_windows,
+        "errors": errors,
+        "skipped": skipped,
+    }
+    return detections, timing
+
+
+class DetectionLedger(FileResultsStore):
+    """Persistent record of the media files analyzed by the species detection node.
+
+    The ledger is a `pamflow.utils.FileResultsStore` whose files are also
+    identified by their coordinates, with a second table, `detections`, storing
+    the detections of each file.
+
+    Parameters
+    ----------
+    path : str
+        Location of the SQLite database. Parent folders are created if needed.
+
+    settings : dict
+        Detection settings that change the results (e.g. the BirdNET version).
+        Files analyzed with different settings are analyzed again.
+    """
+
+    identity_columns = {"latitude": "REAL", "longitude": "REAL"}
+    detection_columns = [
+        "common_name",
+        "scientific_name",
+        "start_time",
+        "end_time",
+        "confidence",
+        "label",
+        "mediaID",
+        "deploymentID",
+        "classifiedBy",
+    ]
+
+    def __init__(self, path, settings):
+        super().__init__(path, settings)
+        columns = ", ".join(
+            f"{column} REAL" if column in ("start_time", "end_time", "confidence")
+            else f"{column} TEXT"
+            for column in self.detection_columns
+        )
+        self._connection.execute(f"CREATE TABLE IF NOT EXISTS detections ({columns})")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS detections_media ON detections (mediaID)"
+        )
+        self._connection.commit()
+
+    def identity_values(self, file):
+        """Coordinates of a media row, as floats."""
+        return _as_float(file["latitude"]), _as_float(file["longitude"])
+
+    def split_files(self, files):
+        """Splits media rows into files already in the ledger and files to analyze.
+
+        A file is up to date when its path, size, modification time, coordinates
+        and the detection settings match the ledger entry. The identity of every
+        file is added to its dictionary under the keys `fileSize` and `fileMtime`.
+
+        Parameters
+        ----------
+        files : list of dict
+            Media rows with the keys `filePath`, `latitude`, `longitude`, `mediaID`
+            and `deploymentID`.
+
+        Returns
+        -------
+        tuple
+            A tuple containing:
+            - list: Media rows that must be analyzed.
+            - list: `mediaID` of the files whose detections are read from the ledger.
+        """
+        pending, done = super().split_files(files)
+        return pending, list(done)
+
+    def record(self, files, detections):
+        """Stores the detections of analyzed files and marks the files as done.
+
+        Parameters
+        ----------
+        files : list of dict
+            Media rows analyzed successfully, as returned by `split_files`.
+
+        detections : list of dict
+            Detections of those files, in the format returned by
+            `species_detection_single_file`.
+        """
+        placeholders = ", ".join("?" * len(self.detection_columns))
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM detections WHERE mediaID = ?",
+                [(file["mediaID"],) for file in files],
+            )
+            self._insert_files([(file, ()) for file in files])
+            self._connection.executemany(
+                f"INSERT INTO detections VALUES ({placeholders})",
+                [
+                    tuple(detection[column] for column in self.detection_columns)
+                    for detection in detections
+                ],
+            )
+
+    def iter_detections(self, media_ids, chunk_size=100000):
+        """Yields the stored detections of the given files in lists of at most `chunk_size`.
+
+        The requested files are written to a temporary table joined with the
+        detections, so only their rows are read from the ledger.
+        """
+        with self._connection:
+            self._connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS requested (mediaID TEXT PRIMARY KEY)"
+            )
+            self._connection.execute("DELETE FROM requested")
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO requested VALUES (?)",
+                [(media_id,) for media_id in media_ids],
+            )
+        try:
+            for detections in pd.read_sql_query(
+                "SELECT detections.* FROM requested "
+                "JOIN files USING (mediaID) JOIN detections USING (mediaID) "
+                "WHERE files.paramsHash = ?",
+                self._connection,
+                params=(self.params_hash,),
+                chunksize=chunk_size,
+            ):
+                yield detections.to_dict(orient="records")
+        finally:
+            with self._connection:
+                self._connection.execute("DELETE FROM requested")
+
+
+def _as_float(value):
+    """Converts coordinates to float, mapping missing values to None."""
+    return None if pd.isna(value) else float(value)
+
+
+# Text columns of pamDP.observations stored as categoricals: values repeat across
+# rows (or are constant or empty), so each row only costs a small integer code.
+observations_categorical_columns = [
+    "deploymentID",
+    "mediaID",
+    "eventID",
+    "observationLevel",
+    "observationType",
+    "scientificName",
+    "lifeStage",
+    "sex",
+    "behavior",
+    "individualID",
+    "classificationMethod",
+    "classifiedBy",
+    "classificationTimestamp",
+    "observationTags",
+    "observationComments",
+]
+
+
+def _constant_column(value, n_rows):
+    """Returns a categorical column with the same value, or only nulls, in every row."""
+    if value is None:
+        return pd.Categorical.from_codes(np.full(n_rows, -1, dtype=np.int8), categories=[])
+    return pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[value])
+
+
+def detections_to_observations(
+    detections, first_observation_id=0, classification_timestamp=None
+):
+    """Converts BirdNET detections into rows of the pamDP.observations format.
+
+    The table is built column by column with compact dtypes: repeated and
+    constant text columns are categoricals, times and probabilities are float32
+    and empty columns are categoricals without categories. It still saves as a
+    valid `observations@pamDP`.
+
+    Parameters
+    ----------
+    detections : list of dict
+        Detections in the format returned by `species_detection_single_file`.
+
+    first_observation_id : int
+        Value of `observationID` for the first row. Consecutive chunks of the same
+        table use it to keep identifiers unique.
+
+    classification_timestamp : str, optional
+        ISO 8601 timestamp stored in `classificationTimestamp`. Defaults to now.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame following the pamDP.observations format.
+    """
+    if classification_timestamp is None:
+        classification_timestamp = pd.to_datetime("today").strftime('%Y-%m-%dT%H:%M:%S')
+
+    df_out = pd.DataFrame(detections, columns=DetectionLedger.detection_columns)
+    n_rows = len(df_out)
+    columns = {
+        "observationID": np.arange(first_observation_id, first_observation_id + n_rows),
+        "deploymentID": pd.Categorical(df_out["deploymentID"]),
+        "mediaID": pd.Categorical(df_out["mediaID"]),
+        "eventStart": df_out["start_time"].to_numpy(dtype=np.float32),
+        "eventEnd": df_out["end_time"].to_numpy(dtype=np.float32),
+        "frequencyLow": np.full(n_rows, np.nan, dtype=np.float32),
+        "frequencyHigh": np.full(n_rows, np.nan, dtype=np.float32),
+        "observationLevel": _constant_column("interval", n_rows),
+        "observationType": _constant_column("animal", n_rows),
+        "scientificName": pd.Categorical(df_out["scientific_name"]),
+        "count": pd.array(np.full(n_rows, pd.NA), dtype="Int64"),
+        "individualPositionRadius": np.full(n_rows, np.nan, dtype=np.float32),
+        "classificationMethod": _constant_column("machine", n_rows),
+        "classifiedBy": pd.Categorical(df_out["classifiedBy"]),
+        "classificationTimestamp": _constant_column(classification_timestamp, n_rows),
+        "classificationProbability": (
+            df_out["confidence"].astype(float).round(3).to_numpy(dtype=np.float32)
+        ),
+    }
+    # Columns BirdNET does not fill are empty
+    for column in observations_categorical_columns:
+        if column not in columns:
+            columns[column] = _constant_column(None, n_rows)
+
+    # sort columns accortding to observations_pamdp_columns
+    return pd.DataFrame({column: columns[column] for column in observations_pamdp_columns})
+
+
+def concat_observations(chunks):
+    """Concatenates chunks of observations keeping their compact dtypes.
+
+    `pandas.concat` turns categoricals with different categories into object
+    columns, so categorical columns are combined with `union_categoricals`.
+
+    Parameters
+    ----------
+    chunks : list of pandas.DataFrame
+        Chunks returned by `detections_to_observations`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame following the pamDP.observations format.
+    """
+    if not chunks:
+        return detections_to_observations([])
+    if len(chunks) == 1:
+        return chunks[0]
+
+    columns = {}
+    for column in observations_pamdp_columns:
+        values = [chunk[column] for chunk in chunks]
+        if isinstance(values[0].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals(values)
+        else:
+            columns[column] = pd.concat(values, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+class ObservationsTableBuilder:
+    """Builds the observations table in memory from chunks of detections.
+
+    Detections are buffered until `chunk_size` of them are available and then
+    converted with `detections_to_observations`, so the list of detection
+    dictionaries never holds more than one chunk. It has the same interface as
+    `ObservationsStreamWriter`.
+
+    Parameters
+    ----------
+    chunk_size : int
+        Number of detections converted at once.
+    """
+
+    def __init__(self, chunk_size=100000):
+        self.chunk_size = chunk_size
+        self.n_observations = 0
+        self.classification_timestamp = pd.to_datetime("today").strftime('%Y-%m-%dT%H:%M:%S')
+        self._buffer = []
+        self._chunks = []
+
+    def add(self, detections):
+        """Adds detections to the buffer and converts full chunks."""
+        self._buffer.extend(detections)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Converts the buffered detections to observations."""
+        if not self._buffer:
+            return
+        observations = detections_to_observations(
+            self._buffer, self.n_observations, self.classification_timestamp
+        )
+        self._chunks.append(observations)
+        self.n_observations += len(observations)
+        self._buffer = []
+
+    def read(self):
+        """Returns every converted chunk as a single DataFrame."""
+        self.flush()
+        return concat_observations(self._chunks)
+
+
+class ObservationsStreamWriter:
+    """Streams detections to a Parquet file as chunks of pamDP observations.
+
+    Detections are buffered until `chunk_size` of them are available, converted
+    to pamDP.observations rows and appended to the Parquet file as a new row
+    group. Memory use therefore depends on the chunk size and not on the total
+    number of detections.
+
+    Parameters
+    ----------
+    path : str
+        Location of the Parquet file. An existing file is overwritten.
+
+    chunk_size : int
+        Number of detections converted and written at once.
+    """
+
+    def __init__(self, path, chunk_size=100000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.n_observations = 0
+        self.classification_timestamp = pd.to_datetime("today").strftime('%Y-%m-%dT%H:%M:%S')
+        self._buffer = []
+        self._writer = None
+        parent_directory = os.path.dirname(path)
+        if parent_directory:
+            os.makedirs(parent_directory, exist_ok=True)
+
+    def add(self, detections):
+        """Adds detections to the buffer and writes full chunks to disk."""
+        self._buffer.extend(detections)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered detections to disk."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._buffer and self._writer is not None:
+            return
+        observations = detections_to_observations(
+            self._buffer, self.n_observations, self.classification_timestamp
+        )
+        table = pa.Table.from_pandas(observations, preserve_index=False)
+        if self._writer is None:
+            # Categories change between chunks: store plain values, Parquet
+            # dictionary encodes them anyway
+            schema = pa.schema(
+                [
+                    pa.field(
+                        field.name,
+                        field.type.value_type
+                        if pa.types.is_dictionary(field.type)
+                        else field.type,
+                    )
+                    for field in table.schema
+                ]
+            )
+            self._writer = pq.ParquetWriter(self.path, schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+        self.n_observations += len(observations)
+        self._buffer = []
+
+    def read(self):
+        """Closes the file and loads every written chunk as a single DataFrame."""
+        import pyarrow.parquet as pq
+
+        self.flush()
+        self._writer.close()
+        observations = pq.read_table(
+            self.path, read_dictionary=observations_categorical_columns
+        ).to_pandas()
+        # Empty columns are read back as objects
+        for column in observations_categorical_columns:
+            if not isinstance(observations[column].dtype, pd.CategoricalDtype):
+                observations[column] = observations[column].astype("category")
+        observations["count"] = observations["count"].astype("Int64")
+        return observations
+
+
+def read_audio_segments(path_audio, time_ranges):
+    """Reads several segments of a WAV file, opening the file once.
+
+    The data chunk of the file is memory mapped, so only the frames of the
+    requested segments are read from disk instead of decoding the whole
+    recording for every segment. Each segment is processed as in
+    `maad.sound.load`: samples are scaled to [-1, 1], the left channel is kept
+    and the DC offset is removed. The offset is the mean of the segment, not of
+    the whole recording.
+
+    Parameters
+    ----------
+    path_audio : str
+        The file path to the original audio file.
+
+    time_ranges : iterable of tuple
+        Pairs `(start_time, end_time)` in seconds.
+
+    Returns
+    -------
+    tuple
+        A tuple containing:
+        - int: The sample rate of the audio file.
+        - list: One numpy array per segment, in the order of `time_ranges`.
+    """
+    sr, data = open_wav(path_audio)
+    audio_segments = [
+        read_wav_segment(data, sr, start_time, end_time) for start_time, end_time in time_ranges
+    ]
+    del data
+    return sr, audio_segments
+
+
+def write_audio_segments(path_audio, segments, segments_path):
+    """Extracts the segments of one recording and writes them as WAV files.
+
+    This function is meant to run inside a worker process: the recording is read
+    once with `read_audio_segments` and each segment is written as a 16-bit WAV
+    file in the folder of its species, `segments_path/<Genus_species>/`.
+
+    Parameters
+    ----------
+    path_audio : str
+        The file path to the original audio file.
+
+    segments : list of dict
+        Segments taken from the recording. Each dictionary holds the keys
+        `eventStart`, `eventEnd`, `scientificName` and `segmentsFilePath`.
+
+    segments_path : str
+        Main folder where the species folders are created.
+
+    Returns
+    -------
+    list
+        The paths of the written segment files, in the order of `segments`.
+    """
+    sr, audio_segments = read_audio_segments(
+        path_audio, [(segment["eventStart"], segment["eventEnd"]) for segment in segments]
+    )
+    written_paths = []
+    for segment, audio in zip(segments, audio_segments):
+        species_folder = os.path.join(
+            segments_path, "_".join(segment["scientificName"].split())
+        )
+        os.makedirs(species_folder, exist_ok=True)
+        segment_path = os.path.join(species_folder, segment["segmentsFilePath"])
+        sound.write(segment_path, sr, audio, bit_depth=16)
+        written_paths.append(segment_path)
+    return written_paths
+
+
 def trim_audio(start_time, end_time, path_audio, segments_file_name):
     """Trims an audio file to create a segment based on the specified start and end times.
 
     This utility function extracts a segment from an audio file based on the provided
     start and end times. The trimmed audio segment is returned along with its sample rate
-    and a modified file name for the segment.
+    and a modified file name for the segment. Only the frames of the segment are read,
+    see `read_audio_segments`.
 
     Parameters
     ----------
@@ -101,6 +1086,5 @@ def trim_audio(start_time, end_time, path_audio, segments_file_name):
         - str: The modified file name for the audio segment (without the file extension).
         - tuple: A tuple containing the trimmed audio numpy array and its sample rate.
     """
-    audio_array, sr = sound.load(path_audio)
-    trimmed_audio = audio_array[int(start_time * sr) : int(end_time * sr)]
+    sr, (trimmed_audio,) = read_audio_segments(path_audio, [(start_time, end_time)])
     return (segments_file_name[0:-4], (trimmed_audio, sr))
@@ -0,0 +1,567 @@
+"""
+Utilities shared by the pamflow pipelines.
+
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import functools
+import itertools
+import warnings
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from scipy import signal
+from scipy.io import wavfile
+
+logger = logging.getLogger(__name__)
+
+
+def as_completed_bounded(executor, fn, tasks, max_in_flight):
+    """Submits tasks to an executor with a bounded number of pending futures.
+
+    Instead of submitting one future per task up front, at most `max_in_flight`
+    tasks are pending at any time. A new task is submitted as soon as a running
+    one completes, so memory use does not depend on the number of tasks and the
+    first results are available right away.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        The executor (e.g. a ProcessPoolExecutor) used to run the tasks.
+
+    fn : callable
+        The function executed for each task.
+
+    tasks : iterable of tuple
+        Pairs `(key, args)` where `args` is the tuple of positional arguments
+        passed to `fn` and `key` is any value identifying the task. The iterable
+        is consumed lazily.
+
+    max_in_flight : int
+        Maximum number of submitted tasks that have not completed yet.
+
+    Yields
+    ------
+    tuple
+        Pairs `(key, future)` in completion order.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be a positive integer.")
+
+    tasks = iter(tasks)
+    pending = {}
+
+    def submit(n_tasks):
+        for key, args in itertools.islice(tasks, n_tasks):
+            pending[executor.submit(fn, *args)] = key
+
+    submit(max_in_flight)
+    while pending:
+        done, _ = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        completed = [(pending.pop(future), future) for future in done]
+        # Keep the workers busy while the caller handles the results
+        submit(max_in_flight - len(pending))
+        yield from completed
+
+
+# Floating point types of the `precision` settings
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+
+def precision_dtype(precision):
+    """Returns the NumPy type of a `precision` setting ('float64' or 'float32')."""
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"Unknown precision '{precision}', use one of {list(PRECISIONS)}."
+        )
+    return PRECISIONS[precision]
+
+
+# Scale of the integer PCM samples in `maad.sound.load`
+PCM_SCALES = {np.dtype(np.int32): 2**31, np.dtype(np.int16): 2**15, np.dtype(np.uint8): 2**8}
+
+
+def normalize_audio(audio, dtype=np.float64):
+    """Scales integer PCM samples to [-1, 1] as `maad.sound.load` does."""
+    scale = PCM_SCALES.get(audio.dtype)
+    if scale is None:
+        return np.asarray(audio, dtype=dtype)
+    return audio.astype(dtype) / dtype(scale)
+
+
+def open_wav(path_audio):
+    """Opens a WAV file without reading its samples.
+
+    The data chunk of the file is memory mapped, so samples are only read from
+    disk when a segment is taken with `read_wav_segment`. 24-bit files can not be
+    memory mapped and are read entirely.
+
+    Parameters
+    ----------
+    path_audio : str
+        The file path to the audio file.
+
+    Returns
+    -------
+    tuple
+        The sample rate and the (memory mapped) array of samples.
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore")  # Skip non-data chunk warnings
+        try:
+            return wavfile.read(path_audio, mmap=True)
+        except ValueError:
+            return wavfile.read(path_audio)
+
+
+def read_wav_segment(
+    data, sr, start_time=0, end_time=None, dtype=np.float64, dc_offset="segment"
+):
+    """Reads a segment of the samples returned by `open_wav`.
+
+    The segment is processed as in `maad.sound.load`: samples are scaled to
+    [-1, 1], the left channel is kept and the DC offset is removed. By default the
+    offset is the mean of the segment. With `dc_offset='file'` it is the mean of
+    the whole recording, as when the file is loaded with `maad.sound.load` and
+    then trimmed; the mean is taken over the memory mapped samples, so the whole
+    recording is read from disk but not converted to floating point.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Samples of the file, as returned by `open_wav`.
+
+    sr : int
+        Sample rate of the file.
+
+    start_time, end_time : float
+        Limits of the segment in seconds. If `end_time` is None, the segment
+        goes to the end of the file.
+
+    dtype : numpy.dtype
+        Floating point type of the samples (float64 as maad, or float32).
+
+    dc_offset : str
+        Samples the DC offset is computed on, 'segment' or 'file'.
+
+    Returns
+    -------
+    numpy.ndarray
+        The samples of the segment.
+    """
+    if dc_offset not in ("segment", "file"):
+        raise ValueError(f"Unknown dc_offset '{dc_offset}', use 'segment' or 'file'.")
+    if data.ndim == 2:
+        data = data[:, 0]
+    end = None if end_time is None else int(end_time * sr)
+    audio = normalize_audio(data[int(start_time * sr) : end], dtype)
+    if dc_offset == "file" and data.size:
+        offset = np.mean(data, dtype=np.float64) / PCM_SCALES.get(data.dtype, 1)
+        audio = audio - dtype(offset)
+    elif audio.size:
+        audio = audio - np.mean(audio)
+    return audio
+
+
+def load_audio(path_audio, dtype=np.float64):
+    """Loads a WAV file as `maad.sound.load` does, with samples of type `dtype`.
+
+    With float32 the samples are converted from the file without going through
+    a float64 copy of the whole recording.
+
+    Parameters
+    ----------
+    path_audio : str
+        The file path to the audio file.
+
+    dtype : numpy.dtype
+        Floating point type of the samples.
+
+    Returns
+    -------
+    tuple
+        The samples and the sample rate.
+    """
+    sr, data = open_wav(path_audio)
+    audio = read_wav_segment(data, sr, dtype=dtype)
+    del data
+    return audio, sr
+
+
+@functools.lru_cache(maxsize=None)
+def _resample_taps(up, down, dtype=np.float64):
+    """Low-pass FIR filter designed by scipy.signal.resample_poly for a resampling ratio.
+
+    Filters are cached in each process, so they are designed once per ratio instead
+    of once per file.
+    """
+    max_rate = max(up, down)
+    taps = signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    return taps.astype(dtype)
+
+
+def resample(s, fs, target_fs):
+    """
+    Resample an audio signal as maad.sound.resample with res_type='scipy_poly'.
+    The output is the same: signals already at `target_fs` are returned as they
+    are, and the others go through scipy.signal.resample_poly with the reduced
+    integer ratio. The only difference is that the anti-aliasing filter of each
+    ratio is designed once per process (see `_resample_taps`) instead of once per
+    file.
+    Parameters
+    ----------
+    s : 1d numpy array
+        Audio signal.
+    fs : int
+        Sampling rate of `s`.
+    target_fs : int
+        Sampling rate of the output.
+    Returns
+    -------
+    1d numpy array
+        Resampled audio signal.
+    """
+    if fs == target_fs:
+        return s
+    gcd = np.gcd(int(fs), int(target_fs))
+    up, down = int(target_fs) // gcd, int(fs) // gcd
+    taps = _resample_taps(up, down, s.dtype.type)
+    s_resampled = signal.resample_poly(s, up, down, window=taps)
+    return np.ascontiguousarray(s_resampled, dtype=s.dtype)
+
+
+class SignalStore:
+    """On-disk store of decoded and resampled audio signals shared by the pipelines.
+
+    Signals are keyed by the fingerprint of the audio file (real path, size and
+    modification time), the sample rate they were resampled to, the name of the
+    resampling method and their floating point type. Each signal is a `.npy` file
+    that is memory mapped when read, so pipelines with different spectrogram or
+    filter settings read the same resampled signal instead of decoding and
+    resampling the file again. When the store grows beyond `max_size_gb`, the
+    least recently used signals are deleted. The size is tracked per process, so
+    with several workers the store can exceed the limit until one of them checks
+    it again.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the store. It is created if needed.
+
+    max_size_gb : float, optional
+        Maximum size of the store in gigabytes. None for no limit.
+    """
+
+    def __init__(self, path, max_size_gb=None):
+        self.path = path
+        self.max_size = None if max_size_gb is None else max_size_gb * 1024**3
+        # Size of the store known by this process, measured at the first write
+        self._size = None
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(path_audio, target_fs, resampler, dtype=np.float64):
+        """Returns the key of a signal, or None if the audio file does not exist.
+
+        Signals resampled with different methods (`resampler` names them) may differ,
+        so they are stored apart.
+        """
+        try:
+            stat = os.stat(path_audio)
+        except OSError:
+            return None
+        fingerprint = [
+            os.path.realpath(path_audio),
+            stat.st_size,
+            stat.st_mtime_ns,
+            int(target_fs),
+            str(resampler),
+            np.dtype(dtype).name,
+        ]
+        return hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        """Returns a stored signal as a read-only memory map, or None if it is not stored."""
+        file = self._file(key)
+        try:
+            # The modification time records the last use, for eviction
+            os.utime(file)
+            return np.load(file, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, s):
+        """Stores a signal, then deletes the least recently used ones if needed."""
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        # Readers never see a partially written file
+        temporary_file = f"{file}.{os.getpid()}.tmp"
+        with open(temporary_file, "wb") as f:
+            np.save(f, np.ascontiguousarray(s))
+        os.replace(temporary_file, file)
+
+        if self.max_size is None:
+            return
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(file)
+        if self._size > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        """(last use, size, path) of every stored signal."""
+        entries = []
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".npy"):
+                    file = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(file)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, file))
+        return entries
+
+    def evict(self):
+        """Deletes the least recently used signals until the store fits in `max_size_gb`."""
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, file in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                continue
+            self._size -= size
+
+    def load(self, path_audio, target_fs, resample, resampler, dtype=np.float64):
+        """Loads an audio file resampled to `target_fs`, from the store if possible.
+
+        Parameters
+        ----------
+        path_audio : str
+            The file path to the audio file.
+
+        target_fs : int
+            Sample rate of the signal.
+
+        resample : callable
+            Function `resample(s, fs, target_fs)` used when the signal is not stored.
+
+        resampler : str
+            Name of the resampling method of `resample`, part of the key of the signal.
+
+        dtype : numpy.dtype
+            Floating point type of the samples.
+
+        Returns
+        -------
+        numpy.ndarray
+            The resampled samples, read-only when read from the store.
+        """
+        key = self.key(path_audio, target_fs, resampler, dtype)
+        s = None if key is None else self.get(key)
+        if s is None:
+            s, fs = load_audio(path_audio, dtype)
+            s = resample(s, fs, target_fs)
+            if key is not None:
+                self.put(key, s)
+        return s
+
+
+@functools.lru_cache(maxsize=None)
+def _open_signal_store(path, max_size_gb):
+    return SignalStore(path, max_size_gb)
+
+
+def open_signal_store(settings):
+    """Returns the signal store of a process for `signal_store` parameters.
+
+    Parameters
+    ----------
+    settings : dict or None
+        Parameters with the `path` of the store and its `max_size_gb`.
+
+    Returns
+    -------
+    SignalStore or None
+        The store, created once per process and path, or None if `settings` or
+        its path are None.
+    """
+    if not settings or settings.get("path") is None:
+        return None
+    return _open_signal_store(settings["path"], settings.get("max_size_gb"))
+
+
+class FileResultsStore:
+    """
+    Persistent store of the results computed for each media file.
+    The store is a SQLite database with a `files` table holding one row per file:
+    its identity (path, size and modification time, and the `identity_columns` of
+    the subclass), a hash of the parameters used and the result, in the
+    `payload_columns` of the subclass. A file is served from the store when its
+    identity and the parameters are unchanged; new or modified files, and every
+    file after a parameter change, are computed again. Files are recorded as soon
+    as their results arrive, so an interrupted run keeps the files computed so far.
+    Subclasses convert their results to and from the payload columns.
+    Parameters
+    ----------
+    path : str
+        Location of the SQLite database. Parent folders are created if needed.
+    params : dict
+        Parameters that change the results.
+    """
+
+    # Columns of the `files` table (name and SQLite type) defined by subclasses
+    identity_columns = {}
+    payload_columns = {}
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params_hash = hashlib.sha256(
+            json.dumps(params, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        parent_directory = os.path.dirname(path)
+        if parent_directory:
+            os.makedirs(parent_directory, exist_ok=True)
+
+        columns = {
+            "mediaID": "TEXT PRIMARY KEY",
+            "filePath": "TEXT",
+            "fileSize": "INTEGER",
+            "fileMtime": "REAL",
+            **self.identity_columns,
+            "paramsHash": "TEXT",
+            **self.payload_columns,
+            "computedAt": "TEXT",
+        }
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        recorded_columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(files)")
+        ]
+        if recorded_columns and recorded_columns != list(columns):
+            # Written by another version of pamflow, its files are computed again
+            logger.warning(f"{path} has an outdated layout, its results are discarded.")
+            self._connection.execute("DROP TABLE files")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            + ", ".join(f"{name} {kind}" for name, kind in columns.items())
+            + ")"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def file_identity(file_path):
+        """Returns the (size, modification time) of a file, or (None, None) if missing."""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None, None
+        return stat.st_size, stat.st_mtime
+
+    def identity_values(self, file):
+        """Values of the `identity_columns` of a media row."""
+        return tuple(file[column] for column in self.identity_columns)
+
+    def decode_payload(self, file, payload):
+        """Result of a file from the values of its `payload_columns`."""
+        return payload
+
+    def split_files(self, files):
+        """
+        Split media rows into cached files and files to compute.
+        The identity of every file is added to its dictionary under the keys
+        `fileSize` and `fileMtime`.
+        Parameters
+        ----------
+        files : list of dict
+            Media rows with the keys `filePath`, `mediaID` and the
+            `identity_columns`.
+        Returns
+        -------
+        pending : list of dict
+            Media rows whose results must be computed.
+        cached : dict
+            Results of the cached files (see `decode_payload`), keyed by mediaID.
+        """
+        identity_columns = ["filePath", "fileSize", "fileMtime", *self.identity_columns]
+        n_identity = len(identity_columns)
+        recorded = {
+            row[0]: row[1:]
+            for row in self._connection.execute(
+                f"SELECT mediaID, {', '.join(identity_columns + list(self.payload_columns))} "
+                "FROM files WHERE paramsHash = ?",
+                (self.params_hash,),
+            )
+        }
+
+        pending, cached = [], {}
+        for file in files:
+            file["fileSize"], file["fileMtime"] = self.file_identity(file["filePath"])
+            identity = (
+                file["filePath"], file["fileSize"], file["fileMtime"], *self.identity_values(file)
+            )
+            entry = recorded.get(file["mediaID"])
+            if file["fileSize"] is not None and entry and entry[:n_identity] == identity:
+                cached[file["mediaID"]] = self.decode_payload(file, entry[n_identity:])
+            else:
+                pending.append(file)
+        return pending, cached
+
+    def _insert_files(self, entries):
+        """Inserts files and the values of their `payload_columns`, without committing."""
+        computed_at = pd.Timestamp.now().isoformat()
+        n_columns = 6 + len(self.identity_columns) + len(self.payload_columns)
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * n_columns)})",
+            [
+                (
+                    file["mediaID"],
+                    file["filePath"],
+                    file["fileSize"],
+                    file["fileMtime"],
+                    *self.identity_values(file),
+                    self.params_hash,
+                    *payload,
+                    computed_at,
+                )
+                for file, payload in entries
+            ],
+        )
+
+    def write(self, entries):
+        """
+        Store the results computed for some files.
+        Parameters
+        ----------
+        entries : list of tuple
+            Media rows, as returned by `split_files`, with the values of their
+            `payload_columns`.
+        """
+        with self._connection:
+            self._insert_files(entries)
+
+    def payloads(self):
+        """Yields the mediaID and payload values of the files stored with the current parameters."""
+        columns = ", ".join(["mediaID", *self.payload_columns])
+        for row in self._connection.execute(
+            f"SELECT {columns} FROM files WHERE paramsHash = ?",
+            (self.params_hash,),
+        ):
+            yield row[0], row[1:]
+
+    def close(self):
+        self._connection.close()
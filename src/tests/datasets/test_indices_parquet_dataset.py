@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pamflow.datasets.indices_parquet_dataset import IndicesParquetDataset
+
+
+def indices(deployment, timestamps):
+    return pd.DataFrame(
+        {
+            "ACI": np.linspace(100, 200, len(timestamps)),
+            "mediaID": [f"{deployment}_{i}.WAV" for i in range(len(timestamps))],
+            "deploymentID": deployment,
+            "timestamp": timestamps,
+        }
+    )
+
+
+def test_indices_parquet_dataset_partitions(tmp_path):
+    dataset = IndicesParquetDataset(str(tmp_path / "indices"), partition_cols=["deploymentID", "date"])
+    s01 = indices("S01", ["2023-05-01T23:00:00-0500", "2023-05-02T05:00:00-0500"])
+    dataset.save({"indices_S01": s01})
+    dataset.save({"indices_S02": lambda: indices("S02", ["2023-05-01T05:00:00-0500"])})
+    # Saving a deployment again replaces its partitions
+    dataset.save({"indices_S01": s01})
+
+    data = dataset.load().sort_values("mediaID").reset_index(drop=True)
+    assert data["mediaID"].tolist() == ["S01_0.WAV", "S01_1.WAV", "S02_0.WAV"]
+    assert data["ACI"].dtype == np.float32
+    assert data["timestamp"].iloc[0] == pd.Timestamp("2023-05-02T04:00:00Z")
+    assert (tmp_path / "indices" / "deploymentID=S01" / "date=2023-05-02").is_dir()
+
+    filtered = IndicesParquetDataset(
+        str(tmp_path / "indices"),
+        load_args={"columns": ["ACI", "mediaID"], "filters": [("deploymentID", "=", "S02")]},
+    ).load()
+    assert list(filtered.columns) == ["ACI", "mediaID"]
+    assert filtered["mediaID"].tolist() == ["S02_0.WAV"]
+
+
+def test_indices_parquet_dataset_replaces_old_dates(tmp_path):
+    dataset = IndicesParquetDataset(str(tmp_path / "indices"), partition_cols=["deploymentID", "date"])
+    dataset.save({"indices_S01": indices("S01", ["2023-05-01T05:00:00-0500", "2023-05-02T05:00:00-0500"])})
+    # The deployment is computed again on other dates
+    dataset.save({"indices_S01": indices("S01", ["2023-05-03T05:00:00-0500"])})
+
+    data = dataset.load()
+    assert data["timestamp"].tolist() == [pd.Timestamp("2023-05-03T10:00:00Z")]
+    assert not (tmp_path / "indices" / "deploymentID=S01" / "date=2023-05-01").exists()
+
+
+def test_indices_parquet_dataset_partitions_by_deployment_first(tmp_path):
+    with pytest.raises(ValueError):
+        IndicesParquetDataset(str(tmp_path / "indices"), partition_cols=["date"])
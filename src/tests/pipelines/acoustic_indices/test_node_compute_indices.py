@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.nodes import compute_indices
+
+
+def test_compute_indices_skips_deployments_without_indices(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = []
+    for deployment in ["dep1", "dep2"]:
+        path = tmp_path / f"{deployment}.WAV"
+        if deployment == "dep1":
+            wavfile.write(path, 8000, rng.integers(-1000, 1000, 8000).astype(np.int16))
+        else:
+            # Every file of dep2 fails
+            path.write_bytes(b"not a wav file")
+        rows.append(
+            {
+                "filePath": str(path),
+                "mediaID": f"{deployment}.WAV",
+                "deploymentID": deployment,
+                "timestamp": "2023-05-01T05:00:00-0500",
+                "fileLength": 1,
+            }
+        )
+    parameters = {
+        "preprocess": {
+            "target_fs": 8000,
+            "filter_type": None,
+            "filter_cut": None,
+            "filter_order": None,
+            "nperseg": 256,
+            "noverlap": 0,
+        },
+        "indices_settings": {"RMS": None},
+        "execution": {"n_jobs": 1},
+    }
+
+    outputs = list(compute_indices(pd.DataFrame(rows), parameters))
+
+    indices = {key: value for output, _ in outputs for key, value in output.items()}
+    assert list(indices) == ["indices_dep1"]
+    assert indices["indices_dep1"]["timestamp"].tolist() == ["2023-05-01T05:00:00-0500"]
@@ -0,0 +1,45 @@
+import numpy as np
+from maad import features, sound, util
+
+from pamflow.pipelines.acoustic_indices.utils import AcousticIndices
+
+
+def test_acoustic_indices_graph_matches_maad():
+    rng = np.random.default_rng(0)
+    fs = 48000
+    s = rng.normal(0, 0.1, fs * 2)
+    Sxx, tn, fn, _ = sound.spectrogram(s, fs, nperseg=1024, noverlap=0, mode="amplitude")
+    params = {
+        "ACI": None,
+        "ADI": {"fmin": 0, "fmax": 24000, "bin_step": 1000, "index": "shannon", "dB_threshold": -40},
+        "BI": {"flim": [2000, 11000]},
+        "Hf": None,
+        "Ht": None,
+        "H": None,
+        "NDSI": {"flim_bioPh": [2000, 20000], "flim_antroPh": [0, 2000]},
+        "RMS": None,
+        "SC": {"dB_threshold": -70, "flim_LF": [1000, 20000]},
+    }
+
+    indices_computer = AcousticIndices(s, Sxx, tn, fn, params)
+    indices = indices_computer.compute_selected_indices()
+
+    Hf = features.frequency_entropy(Sxx**2)[0]
+    Ht = features.temporal_entropy(s)
+    expected = {
+        "ACI": features.acoustic_complexity_index(Sxx)[2],
+        "ADI": features.acoustic_diversity_index(Sxx, fn, 0, 24000, 1000, -40, "shannon"),
+        "BI": features.bioacoustics_index(Sxx, fn, (2000, 11000)),
+        "Hf": Hf,
+        "Ht": Ht,
+        "H": Hf * Ht,
+        "NDSI": features.soundscape_index(Sxx**2, fn, (2000, 20000), (0, 2000))[0],
+        "RMS": util.rms(s),
+        "SC": features.spectral_cover(util.amplitude2dB(Sxx), fn, -70, (1000, 20000))[0],
+    }
+    for index, value in expected.items():
+        assert np.isclose(indices[index], value, rtol=1e-12), index
+
+    # Shared intermediates are computed once and every node is timed
+    assert set(indices_computer.timings) >= set(params) | {"Sxx_power", "envelope"}
+    assert "Sxx_dB" in indices_computer.timings
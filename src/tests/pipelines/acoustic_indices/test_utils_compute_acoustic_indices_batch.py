@@ -0,0 +1,57 @@
+import numpy as np
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import (
+    compute_acoustic_indices_batch,
+    compute_acoustic_indices_single_file,
+)
+
+PARAMS_PREPROCESS = {
+    "nperseg": 1024,
+    "noverlap": 0,
+    "target_fs": 48000,
+    "filter_type": "bandpass",
+    "filter_cut": [300, 16000],
+    "filter_order": 3,
+}
+PARAMS_INDICES = {
+    "ACI": None,
+    "ADI": {"fmin": 0, "fmax": 24000, "bin_step": 1000, "index": "shannon", "dB_threshold": -40},
+    "BI": {"flim": [2000, 11000]},
+    "Hf": None,
+    "Ht": None,
+    "H": None,
+    "NDSI": {"flim_bioPh": [2000, 20000], "flim_antroPh": [0, 2000]},
+    "RMS": None,
+    "SC": {"dB_threshold": -70, "flim_LF": [1000, 20000]},
+}
+
+
+def test_batch_matches_single_file(tmp_path):
+    rng = np.random.default_rng(0)
+    fs = 48000
+    paths = []
+    # Files of different durations are stacked in different groups
+    for name, seconds in [("a", 2), ("b", 2), ("c", 3), ("d", 2)]:
+        t = np.arange(fs * seconds) / fs
+        s = rng.normal(0, 0.05, t.size) + 0.2 * np.sin(2 * np.pi * rng.uniform(1000, 8000) * t)
+        path = tmp_path / f"{name}.wav"
+        wavfile.write(path, fs, (s * 2**14).astype(np.int16))
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing.wav"))
+
+    results = compute_acoustic_indices_batch(paths, PARAMS_PREPROCESS, PARAMS_INDICES, False)
+
+    assert len(results) == len(paths)
+    for path, (indices, timings, error) in zip(paths[:-1], results):
+        expected = compute_acoustic_indices_single_file(
+            path, PARAMS_PREPROCESS, PARAMS_INDICES, False
+        )
+        assert error is None
+        assert list(indices.index) == list(expected.index)
+        np.testing.assert_allclose(indices.astype(float), expected.astype(float), rtol=1e-9)
+        assert set(timings) >= {"ACI", "ADI", "Ht"}
+
+    # Errors are reported per file
+    indices, _, error = results[-1]
+    assert indices is None and error
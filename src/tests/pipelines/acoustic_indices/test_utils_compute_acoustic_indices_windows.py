@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import (
+    add_timestamps,
+    compute_acoustic_indices_single_file,
+    compute_acoustic_indices_windows,
+)
+
+PARAMS_PREPROCESS = {
+    "nperseg": 1024,
+    "noverlap": 0,
+    "target_fs": 48000,
+    "filter_type": "bandpass",
+    "filter_cut": [300, 16000],
+    "filter_order": 3,
+    "window_seconds": 2,
+}
+PARAMS_INDICES = {
+    "ACI": None,
+    "ADI": {"fmin": 0, "fmax": 24000, "bin_step": 1000, "index": "shannon", "dB_threshold": -40},
+    "Hf": None,
+    "Ht": None,
+    "RMS": None,
+}
+
+
+def test_windows_match_split_files(tmp_path):
+    rng = np.random.default_rng(0)
+    fs = 96000
+    audio = (rng.normal(0, 0.05, fs * 5) * 2**15).astype(np.int16)
+    path = tmp_path / "long.wav"
+    wavfile.write(path, fs, audio)
+
+    df_indices = compute_acoustic_indices_windows(
+        str(path), PARAMS_PREPROCESS, PARAMS_INDICES, False
+    )
+
+    assert df_indices["windowStart"].tolist() == [0, 2, 4]
+    for window_start, row in df_indices.set_index("windowStart").iterrows():
+        window_path = tmp_path / f"window_{window_start}.wav"
+        wavfile.write(window_path, fs, audio[int(window_start * fs) : int((window_start + 2) * fs)])
+        expected = compute_acoustic_indices_single_file(
+            str(window_path), PARAMS_PREPROCESS, PARAMS_INDICES, False
+        )
+        np.testing.assert_allclose(row[expected.index].astype(float), expected.astype(float))
+
+
+def test_add_timestamps_of_windows():
+    media = pd.DataFrame(
+        {"mediaID": ["a", "b"], "timestamp": ["2023-05-01T23:59:00-0500", "2023-05-01T05:00:00-0500"]}
+    )
+    df_indices = pd.DataFrame({"mediaID": ["a", "a", "b"], "windowStart": [0.0, 60.0, 30.0]})
+
+    df_indices = add_timestamps(df_indices, media)
+
+    assert df_indices["timestamp"].tolist() == [
+        "2023-05-01T23:59:00-0500",
+        "2023-05-02T00:00:00-0500",
+        "2023-05-01T05:00:30-0500",
+    ]
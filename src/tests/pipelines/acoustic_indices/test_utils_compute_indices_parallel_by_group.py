@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import compute_indices_parallel_by_group
+
+
+def test_compute_indices_parallel_by_group_yields_each_deployment(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = []
+    for deployment, n_files in [("dep2", 1), ("dep1", 2)]:
+        for i in range(n_files):
+            path = str(tmp_path / f"{deployment}_{i}.WAV")
+            wavfile.write(path, 8000, rng.integers(-1000, 1000, 8000).astype(np.int16))
+            rows.append({"filePath": path, "mediaID": f"{deployment}_{i}.WAV", "deploymentID": deployment})
+    media = pd.DataFrame(rows)
+    params_preprocess = {
+        "target_fs": 8000,
+        "filter_type": None,
+        "filter_cut": None,
+        "filter_order": None,
+        "nperseg": 256,
+        "noverlap": 0,
+    }
+
+    results = dict(
+        compute_indices_parallel_by_group(
+            media, params_preprocess, {"RMS": None}, "deploymentID", n_jobs=1
+        )
+    )
+
+    assert sorted(results) == ["dep1", "dep2"]
+    assert sorted(results["dep1"]["mediaID"]) == ["dep1_0.WAV", "dep1_1.WAV"]
+    assert results["dep2"]["mediaID"].tolist() == ["dep2_0.WAV"]
+    assert (results["dep1"]["RMS"] > 0).all()
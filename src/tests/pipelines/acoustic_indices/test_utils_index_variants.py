@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import (
+    AcousticIndices,
+    compute_acoustic_indices_batch,
+    compute_acoustic_indices_single_file,
+)
+
+PARAMS_PREPROCESS = {
+    "nperseg": 1024,
+    "noverlap": 0,
+    "target_fs": 48000,
+    "filter_type": "bandpass",
+    "filter_cut": [300, 16000],
+    "filter_order": 3,
+}
+ADI = {"fmin": 0, "fmax": 24000, "bin_step": 1000, "index": "shannon"}
+
+
+def test_variants_match_separate_runs(tmp_path):
+    rng = np.random.default_rng(0)
+    fs = 48000
+    t = np.arange(2 * fs) / fs
+    s = rng.normal(0, 0.05, t.size) + 0.2 * np.sin(2 * np.pi * 4000 * t)
+    path = str(tmp_path / "a.wav")
+    wavfile.write(path, fs, (s * 2**14).astype(np.int16))
+
+    params_indices = {
+        "ADI": [{**ADI, "dB_threshold": -30, "suffix": 30}, {**ADI, "dB_threshold": -50}],
+        "NDSI": [
+            {"flim_bioPh": [2000, 20000], "flim_antroPh": [0, 2000]},
+            {"flim_bioPh": [2000, 11000], "flim_antroPh": [0, 2000]},
+        ],
+        "H": None,
+    }
+    indices = compute_acoustic_indices_single_file(
+        path, PARAMS_PREPROCESS, params_indices, False
+    )
+
+    assert list(indices.index) == ["ADI_30", "ADI_2", "NDSI_1", "NDSI_2", "H"]
+    for name, index, params in [
+        ("ADI_30", "ADI", {**ADI, "dB_threshold": -30}),
+        ("ADI_2", "ADI", {**ADI, "dB_threshold": -50}),
+        ("NDSI_2", "NDSI", params_indices["NDSI"][1]),
+    ]:
+        expected = compute_acoustic_indices_single_file(
+            path, PARAMS_PREPROCESS, {index: params}, False
+        )
+        assert indices[name] == expected[index]
+    assert indices["ADI_30"] != indices["ADI_2"]
+
+    # Variants are also computed on stacked spectrograms
+    [(batch, _, error)] = compute_acoustic_indices_batch(
+        [path], PARAMS_PREPROCESS, params_indices, False
+    )
+    assert error is None
+    np.testing.assert_allclose(batch.astype(float), indices.astype(float), rtol=1e-9)
+
+
+def test_duplicated_variant_names_raise():
+    params = {"ADI": [{"suffix": 1}, {}], "ADI_3": None, "BI": [{"suffix": "a"}, {"suffix": "a"}]}
+    with pytest.raises(ValueError, match="BI_a"):
+        AcousticIndices.expand_variants(params)
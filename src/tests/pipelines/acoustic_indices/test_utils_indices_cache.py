@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import IndicesCache, compute_indices_parallel_by_group
+
+PARAMS_PREPROCESS = {
+    "target_fs": 8000,
+    "filter_type": None,
+    "filter_cut": None,
+    "filter_order": None,
+    "nperseg": 256,
+    "noverlap": 0,
+}
+
+
+def test_indices_cache_serves_unchanged_files(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = []
+    for deployment, n_files in [("dep1", 2), ("dep2", 1)]:
+        for i in range(n_files):
+            path = str(tmp_path / f"{deployment}_{i}.WAV")
+            wavfile.write(path, 8000, rng.integers(-1000, 1000, 8000).astype(np.int16))
+            rows.append({"filePath": path, "mediaID": f"{deployment}_{i}.WAV", "deploymentID": deployment})
+    media = pd.DataFrame(rows)
+    cache_path = str(tmp_path / "cache" / "indices_cache.db")
+
+    def run(params_indices):
+        cache = IndicesCache(cache_path, PARAMS_PREPROCESS, params_indices)
+        results = dict(
+            compute_indices_parallel_by_group(
+                media, PARAMS_PREPROCESS, params_indices, "deploymentID", n_jobs=1, cache=cache
+            )
+        )
+        cache.close()
+        return results
+
+    first = run({"RMS": None})
+
+    # Unchanged files are read from the cache
+    cache = IndicesCache(cache_path, PARAMS_PREPROCESS, {"RMS": None})
+    pending, cached = cache.split_files(media.to_dict(orient="records"))
+    assert pending == [] and sorted(cached) == sorted(media["mediaID"])
+
+    # A modified file is computed again, the others are not
+    wavfile.write(rows[0]["filePath"], 8000, rng.integers(-10, 10, 8000).astype(np.int16))
+    os.utime(rows[0]["filePath"], (0, 0))
+    pending, cached = cache.split_files(media.to_dict(orient="records"))
+    assert [file["mediaID"] for file in pending] == ["dep1_0.WAV"]
+    cache.close()
+
+    second = run({"RMS": None})
+    assert sorted(second) == ["dep1", "dep2"]
+    pd.testing.assert_frame_equal(second["dep2"], first["dep2"])
+    rms = second["dep1"].set_index("mediaID")["RMS"]
+    assert rms["dep1_0.WAV"] < first["dep1"].set_index("mediaID")["RMS"]["dep1_0.WAV"]
+
+    # Changing the parameters invalidates the cache
+    cache = IndicesCache(cache_path, PARAMS_PREPROCESS, {"RMS": None, "Ht": None})
+    pending, cached = cache.split_files(media.to_dict(orient="records"))
+    assert len(pending) == len(media) and cached == {}
+    cache.close()
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from maad import sound
+
+from pamflow.pipelines.acoustic_indices.utils import resample, select_bandwidth
+
+
+@pytest.mark.parametrize("fs", [48000, 96000, 192000, 44100])
+def test_resample_matches_maad(fs):
+    rng = np.random.default_rng(0)
+    s = rng.normal(0, 0.1, fs)
+
+    s_resampled = resample(s, fs, 48000)
+
+    np.testing.assert_array_equal(
+        s_resampled, sound.resample(s, fs, 48000, res_type="scipy_poly")
+    )
+    if fs == 48000:
+        assert s_resampled is s
+
+
+def test_select_bandwidth_matches_maad():
+    rng = np.random.default_rng(0)
+    s = rng.normal(0, 0.1, 48000)
+
+    for _ in range(2):
+        s_filtered = select_bandwidth(s, 48000, "bandpass", [300, 16000], 3)
+        np.testing.assert_array_equal(
+            s_filtered,
+            sound.select_bandwidth(s, 48000, ftype="bandpass", fcut=[300, 16000], forder=3),
+        )
+
@@ -0,0 +1,25 @@
+import numpy as np
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import preprocess_audio_file
+
+
+def test_preprocess_audio_float32(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "file.wav"
+    wavfile.write(path, 96000, (rng.normal(0, 0.1, 96000) * 2**15).astype(np.int16))
+    params = {
+        "nperseg": 1024,
+        "noverlap": 0,
+        "target_fs": 48000,
+        "filter_type": "bandpass",
+        "filter_cut": [300, 16000],
+        "filter_order": 3,
+    }
+
+    s64, Sxx64, _, _ = preprocess_audio_file(str(path), params)
+    s32, Sxx32, _, _ = preprocess_audio_file(str(path), {**params, "precision": "float32"})
+
+    assert s32.dtype == np.float32 and Sxx32.dtype == np.float32
+    np.testing.assert_allclose(s32, s64, atol=1e-5)
+    np.testing.assert_allclose(Sxx32, Sxx64, rtol=1e-3, atol=1e-5)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+
+from pamflow.pipelines.acoustic_indices.utils import (
+    compute_indices_parallel_by_group,
+    profile_table,
+)
+
+
+def test_profile_table_has_one_row_per_file(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = []
+    for i in range(2):
+        path = str(tmp_path / f"file_{i}.WAV")
+        wavfile.write(path, 16000, rng.integers(-1000, 1000, 16000).astype(np.int16))
+        rows.append(
+            {
+                "filePath": path,
+                "mediaID": f"file_{i}.WAV",
+                "deploymentID": "dep1",
+                "sampleRate": 16000,
+                "fileLength": 1.0,
+                "numChannels": 1,
+            }
+        )
+    media = pd.DataFrame(rows)
+    params_preprocess = {
+        "target_fs": 8000,
+        "filter_type": "highpass",
+        "filter_cut": 500,
+        "filter_order": 3,
+        "nperseg": 256,
+        "noverlap": 0,
+    }
+    profile = []
+
+    list(
+        compute_indices_parallel_by_group(
+            media, params_preprocess, {"RMS": None, "Ht": None}, n_jobs=1, profile=profile
+        )
+    )
+    df_profile = profile_table(profile, media)
+
+    assert sorted(df_profile["mediaID"]) == ["file_0.WAV", "file_1.WAV"]
+    assert (df_profile["sampleRate"] == 16000).all()
+    assert {"load", "resample", "filter", "spectrogram", "RMS", "Ht"} <= set(df_profile.columns)
+    stages = df_profile.columns.drop(
+        ["mediaID", "deploymentID", "sampleRate", "fileLength", "numChannels", "total"]
+    )
+    assert (df_profile[stages] >= 0).all().all()
+    np.testing.assert_allclose(df_profile["total"], df_profile[stages].sum(axis=1))
@@ -0,0 +1,127 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+from kedro_datasets.pandas import ParquetDataset
+from scipy.io import wavfile
+
+from pamflow.pipelines.analyze import nodes
+from pamflow.pipelines.analyze.utils import analyze_samples
+from pamflow.utils import open_wav
+
+ACOUSTIC_INDICES_PARAMETERS = {
+    "preprocess": {
+        "nperseg": 1024,
+        "noverlap": 0,
+        "target_fs": 48000,
+        "filter_type": "bandpass",
+        "filter_cut": [300, 16000],
+        "filter_order": 3,
+    },
+    "indices_settings": {"ACI": None, "H": None},
+    "execution": {"cache_path": None},
+}
+GRAPHICAL_SOUNDSCAPE_PARAMETERS = {
+    "target_fs": 48000,
+    "nperseg": 256,
+    "noverlap": 128,
+    "db_range": 80,
+    "min_distance": 1,
+    "threshold_abs": -70,
+    "cache_path": None,
+}
+
+
+def analyze_files_without_detections(
+    files, params_preprocess, params_indices, params_soundscape, batch_size, prescreen=None
+):
+    """`analyze_files` without BirdNET: one detection per file read."""
+    results, detections, errors = {}, [], []
+    for file in files:
+        try:
+            sr, data = open_wav(file["filePath"])
+        except Exception as e:
+            errors.append((file["mediaID"], str(e)))
+            continue
+        results[file["mediaID"]] = analyze_samples(
+            file["filePath"], np.array(data), sr, params_preprocess, params_indices,
+            params_soundscape, file["analyses"],
+        )
+        detections.append(
+            {
+                "mediaID": file["mediaID"],
+                "deploymentID": file["deploymentID"],
+                "start_time": 0.0,
+                "end_time": 3.0,
+                "scientific_name": "Turdus fuscater",
+                "confidence": 0.9,
+                "classifiedBy": "test",
+            }
+        )
+    return results, detections, {"errors": errors}
+
+
+def no_worker_setup(*args):
+    pass
+
+
+def test_analyze_media_with_a_failed_deployment(tmp_path, monkeypatch):
+    monkeypatch.setattr(nodes, "analyze_files", analyze_files_without_detections)
+    monkeypatch.setattr(nodes, "init_species_detection_worker", no_worker_setup)
+    monkeypatch.setattr(nodes, "compute_species_lists", lambda files: {})
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for deployment in ["A", "B"]:
+        for hour in [5, 6]:
+            name = f"{deployment}_{hour}.wav"
+            if deployment == "B":
+                # Files of B can not be read
+                (tmp_path / name).write_bytes(b"not a wav file")
+            else:
+                wavfile.write(tmp_path / name, 48000, (rng.normal(0, 0.1, 48000) * 2**14).astype(np.int16))
+            rows.append(
+                {
+                    "mediaID": name,
+                    "deploymentID": deployment,
+                    "filePath": str(tmp_path / name),
+                    "timestamp": f"2023-05-01T{hour:02d}:00:00-0500",
+                    "fileLength": 1,
+                }
+            )
+    media = pd.DataFrame(rows)
+    deployments = pd.DataFrame({"deploymentID": ["A", "B"], "latitude": [4.6, 4.7], "longitude": [-74.1, -74.0]})
+
+    outputs = list(
+        nodes.analyze_media(
+            media,
+            deployments,
+            ACOUSTIC_INDICES_PARAMETERS,
+            GRAPHICAL_SOUNDSCAPE_PARAMETERS,
+            {"filter_by_week": False},
+            {"n_jobs": 1, "files_per_task": 1},
+        )
+    )
+
+    indices, graphs, _, quality, observations = (
+        {key: value for output in outputs for key, value in output[i].items()} for i in range(5)
+    )
+    assert list(indices) == ["indices_A"] and list(graphs) == ["graph_A"]
+    assert quality["quality_B"]["error"].notna().all()
+    assert quality["quality_A"]["error"].isna().all()
+    assert len(observations["observations_A"]) == 2 and observations["observations_B"].empty
+
+    # The observations of each deployment are gathered once, through Parquet partitions
+    loaders = {}
+    for key, value in observations.items():
+        dataset = ParquetDataset(filepath=str(tmp_path / f"{key}.parquet"))
+        dataset.save(value)
+        loaders[key] = dataset.load
+    loaders["observations_C"] = lambda: 1 / 0
+
+    collected = nodes.collect_observations(loaders, media)
+
+    assert collected["mediaID"].astype(str).tolist() == ["A_5.wav", "A_6.wav"]
+    assert collected["observationID"].is_unique
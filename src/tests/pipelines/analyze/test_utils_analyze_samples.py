@@ -0,0 +1,98 @@
+import numpy as np
+from scipy.io import wavfile
+
+from pamflow.utils import open_wav
+from pamflow.pipelines.analyze.utils import analyze_samples
+from pamflow.pipelines.acoustic_indices.utils import compute_acoustic_indices_single_file
+from pamflow.pipelines.graphical_soundscape.utils import spectral_peak_density
+from pamflow.pipelines.species_detection.utils import (
+    decoded_birdnet_windows,
+    read_birdnet_windows,
+)
+
+PARAMS_PREPROCESS = {
+    "nperseg": 1024,
+    "noverlap": 0,
+    "target_fs": 48000,
+    "filter_type": "bandpass",
+    "filter_cut": [300, 16000],
+    "filter_order": 3,
+}
+PARAMS_INDICES = {
+    "ACI": None,
+    "ADI": {"fmin": 0, "fmax": 24000, "bin_step": 1000, "index": "shannon", "dB_threshold": -40},
+    "H": None,
+    "NDSI": {"flim_bioPh": [2000, 20000], "flim_antroPh": [0, 2000]},
+}
+PARAMS_SOUNDSCAPE = {
+    "target_fs": 48000,
+    "nperseg": 256,
+    "noverlap": 128,
+    "db_range": 80,
+    "min_distance": 1,
+    "threshold_abs": -70,
+}
+
+
+def write_wav(path, fs, seconds, channels=1, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(fs * seconds)) / fs
+    s = rng.normal(0, 0.05, (channels, t.size)) + 0.2 * np.sin(2 * np.pi * 3000 * t)
+    wavfile.write(path, fs, (s.T.squeeze() * 2**14).astype(np.int16))
+    return str(path)
+
+
+def test_analyze_samples_matches_separate_analyses(tmp_path):
+    # Resampled from 96 kHz once for both analyses
+    path = write_wav(tmp_path / "a.wav", 96000, 2)
+    sr, data = open_wav(path)
+
+    result = analyze_samples(
+        path, np.array(data), sr, PARAMS_PREPROCESS, PARAMS_INDICES, PARAMS_SOUNDSCAPE
+    )
+
+    expected = compute_acoustic_indices_single_file(path, PARAMS_PREPROCESS, PARAMS_INDICES, False)
+    assert list(result["indices"].index) == list(expected.index)
+    np.testing.assert_allclose(result["indices"].astype(float), expected.astype(float), rtol=1e-12)
+
+    expected = spectral_peak_density(path, **PARAMS_SOUNDSCAPE)
+    assert list(result["peak_density"].columns) == list(expected.columns)
+    assert list(result["peak_density"].index) == list(expected.index)
+    np.testing.assert_array_equal(result["peak_density"].values, expected.values)
+
+
+def test_analyze_samples_reports_errors_per_analysis(tmp_path):
+    path = write_wav(tmp_path / "a.wav", 48000, 2)
+    sr, data = open_wav(path)
+    # A threshold below the spectrogram fails the peak detection only
+    params_soundscape = {**PARAMS_SOUNDSCAPE, "threshold_abs": -1000}
+
+    result = analyze_samples(
+        path, np.array(data), sr, PARAMS_PREPROCESS, PARAMS_INDICES, params_soundscape
+    )
+
+    assert "indices" in result and "indices_error" not in result
+    assert "peak_density" not in result and result["peak_density_error"]
+
+
+def test_decoded_birdnet_windows_match_read_windows(tmp_path):
+    for name, fs, channels in [("mono", 44100, 1), ("stereo", 96000, 2)]:
+        path = write_wav(tmp_path / f"{name}.wav", fs, 7.5, channels)
+        sr, data = open_wav(path)
+
+        windows = decoded_birdnet_windows(np.array(data), sr)
+
+        np.testing.assert_array_equal(windows, read_birdnet_windows(path))
+
+
+def test_analyze_samples_skips_cached_analyses(tmp_path):
+    path = write_wav(tmp_path / "a.wav", 48000, 2)
+    sr, data = open_wav(path)
+
+    result = analyze_samples(
+        path, np.array(data), sr, PARAMS_PREPROCESS, PARAMS_INDICES, PARAMS_SOUNDSCAPE, analyses=[]
+    )
+
+    # The quality metrics are computed for every file read
+    assert set(result) == {"quality"}
+    assert result["quality"]["duration"] == 2
@@ -0,0 +1,80 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+from maad import util
+from scipy.io import wavfile
+
+from pamflow.pipelines.data_preparation.utils import read_wav_header, scan_media_headers
+
+
+def chunk(chunk_id, body):
+    # Chunks of odd size are padded to 2 bytes
+    return struct.pack("<4sI", chunk_id, len(body)) + body + b"\x00" * (len(body) % 2)
+
+
+def write_riff(path, chunks):
+    body = b"WAVE" + b"".join(chunks)
+    path.write_bytes(struct.pack("<4sI", b"RIFF", len(body)) + body)
+
+
+def pcm_chunks(fs, channels, bits, n_samples, format_tag=1):
+    width = bits // 8
+    fmt = struct.pack("<HHIIHH", format_tag, channels, fs, fs * channels * width, channels * width, bits)
+    return chunk(b"fmt ", fmt), chunk(b"data", b"\x01" * (n_samples * channels * width))
+
+
+def test_scan_matches_maad_metadata(tmp_path):
+    for sensor in ["S01", "S02"]:
+        (tmp_path / sensor / "card").mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    wavfile.write(tmp_path / "S01" / "S01_20230501_050000.WAV", 48000, rng.integers(-100, 100, 4800, dtype=np.int16))
+    wavfile.write(tmp_path / "S01" / "S01_20230501_060000.wav", 96000, rng.integers(-100, 100, (9601, 2), dtype=np.int16))
+    # 24 bit file with an odd sized chunk before the audio, in a subfolder
+    fmt, data = pcm_chunks(44100, 1, 24, 44101)
+    write_riff(tmp_path / "S02" / "card" / "S02_20230502_000000.WAV", [fmt, chunk(b"junk", b"abc"), data])
+    # Name out of format and unreadable file are reported with null values
+    wavfile.write(tmp_path / "S02" / "recording.wav", 8000, np.zeros(800, dtype=np.int16))
+    (tmp_path / "S02" / "S02_20230502_010000.WAV").write_bytes(b"not a wav file")
+    # Hidden files and other extensions are not listed
+    (tmp_path / "S02" / "._S02_20230502_020000.WAV").write_bytes(b"resource fork")
+    (tmp_path / "S02" / "S02_20230502_030000.txt").write_bytes(b"notes")
+
+    metadata = scan_media_headers(str(tmp_path), n_threads=4)
+    expected = util.get_metadata_dir(str(tmp_path), False)
+
+    expected = expected.sort_values("path_audio").reset_index(drop=True)
+    assert list(metadata.columns) == list(expected.columns) + ["comment"]
+    pd.testing.assert_frame_equal(
+        metadata.drop(columns="comment"), expected, check_dtype=False
+    )
+    assert metadata["comment"].isna().all()
+
+
+def test_read_wav_header_comments(tmp_path):
+    fmt, data = pcm_chunks(250000, 1, 16, 1000)
+    info = chunk(b"LIST", b"INFO" + chunk(b"IART", b"AudioMoth") + chunk(b"ICMT", b"Recorded by AudioMoth\x00"))
+    guano = chunk(b"guan", b"GUANO|Version:1.0\nMake:Wildlife Acoustics")
+    path = tmp_path / "S01_20230501_050000.WAV"
+    write_riff(path, [fmt, info, data, guano])
+
+    header = read_wav_header(str(path))
+    assert header["sample_rate"] == 250000
+    assert header["samples"] == 1000
+    assert header["comment"] == "Recorded by AudioMoth\nGUANO|Version:1.0\nMake:Wildlife Acoustics"
+
+    # Without comments the scan stops at the audio data
+    header = read_wav_header(str(path), read_comments=False)
+    assert header["comment"] is None and header["samples"] == 1000
+
+
+def test_read_wav_header_rejects_formats_maad_can_not_read(tmp_path):
+    path = tmp_path / "S01_20230501_050000.WAV"
+    # Floating point and extensible files are rejected as by maad.util.audio_header
+    for format_tag in [0x0003, 0xFFFE]:
+        write_riff(path, list(pcm_chunks(48000, 1, 32, 100, format_tag)))
+        with pytest.raises(ValueError, match="Unsupported WAVE format"):
+            read_wav_header(str(path))
+        with pytest.raises(Exception):
+            util.audio_header(str(path))
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+from maad.features import graphical_soundscape as graphical_soundscape_maad
+from maad.rois import spectrogram_local_max
+from scipy.io import wavfile
+
+from pamflow.pipelines.graphical_soundscape.utils import (
+    PeakDensityCache,
+    graphical_soundscape,
+    graphical_soundscape_by_group,
+    local_max_peak_counts,
+)
+
+
+def test_graphical_soundscape_matches_maad(tmp_path):
+    rng = np.random.default_rng(0)
+    fs = 48000
+    t = np.arange(fs) / fs
+    rows = []
+    for hour in [0, 1, 1]:
+        s = rng.normal(0, 0.01, fs) + 0.3 * np.sin(2 * np.pi * rng.uniform(2000, 10000) * t)
+        path = str(tmp_path / f"file_{len(rows)}.wav")
+        wavfile.write(path, fs, (s * 2**14).astype(np.int16))
+        rows.append({"filePath": path, "time": hour})
+    data = pd.DataFrame(rows)
+    args = (-55, "filePath", "time", 48000, 256, 0, 80, 5)
+
+    expected = graphical_soundscape_maad(data.copy(), *args, n_jobs=1, verbose=False)
+
+    pd.testing.assert_frame_equal(graphical_soundscape(data, *args, n_jobs=1), expected)
+    result = graphical_soundscape(data, *args, n_jobs=1, precision="float32")
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result.values, expected.values, atol=0.01)
+
+
+def test_graphical_soundscape_by_group_matches_each_group(tmp_path):
+    rng = np.random.default_rng(1)
+    fs = 48000
+    rows = []
+    for deployment, seconds in [("dep1", 1), ("dep1", 1), ("dep1", 2), ("dep2", 1), ("dep3", 1)]:
+        t = np.arange(fs * seconds) / fs
+        s = rng.normal(0, 0.01, t.size) + 0.3 * np.sin(2 * np.pi * rng.uniform(2000, 10000) * t)
+        path = str(tmp_path / f"{deployment}_{len(rows)}.wav")
+        wavfile.write(path, fs, (s * 2**14).astype(np.int16))
+        rows.append({"deploymentID": deployment, "filePath": path, "time": len(rows) % 2})
+    data = pd.DataFrame(rows)
+    args = (-55, "filePath", "time", 48000, 256, 0, 80, 5)
+
+    results = dict(
+        graphical_soundscape_by_group(
+            data, args[0], "deploymentID", *args[1:], n_jobs=2, files_per_task=2
+        )
+    )
+
+    assert sorted(results) == ["dep1", "dep2", "dep3"]
+    for deployment, data_deployment in data.groupby("deploymentID"):
+        expected = graphical_soundscape_maad(
+            data_deployment.copy(), *args, n_jobs=1, verbose=False
+        )
+        pd.testing.assert_frame_equal(results[deployment], expected)
+
+
+def test_local_max_peak_counts_matches_maad_with_plateaus():
+    rng = np.random.default_rng(2)
+    # Few distinct values give many equal neighbouring peaks
+    Sxx_db = rng.integers(-80, -40, size=(3, 40, 60)).astype(float)
+    Sxx_db[1, 10:20, 10:30] = -40
+    fn, tn = np.arange(40), np.arange(60)
+    ext = [0, 60, 0, 40]
+
+    for min_distance in [1, 3, 5]:
+        counts = local_max_peak_counts(Sxx_db, min_distance, -60)
+        for Sxx_file, count in zip(Sxx_db, counts):
+            _, peak_freq = spectrogram_local_max(Sxx_file, tn, fn, ext, min_distance, -60)
+            np.testing.assert_array_equal(count, np.bincount(peak_freq, minlength=40))
+
+
+def test_peak_density_cache_reuses_files(tmp_path):
+    rng = np.random.default_rng(3)
+    fs = 48000
+    t = np.arange(fs) / fs
+    rows = []
+    for i in range(3):
+        s = rng.normal(0, 0.01, fs) + 0.3 * np.sin(2 * np.pi * rng.uniform(2000, 10000) * t)
+        path = str(tmp_path / f"file_{i}.wav")
+        wavfile.write(path, fs, (s * 2**14).astype(np.int16))
+        rows.append({"deploymentID": "dep1", "mediaID": f"file_{i}.wav", "filePath": path, "time": i % 2})
+    data = pd.DataFrame(rows)
+    args = (-55, "deploymentID", "filePath", "time", 48000, 256, 0, 80, 5)
+    params = {"threshold_abs": -55, "target_fs": 48000, "nperseg": 256}
+
+    cache = PeakDensityCache(str(tmp_path / "cache.db"), params)
+    dict(graphical_soundscape_by_group(data.iloc[:2], *args, n_jobs=1, cache=cache))
+    # Only the new file is computed
+    pending, cached = cache.split_files(data[["mediaID", "filePath"]].to_dict(orient="records"))
+    assert [file["mediaID"] for file in pending] == ["file_2.wav"]
+    assert sorted(cached) == ["file_0.wav", "file_1.wav"]
+
+    updated = dict(graphical_soundscape_by_group(data, *args, n_jobs=1, cache=cache))
+    full = dict(graphical_soundscape_by_group(data, *args, n_jobs=1))
+    pd.testing.assert_frame_equal(updated["dep1"], full["dep1"])
+
+    # Cached densities can be binned again without reading the audio
+    table = cache.to_frame()
+    cache.close()
+    assert sorted(table.index) == ["file_0.wav", "file_1.wav", "file_2.wav"]
+    # Densities and number of frames give back the number of peaks
+    counts = table.drop(columns="nFrames").mul(table["nFrames"], axis=0)
+    np.testing.assert_allclose(counts, counts.round(), atol=1e-9)
+    assert counts.values.sum() > 0
+    single_bin = dict(graphical_soundscape_by_group(data.assign(time=0), *args, n_jobs=1))
+    np.testing.assert_allclose(
+        table.drop(columns="nFrames").mean().values, single_bin["dep1"].iloc[0].values
+    )
+
+
+def test_graphical_soundscape_by_group_raises_on_failed_files(tmp_path):
+    fs = 48000
+    path = str(tmp_path / "file_0.wav")
+    wavfile.write(path, fs, (np.random.default_rng(4).normal(0, 0.1, fs) * 2**14).astype(np.int16))
+    data = pd.DataFrame(
+        [
+            {"deploymentID": "dep1", "filePath": path, "time": 0},
+            {"deploymentID": "dep1", "filePath": str(tmp_path / "missing.wav"), "time": 0},
+        ]
+    )
+
+    # As maad, a file that can not be processed stops the computation
+    with pytest.raises(ValueError, match="missing.wav"):
+        dict(graphical_soundscape_by_group(data, -55, "deploymentID", n_jobs=1, nperseg=256))
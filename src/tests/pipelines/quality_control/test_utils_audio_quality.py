@@ -0,0 +1,25 @@
+import numpy as np
+
+from pamflow.pipelines.quality_control.utils import audio_quality_metrics
+
+
+def test_audio_quality_metrics():
+    # A full scale square wave on the left channel, clipped once per period
+    left = np.tile(np.array([2**15 - 1, -(2**15)], dtype=np.int16), 24000)
+    data = np.stack([left, np.zeros_like(left)], axis=1)
+
+    metrics = audio_quality_metrics(data, 48000)
+
+    assert metrics["sampleRate"] == 48000 and metrics["channels"] == 2
+    assert metrics["duration"] == 1
+    assert metrics["clippingRatio"] == 1
+    np.testing.assert_allclose(metrics["dcOffset"], -0.5 / 2**15)
+    np.testing.assert_allclose(metrics["rmsLevel"], 0, atol=1e-3)
+    np.testing.assert_allclose(metrics["peakLevel"], 0, atol=1e-3)
+
+
+def test_audio_quality_metrics_of_silence():
+    metrics = audio_quality_metrics(np.zeros(4800, dtype=np.int16), 48000)
+
+    assert metrics["clippingRatio"] == 0 and metrics["dcOffset"] == 0
+    assert metrics["rmsLevel"] == -np.inf and metrics["peakLevel"] == -np.inf
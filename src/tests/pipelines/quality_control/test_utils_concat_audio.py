@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from maad import sound
+from scipy.io import wavfile
+
+from pamflow.pipelines.quality_control.utils import concat_audio
+
+
+def test_concat_audio_reads_the_start_of_each_file(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for name in ["a", "b"]:
+        data = (rng.normal(0.05, 0.1, 48000 * 3) * 2**15).astype(np.int16)
+        wavfile.write(tmp_path / f"{name}.wav", 48000, data)
+        paths.append(str(tmp_path / f"{name}.wav"))
+
+    long_wav, fs = concat_audio(paths, sample_len=0.5)
+
+    assert fs == 48000 and long_wav.dtype == np.float64
+    assert long_wav.shape == (48000,)
+    # Same samples as loading each whole file with maad and trimming it
+    s, _ = sound.load(paths[1])
+    np.testing.assert_allclose(long_wav[24000:], sound.trim(s, fs, 0, 0.5), atol=1e-12)
+
+    long_wav_32, _ = concat_audio(paths, sample_len=0.5, precision="float32")
+    assert long_wav_32.dtype == np.float32
+    np.testing.assert_allclose(long_wav_32, long_wav, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        concat_audio(paths, sample_len=4)
@@ -0,0 +1,75 @@
+import pandas as pd
+
+from pamflow.pipelines.species_detection.utils import DetectionLedger
+
+
+def _detection(media_id, start, name):
+    return {
+        "common_name": name,
+        "scientific_name": f"Genus {name}",
+        "start_time": start,
+        "end_time": start + 3.0,
+        "confidence": 0.5,
+        "label": f"Genus {name}_{name}",
+        "mediaID": media_id,
+        "deploymentID": "dep1",
+        "classifiedBy": "Birdnet 2.4",
+    }
+
+
+def test_detection_ledger_skips_analyzed_files(tmp_path):
+    # Two audio files, only the first one is analyzed in the first run
+    file_a = tmp_path / "a.WAV"
+    file_b = tmp_path / "b.WAV"
+    file_a.write_bytes(b"a" * 10)
+    file_b.write_bytes(b"b" * 10)
+    files = [
+        {"filePath": str(path), "latitude": 4.5, "longitude": -74.0, "mediaID": path.name, "deploymentID": "dep1"}
+        for path in (file_a, file_b)
+    ]
+    ledger_path = str(tmp_path / "ledger" / "ledger.db")
+
+    ledger = DetectionLedger(ledger_path, {"birdnetVersion": "2.4"})
+    pending, done = ledger.split_files([dict(f) for f in files])
+    assert [f["mediaID"] for f in pending] == ["a.WAV", "b.WAV"]
+    assert done == []
+    ledger.record(pending[:1], [_detection("a.WAV", 0.0, "x"), _detection("a.WAV", 3.0, "y")])
+    ledger.close()
+
+    # A new run only needs to analyze the second file
+    ledger = DetectionLedger(ledger_path, {"birdnetVersion": "2.4"})
+    pending, done = ledger.split_files([dict(f) for f in files])
+    assert [f["mediaID"] for f in pending] == ["b.WAV"]
+    assert done == ["a.WAV"]
+    detections = pd.DataFrame([d for chunk in ledger.iter_detections(done) for d in chunk])
+    assert sorted(detections["common_name"]) == ["x", "y"]
+    ledger.close()
+
+    # Changed files and changed settings are analyzed again
+    file_a.write_bytes(b"a" * 20)
+    ledger = DetectionLedger(ledger_path, {"birdnetVersion": "2.4"})
+    pending, done = ledger.split_files([dict(f) for f in files])
+    assert done == []
+    ledger.close()
+
+    ledger = DetectionLedger(ledger_path, {"birdnetVersion": "2.5"})
+    pending, done = ledger.split_files([dict(f) for f in files])
+    assert len(pending) == 2
+    ledger.close()
+
+
+def test_detection_ledger_reads_only_requested_files(tmp_path):
+    files = []
+    for name in ("a.WAV", "b.WAV", "c.WAV"):
+        (tmp_path / name).write_bytes(b"x" * 10)
+        files.append({"filePath": str(tmp_path / name), "latitude": 4.5, "longitude": -74.0, "mediaID": name, "deploymentID": "dep1"})
+    ledger = DetectionLedger(str(tmp_path / "ledger.db"), {"birdnetVersion": "2.4"})
+    pending, _ = ledger.split_files(files)
+    ledger.record(pending, [_detection(f["mediaID"], 0.0, f["mediaID"][0]) for f in pending])
+
+    detections = [d for chunk in ledger.iter_detections(["a.WAV", "c.WAV"], 1) for d in chunk]
+    assert sorted(d["mediaID"] for d in detections) == ["a.WAV", "c.WAV"]
+    # Each call reads its own files
+    detections = [d for chunk in ledger.iter_detections(["b.WAV"]) for d in chunk]
+    assert [d["mediaID"] for d in detections] == ["b.WAV"]
+    ledger.close()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from pamflow.datasets.pamDP.observations import Observations
+from pamflow.pipelines.species_detection.utils import ObservationsTableBuilder
+
+
+def _detection(media_id, deployment_id, start, name):
+    return {
+        "common_name": name,
+        "scientific_name": f"Genus {name}",
+        "start_time": start,
+        "end_time": start + 3.0,
+        "confidence": 0.51234,
+        "label": f"Genus {name}_{name}",
+        "mediaID": media_id,
+        "deploymentID": deployment_id,
+        "classifiedBy": "Birdnet 2.4",
+    }
+
+
+def test_observations_table_builder_is_compact_and_valid(tmp_path):
+    builder = ObservationsTableBuilder(chunk_size=2)
+    builder.add([_detection("a.WAV", "dep1", 0.0, "x"), _detection("a.WAV", "dep1", 3.0, "y")])
+    builder.add([_detection("b.WAV", "dep2", 0.0, "z")])
+    observations = builder.read()
+
+    assert observations["observationID"].tolist() == [0, 1, 2]
+    assert observations["scientificName"].tolist() == ["Genus x", "Genus y", "Genus z"]
+    # Chunks with different categories are combined without falling back to objects
+    for column in ["deploymentID", "mediaID", "scientificName", "observationType", "sex"]:
+        assert isinstance(observations[column].dtype, pd.CategoricalDtype)
+    assert observations["sex"].isna().all()
+    assert observations["eventStart"].dtype == np.float32
+    assert observations["classificationProbability"].dtype == np.float32
+
+    dataset = Observations(str(tmp_path / "observations.csv"), "Etc/GMT+5")
+    dataset.save(observations)
+    loaded = dataset.load()
+    assert loaded["deploymentID"].tolist() == ["dep1", "dep1", "dep2"]
+    assert loaded["classificationProbability"].tolist() == [0.512, 0.512, 0.512]
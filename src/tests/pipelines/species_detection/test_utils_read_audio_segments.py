@@ -0,0 +1,25 @@
+import numpy as np
+from maad import sound
+from scipy.io import wavfile
+
+from pamflow.pipelines.species_detection.utils import read_audio_segments
+
+
+def test_read_audio_segments_matches_full_load(tmp_path):
+    # Stereo 16-bit recording with a DC offset on the left channel
+    sr = 8000
+    rng = np.random.default_rng(0)
+    left = rng.integers(-2000, 2000, sr * 10) + 500
+    right = rng.integers(-2000, 2000, sr * 10)
+    path = str(tmp_path / "recording.WAV")
+    wavfile.write(path, sr, np.stack([left, right], axis=1).astype(np.int16))
+
+    time_ranges = [(0.0, 3.0), (4.5, 7.5), (9.0, 12.0)]
+    fs, audio_segments = read_audio_segments(path, time_ranges)
+
+    full_audio, full_fs = sound.load(path, detrend=False)
+    assert fs == full_fs
+    assert [len(audio) for audio in audio_segments] == [3 * sr, 3 * sr, sr]
+    for (start_time, end_time), audio in zip(time_ranges, audio_segments):
+        expected = full_audio[int(start_time * sr) : int(end_time * sr)]
+        np.testing.assert_allclose(audio, expected - expected.mean())
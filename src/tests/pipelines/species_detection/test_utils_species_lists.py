@@ -0,0 +1,41 @@
+import datetime
+
+import pandas as pd
+from birdnetlib.utils import return_week_48_from_datetime
+
+from pamflow.pipelines.species_detection.utils import (
+    compute_species_lists,
+    get_week_48,
+)
+
+
+def test_get_week_48_matches_birdnetlib():
+    timestamps = pd.Series(
+        ["2024-01-01T00:00:00-0500", "2023-06-15T23:59:00-0500", "2024-12-31T05:00:00-0500", None]
+    )
+    weeks = get_week_48(timestamps)
+    expected = [
+        return_week_48_from_datetime(datetime.date(2024, 1, 1)),
+        return_week_48_from_datetime(datetime.date(2023, 6, 15)),
+        return_week_48_from_datetime(datetime.date(2024, 12, 31)),
+        -1,
+    ]
+    assert weeks.tolist() == expected
+
+
+def test_compute_species_lists_once_per_deployment_and_week():
+    sites = pd.DataFrame(
+        {
+            "deploymentID": ["dep1", "dep1", "dep1", "dep2"],
+            "latitude": [4.6, 4.6, 4.6, float("nan")],
+            "longitude": [-74.1, -74.1, -74.1, float("nan")],
+            "week_48": [10, 10, 30, 10],
+        }
+    )
+    species_lists = compute_species_lists(sites)
+
+    assert set(species_lists) == {("dep1", 10), ("dep1", 30), ("dep2", 10)}
+    # Unknown locations are not filtered
+    assert species_lists[("dep2", 10)] == []
+    assert species_lists[("dep1", 10)]
+    assert all("_" in label for label in species_lists[("dep1", 10)])
@@ -0,0 +1,21 @@
+import numpy as np
+
+from pamflow.pipelines.species_detection.utils import window_band_level
+
+
+def test_window_band_level_only_counts_energy_in_band():
+    t = np.arange(144000) / 48000
+    windows = np.stack(
+        [
+            0.5 * np.sin(2 * np.pi * 1000 * t),  # in band
+            0.5 * np.sin(2 * np.pi * 50 * t),  # below the band
+            np.zeros_like(t),
+        ]
+    ).astype(np.float32)
+
+    levels = window_band_level(windows, [150, 15000], block_size=2)
+
+    # RMS of a sine of amplitude 0.5 is 0.5 / sqrt(2), about -9 dBFS
+    assert np.isclose(levels[0], 20 * np.log10(0.5 / np.sqrt(2)), atol=0.01)
+    assert levels[1] < -100
+    assert levels[2] < -100
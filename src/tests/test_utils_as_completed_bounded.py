@@ -0,0 +1,45 @@
+import threading
+import time
+import concurrent.futures
+
+import pytest
+
+from pamflow.utils import as_completed_bounded
+
+
+def test_as_completed_bounded_limits_pending_tasks():
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def work(value):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.01)
+        with lock:
+            running["now"] -= 1
+        return value * 2
+
+    submitted = []
+
+    def tasks():
+        for i in range(20):
+            submitted.append(i)
+            yield i, (i,)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        results = {}
+        for key, future in as_completed_bounded(executor, work, tasks(), max_in_flight=3):
+            # Tasks are consumed lazily, not submitted up front
+            if not results:
+                assert len(submitted) < 20
+            results[key] = future.result()
+
+    assert results == {i: i * 2 for i in range(20)}
+    assert running["max"] <= 3
+
+
+def test_as_completed_bounded_rejects_invalid_window():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ValueError):
+            list(as_completed_bounded(executor, abs, [(0, (1,))], max_in_flight=0))
@@ -0,0 +1,40 @@
+import sqlite3
+
+from pamflow.utils import FileResultsStore
+
+
+class TextStore(FileResultsStore):
+    identity_columns = {"latitude": "REAL"}
+    payload_columns = {"text": "TEXT"}
+
+
+def test_file_results_store_serves_unchanged_files(tmp_path):
+    path = tmp_path / "a.WAV"
+    path.write_bytes(b"a" * 10)
+    file = {"mediaID": "a.WAV", "filePath": str(path), "latitude": 4.5}
+    store_path = str(tmp_path / "store" / "store.db")
+
+    store = TextStore(store_path, {"n": 1})
+    pending, cached = store.split_files([dict(file)])
+    store.write([(pending[0], ("result",))])
+    assert store.split_files([dict(file)]) == ([], {"a.WAV": ("result",)})
+    assert list(store.payloads()) == [("a.WAV", ("result",))]
+    # Other identity columns or parameters miss the stored result
+    assert store.split_files([{**file, "latitude": 4.6}])[1] == {}
+    store.close()
+    store = TextStore(store_path, {"n": 2})
+    assert store.split_files([dict(file)])[1] == {}
+    store.close()
+
+
+def test_file_results_store_discards_outdated_layouts(tmp_path):
+    store_path = str(tmp_path / "store.db")
+    connection = sqlite3.connect(store_path)
+    connection.execute("CREATE TABLE files (mediaID TEXT PRIMARY KEY, settings TEXT)")
+    connection.execute("INSERT INTO files VALUES ('a.WAV', '{}')")
+    connection.commit()
+    connection.close()
+
+    store = TextStore(store_path, {"n": 1})
+    assert list(store.payloads()) == []
+    store.close()
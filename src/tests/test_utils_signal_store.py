@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+from scipy.io import wavfile
+
+from pamflow.utils import SignalStore, load_audio, resample
+
+RESAMPLER = "pamflow.utils.resample"
+
+
+def test_signal_store_reuses_and_evicts_signals(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"file_{i}.wav")
+        wavfile.write(path, 96000, rng.integers(-1000, 1000, 96000).astype(np.int16))
+        paths.append(path)
+    # A 48 kHz float64 second takes 384 kB, the store holds two
+    store = SignalStore(str(tmp_path / "store"), max_size_gb=800e3 / 1024**3)
+
+    s = store.load(paths[0], 48000, resample, RESAMPLER)
+    expected = resample(*load_audio(paths[0]), 48000)
+    np.testing.assert_array_equal(s, expected)
+    # Stored signals are read without resampling
+    stored = store.load(paths[0], 48000, lambda s, fs, target_fs: 1 / 0, RESAMPLER)
+    assert isinstance(stored, np.memmap)
+    np.testing.assert_array_equal(stored, expected)
+    assert store.get(store.key(paths[0], 48000, RESAMPLER, np.float32)) is None
+    # Signals resampled by another method are stored apart
+    assert store.get(store.key(paths[0], 48000, "maad.sound.resample:scipy_poly")) is None
+
+    # The least recently used signal is deleted
+    store.load(paths[1], 48000, resample, RESAMPLER)
+    os.utime(store._file(store.key(paths[1], 48000, RESAMPLER)), (0, 0))
+    store.load(paths[2], 48000, resample, RESAMPLER)
+    assert store.get(store.key(paths[1], 48000, RESAMPLER)) is None
+    assert store.get(store.key(paths[0], 48000, RESAMPLER)) is not None
+    assert store.get(store.key(paths[2], 48000, RESAMPLER)) is not None